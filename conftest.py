@@ -1,9 +1,12 @@
 """Test helpers."""
+import sys
+
 import pytest
 
 from swak.plugin import DummyOutput
 from swak.datarouter import DataRouter
 from swak.core import DummyAgent
+from swak.config import ASYNCIO_MIN_PYTHON
 
 
 @pytest.fixture()
@@ -25,3 +28,9 @@ def router():
 def agent():
     """Create dummy agent for test."""
     return DummyAgent()
+
+
+# asyncio engine needs newer Python.
+collect_ignore = []
+if sys.version_info < ASYNCIO_MIN_PYTHON:
+    collect_ignore.append('tests/test_aio.py')
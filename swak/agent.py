@@ -1,25 +1,42 @@
 """This module implements service agent."""
 import sys
+import signal
 import logging
 import logging.config
 import threading
 import multiprocessing
 import json
 import time
-
-from queue import Queue
+import itertools
+from collections import OrderedDict
 
 from swak.core import BaseAgent
 from swak.exception import ConfigError
 from swak.stdplugins.stdout.o_stdout import Stdout
-from swak.util import parse_and_validate_cmds
-from swak.plugin import ProxyOutput, ProxyInput, Output, Input
-from swak.config import main_logger_config, validate_cfg
+from swak.util import parse_and_validate_cmds, size_value
+from swak.buffer import MemoryBudget
+from swak.plugin import ProxyOutput, ProxyInput, ProxyQueue, Output, Input
+from swak.config import main_logger_config, validate_cfg, DEFAULT_ENGINE,\
+    DEFAULT_TRANSPORT, get_monitor_address
+from swak.ringqueue import RingQueue, RingNotifier, DEFAULT_RING_SIZE
+from swak.metrics import MetricsRegistry
+from swak.monitor import MonitorServer
+from swak.trace import set_trace
+from swak import trace
+from swak.datarouter import Rule
 from swak.pluginpod import PluginPod
 from swak import __version__
 
 
 INTER_THREAD_QUEUE_SIZE = 1000
+INTER_PROCESS_QUEUE_SIZE = 1000
+# Seconds to wait for a worker process to finish before terminating it.
+WORKER_JOIN_TIMEOUT = 30.0
+# Seconds to wait for match workers to drain inter-process queues.
+WORKER_DRAIN_TIMEOUT = 10.0
+DRAIN_POLL_INTERVAL = 0.05
+# Seconds to wait for a worker process to reply to a command.
+WORKER_REPLY_TIMEOUT = 2.0
 
 
 def init_router(cmd):
@@ -75,6 +92,16 @@ class BaseThread(threading.Thread):
         """
         self.pluginpod.register_plugin(tag, plugin, insert_first)
 
+    def snapshot_stats(self):
+        """Return stats of the router and metrics of the plugins.
+
+        Returns:
+            dict: Stat values.
+        """
+        return dict(type=self.pluginpod.type,
+                    router=self.pluginpod.router.snapshot_stats(),
+                    plugins=self.pluginpod.snapshot_metrics())
+
     def run(self):
         """Thread main."""
         logging.info("starting thread name '{}'.".format(self.name))
@@ -85,12 +112,14 @@ class BaseThread(threading.Thread):
 class InputThread(BaseThread):
     """Input thread class."""
 
-    def init_from_commands(self, tag, cmds):
+    def init_from_commands(self, tag, cmds, queue=None):
         """Init input thread from config commands.
 
         Args:
             tag (str): data tag.
             cmds (list): Seperated plugin commands list.
+            queue (Queue): Inter-proxy queue to send data through, if no
+              output plugin exists. A new ``ProxyQueue`` is created if None.
 
         Returns:
             Queue: If no output plugin exists, create an inter-proxy queue and
@@ -106,7 +135,8 @@ class InputThread(BaseThread):
         if not isinstance(last_plugin, Output):
             # use buffering for inter-thread queue
             self.pluginpod.buffering = True
-            queue = Queue(INTER_THREAD_QUEUE_SIZE)
+            if queue is None:
+                queue = ProxyQueue(INTER_THREAD_QUEUE_SIZE)
             proxy_output = ProxyOutput(queue)
             self.register_plugin(tag, proxy_output)
             return queue
@@ -132,13 +162,185 @@ class OutputThread(BaseThread):
             assert not isinstance(plugin, Input)
         # Makes a ProxyInput and insert as first plugin
         proxy_input = ProxyInput()
+        proxy_input.set_wait_timeout_func(self.pluginpod.time_to_flush)
         self.register_plugin(tag, proxy_input, True)
         self.proxy_input = proxy_input
 
-    def append_proxy_input_queue(self, queue):
+    def append_proxy_input_queue(self, tag, queue):
         """Append inter-proxy queue."""
         assert self.proxy_input is not None, "No ProxyInput created."
-        self.proxy_input.append_recv_queue(queue)
+        self.proxy_input.append_recv_queue(tag, queue)
+
+    def wakeup(self):
+        """Wake up the ProxyInput waiting for data."""
+        self.proxy_input.wake()
+
+
+class EventLoopThread(threading.Thread):
+    """Event loop thread class.
+
+    Runs input threads' jobs as tasks of one asyncio event loop, instead of
+     a thread for each of them. Their inputs must be asynchronous.
+     Asynchronous outputs of other threads write in the loop as well, so the
+     loop runs until released after the other threads are joined.
+    """
+
+    def __init__(self, stop_event):
+        """Init.
+
+        Args:
+            stop_event (threading.Event): Stop event.
+        """
+        super(EventLoopThread, self).__init__(name="LoopTrd")
+        self.stop_event = stop_event
+        self.input_threads = []
+        self.outputs = []
+        # set when jobs of the input threads finished.
+        self.finished = threading.Event()
+        self.release = threading.Event()
+
+    def add_input_thread(self, trd):
+        """Add an input thread to run its job in the event loop.
+
+        Args:
+            trd (InputThread): Initialized input thread. Not started.
+        """
+        assert trd.pluginpod.input.is_async
+        self.input_threads.append(trd)
+
+    def add_output(self, output):
+        """Add an asynchronous output of another thread to write in the loop.
+
+        Args:
+            output (Output): Output with asynchronous ``_write``.
+        """
+        assert output.is_async
+        self.outputs.append(output)
+
+    def run(self):
+        """Thread main."""
+        logging.info("starting event loop with {} inputs.".
+                     format(len(self.input_threads)))
+        from swak.aio import run_event_loop
+        pods = [trd.pluginpod for trd in self.input_threads]
+        run_event_loop(pods, self.stop_event, self.outputs, self.finished,
+                       self.release if self.outputs else None)
+        logging.info("finished event loop.")
+
+
+class WorkerProcess(multiprocessing.Process):
+    """Worker process class.
+
+    Runs an input or output thread's job in a child process, so that the
+     pipelines are not bound to a core by the GIL. Plugins are created in the
+     child process from the command, so that only the command, the stop event
+     and queues are passed to it.
+
+    The supervisor takes snapshots of the stats and switches tracing of the
+     process by commands through a pipe, which a daemon thread answers.
+    """
+
+    def __init__(self, for_input, tag, cmd, stop_event, queues,
+                 logger_cfg=None, shard=None, conn=None):
+        """Init.
+
+        Args:
+            for_input (bool): Whether to run an input or output thread.
+            tag (str): data tag.
+            cmd (str): A string command to construct the thread.
+            stop_event (multiprocessing.Event): Stop event.
+            queues (list): (tag, Queue) tuples of inter-process queues. An
+              input sends data through the first one, if it has no output
+              plugin. An output receives data from all of them.
+            logger_cfg (dict): Logger config to apply in the child process.
+            shard (int): Shard index of an output worker.
+            conn (multiprocessing.Connection): Child end of the command pipe.
+        """
+        kind = 'InProc' if for_input else 'OutProc'
+        name = "{}-{}".format(kind, tag)
+        if shard is not None:
+            name = "{}-{}".format(name, shard)
+        super(WorkerProcess, self).__init__(name=name)
+        self.for_input = for_input
+        self.tag = tag
+        self.cmd = cmd
+        self.stop_event = stop_event
+        self.queues = queues
+        self.logger_cfg = logger_cfg
+        self.memory_budget = None
+        self.trace = trace.TRACE
+        self.conn = conn
+
+    def create_thread(self):
+        """Create the thread object to run in this process.
+
+        Returns:
+            BaseThread: Input or output thread. Not started.
+        """
+        if self.for_input:
+            trd = InputThread(self.stop_event)
+            cmds = parse_and_validate_cmds(self.cmd, True)
+            queue = self.queues[0][1] if len(self.queues) > 0 else None
+            trd.init_from_commands(self.tag, cmds, queue)
+        else:
+            trd = OutputThread(self.stop_event)
+            cmds = parse_and_validate_cmds(self.cmd, False)
+            trd.init_from_commands(self.tag, cmds)
+            for tag, queue in self.queues:
+                trd.append_proxy_input_queue(tag, queue)
+
+        if self.memory_budget is not None:
+            budget = MemoryBudget(self.memory_budget)
+            for output in trd.pluginpod.iter_outputs():
+                if output.buffer is not None:
+                    output.buffer.set_memory_budget(budget)
+        return trd
+
+    def run(self):
+        """Process main."""
+        # Supervisor stops workers by the stop event, not by a signal.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if self.logger_cfg is not None:
+            logging.config.dictConfig(self.logger_cfg)
+        set_trace(self.trace)
+        trd = self.create_thread()
+        if self.conn is not None:
+            cmd_trd = threading.Thread(target=self.serve_commands,
+                                       args=(trd,), name="CmdTrd")
+            cmd_trd.daemon = True
+            cmd_trd.start()
+        # Run the thread's job in the main thread of this process.
+        trd.run()
+
+    def serve_commands(self, trd):
+        """Answer commands of the supervisor until the pipe is closed.
+
+        A command is a (seq, name, arg) tuple, and answered with a (seq,
+         result) tuple:
+        - snapshot: Stats of the thread, with tracing state.
+        - trace: Turn tracing on or off by arg, and return tracing state.
+
+        Args:
+            trd (BaseThread): The thread run by this process.
+        """
+        while True:
+            try:
+                seq, name, arg = self.conn.recv()
+            except (EOFError, IOError, OSError):
+                break
+            if name == 'snapshot':
+                result = trd.snapshot_stats()
+                result['trace'] = trace.TRACE
+            elif name == 'trace':
+                set_trace(arg)
+                result = trace.TRACE
+            else:
+                logging.error("unknown worker command '{}'".format(name))
+                result = None
+            try:
+                self.conn.send((seq, result))
+            except (IOError, OSError):
+                break
 
 
 class ServiceAgent(BaseAgent):
@@ -151,6 +353,21 @@ class ServiceAgent(BaseAgent):
         self.input_threads = []
         self.output_threads = []
         self.stop_event = None
+        self.memory_budget = None
+        self.engine = DEFAULT_ENGINE
+        self.source_workers = []
+        self.match_workers = []
+        self.proxy_queues = []
+        self.ring_notifier = None
+        # Parent ends of command pipes by worker process.
+        self.worker_conns = {}
+        self.worker_lock = threading.Lock()
+        self.worker_seq = itertools.count()
+        self.source_stop_event = None
+        self.match_stop_event = None
+        self.loop_thread = None
+        self.metrics = MetricsRegistry()
+        self.monitor = None
 
     def init_from_cfg(self, cfg, dryrun):
         """Init agent from config.
@@ -178,7 +395,11 @@ class ServiceAgent(BaseAgent):
             logging.critical("init service agent for '{}'".format(self.name))
             logging.info("effective config: \n{}".
                          format(json.dumps(cfg, indent=1)))
+            if 'trace' in cfg:
+                set_trace(cfg['trace'])
             self.init_threads(cfg, dryrun)
+            if not dryrun:
+                self.init_monitor(cfg)
             # More init code here..
         except ConfigError as e:
             logging.error(e)
@@ -218,13 +439,18 @@ class ServiceAgent(BaseAgent):
             trd = InputThread(stop_event)
             cmds = parse_and_validate_cmds(cmd, True)
             last_cmd = cmds[-1]
+            queue = None
             if last_cmd[0] == 'tag':
                 tag = ' '.join(last_cmd[1:])
+                # Threads for process engine are only for validation.
+                if engine != 'process':
+                    queue = self.create_proxy_queue(cfg, False)
             else:
                 tag = '_notag_'
 
-            queue = trd.init_from_commands(tag, cmds)
+            queue = trd.init_from_commands(tag, cmds, queue)
             self.input_threads.append(trd)
+            self.metrics.register(trd.name, trd.snapshot_stats)
             return tag, queue
 
         def create_output_thread(tag, cmd, stop_event):
@@ -240,7 +466,9 @@ class ServiceAgent(BaseAgent):
             cmds = parse_and_validate_cmds(cmd, False)
             trd.init_from_commands(tag, cmds)
             self.output_threads.append(trd)
+            self.metrics.register(trd.name, trd.snapshot_stats)
 
+        engine = cfg.get('engine', DEFAULT_ENGINE)
         self.stop_event = threading.Event()
 
         # Create output threads first.
@@ -256,6 +484,242 @@ class ServiceAgent(BaseAgent):
                 tag, queue = proxy_info
                 self.link_output_thread_with_proxy(tag, queue)
 
+        if 'memory_budget' in cfg:
+            budget = size_value(str(cfg['memory_budget']))
+            self.set_memory_budget(MemoryBudget(budget))
+
+        if engine == 'process':
+            self.init_workers(cfg)
+        elif engine == 'asyncio':
+            self.init_event_loop()
+
+    def init_monitor(self, cfg):
+        """Init monitor server from config, if configured.
+
+        Args:
+            cfg (dict): dict from parsing config text.
+        """
+        address = get_monitor_address(cfg)
+        if address is not None:
+            self.monitor = MonitorServer(self.snapshot_stats,
+                                         trace_fn=self.switch_trace,
+                                         **address)
+
+    def snapshot_stats(self):
+        """Return stats of the agent for monitoring.
+
+        Returns:
+            dict: Stats of threads by name, with router stats and plugin
+              metrics, and of worker processes and inter-proxy queues.
+        """
+        snap = self.metrics.snapshot()
+        alive = dict((trd.name, trd.is_alive()) for trd in
+                     self.input_threads + self.output_threads)
+        if self.loop_thread is not None:
+            # Jobs of these threads are run by the event loop thread.
+            for trd in self.loop_thread.input_threads:
+                alive[trd.name] = self.loop_thread.is_alive()
+        threads = snap['metrics']
+        for name, stats in threads.items():
+            stats['alive'] = alive.get(name)
+        workers = OrderedDict()
+        for worker in self.workers:
+            stats = dict(pid=worker.pid, alive=worker.is_alive(),
+                         exitcode=worker.exitcode)
+            # router and plugin stats, as of threads.
+            stats.update(self.request_worker(worker, 'snapshot') or {})
+            workers[worker.name] = stats
+        queues = []
+        for queue in self.proxy_queues:
+            try:
+                queues.append(queue.qsize())
+            except NotImplementedError:
+                queues.append(None)
+        return dict(name=self.name, engine=self.engine, time=snap['time'],
+                    trace=trace.TRACE, threads=threads, workers=workers,
+                    queues=queues)
+
+    def switch_trace(self, enable):
+        """Turn tracing of the agent and its worker processes on or off.
+
+        Args:
+            enable (bool): Whether to trace or not.
+        """
+        set_trace(enable)
+        for worker in self.workers:
+            self.request_worker(worker, 'trace', enable)
+
+    def request_worker(self, worker, name, arg=None):
+        """Send a command to a worker process and return its result.
+
+        Args:
+            worker (WorkerProcess): A worker process.
+            name (str): Command name.
+            arg: Argument of the command.
+
+        Returns:
+            Result of the command, or None if the worker is not running or
+              did not answer in time.
+        """
+        conn = self.worker_conns.get(worker)
+        if conn is None:
+            return None
+        with self.worker_lock:
+            if not worker.is_alive():
+                return None
+            seq = next(self.worker_seq)
+            deadline = time.time() + WORKER_REPLY_TIMEOUT
+            try:
+                conn.send((seq, name, arg))
+                while True:
+                    remain = deadline - time.time()
+                    if remain <= 0 or not conn.poll(remain):
+                        logging.warning("worker '{}' did not answer '{}' in "
+                                        "time.".format(worker.name, name))
+                        return None
+                    rseq, result = conn.recv()
+                    # skip a late answer to a timed out command.
+                    if rseq == seq:
+                        return result
+            except (EOFError, IOError, OSError):
+                return None
+
+    def init_event_loop(self):
+        """Move input threads with asynchronous input into an event loop.
+
+        Input threads of synchronous input are left as is.
+        """
+        self.engine = 'asyncio'
+        self.loop_thread = EventLoopThread(self.stop_event)
+        for itrd in list(self.input_threads):
+            if itrd.pluginpod.input.is_async:
+                self.loop_thread.add_input_thread(itrd)
+                self.input_threads.remove(itrd)
+            else:
+                logging.warning("'{}' has no asynchronous input, run it in "
+                                "a thread.".format(itrd.name))
+        for trd in self.input_threads + self.output_threads:
+            for output in trd.pluginpod.iter_outputs():
+                if output.is_async:
+                    self.loop_thread.add_output(output)
+        logging.info("{} input threads are run in event loop.".
+                     format(len(self.loop_thread.input_threads)))
+
+    def init_workers(self, cfg):
+        """Init worker processes for service agent from config.
+
+        Threads created from the config are used only to validate it, and are
+         replaced by worker processes which create their own plugins:
+        - Source worker: Runs a source. If the source ends with a tag command,
+            its data are sent to match workers via an inter-process queue.
+        - Match worker: Runs a match. ``match_shards`` workers are created for
+            each match, and they share the queues of matching sources, so that
+            data are spread over them.
+
+        Args:
+            cfg (dict): dict from parsing config text.
+        """
+        self.engine = 'process'
+        self.input_threads = []
+        self.output_threads = []
+        # Plugins of workers are out of reach, drop metrics of the threads.
+        self.metrics = MetricsRegistry()
+        self.source_stop_event = multiprocessing.Event()
+        self.match_stop_event = multiprocessing.Event()
+        lcfg = cfg.get('logger')
+
+        tag_queues = []
+        for strcmd in cfg['sources']:
+            cmds = parse_and_validate_cmds(strcmd, True)
+            last_cmd = cmds[-1]
+            queues = []
+            if last_cmd[0] == 'tag':
+                tag = ' '.join(last_cmd[1:])
+                queues.append((tag, self.create_proxy_queue(cfg, True)))
+                tag_queues += queues
+            else:
+                tag = '_notag_'
+            logging.info("create source worker with cmd '{}'".format(strcmd))
+            worker = self.create_worker(True, tag, strcmd,
+                                        self.source_stop_event, queues, lcfg)
+            self.source_workers.append(worker)
+
+        shards = cfg.get('match_shards', 1)
+        for mtag, strcmd in (cfg.get('matches') or {}).items():
+            rule = Rule(mtag, None)
+            queues = [(tag, queue) for tag, queue in tag_queues
+                      if rule.match(tag)]
+            logging.info("create {} match workers with cmd '{}'".
+                         format(shards, strcmd))
+            for shard in range(shards):
+                worker = self.create_worker(False, mtag, strcmd,
+                                            self.match_stop_event, queues,
+                                            lcfg, shard)
+                self.match_workers.append(worker)
+
+        if 'memory_budget' in cfg:
+            # Buffers in different processes can't share a budget, split it.
+            budget = size_value(str(cfg['memory_budget']))
+            for worker in self.workers:
+                worker.memory_budget = budget // len(self.workers)
+
+    def create_worker(self, *args):
+        """Create a worker process with a command pipe.
+
+        Args:
+            args: Arguments of ``WorkerProcess`` but the pipe.
+
+        Returns:
+            WorkerProcess: Worker process. Not started.
+        """
+        conn, child_conn = multiprocessing.Pipe()
+        worker = WorkerProcess(*args, conn=child_conn)
+        self.worker_conns[worker] = conn
+        return worker
+
+    def create_proxy_queue(self, cfg, for_process):
+        """Create an inter-proxy queue by the transport config.
+
+        Args:
+            cfg (dict): dict from parsing config text.
+            for_process (bool): Whether the queue links processes.
+
+        Returns:
+            Queue: A ``RingQueue`` for ``ring`` transport. For ``queue``
+              transport, a ``multiprocessing.Queue`` to link processes, or
+              None to let the input thread create a ``ProxyQueue``.
+        """
+        if cfg.get('transport', DEFAULT_TRANSPORT) == 'ring':
+            size = size_value(str(cfg.get('ring_size', DEFAULT_RING_SIZE)))
+            if self.ring_notifier is None:
+                self.ring_notifier = RingNotifier()
+            # Rings share a notifier, so that a match can wait for all.
+            queue = RingQueue(size, self.ring_notifier)
+        elif for_process:
+            queue = multiprocessing.Queue(INTER_PROCESS_QUEUE_SIZE)
+        else:
+            return None
+        self.proxy_queues.append(queue)
+        return queue
+
+    @property
+    def workers(self):
+        """Return all worker processes."""
+        return self.source_workers + self.match_workers
+
+    def set_memory_budget(self, budget):
+        """Share a memory budget among buffers of all outputs.
+
+        Args:
+            budget (MemoryBudget): Memory budget.
+        """
+        logging.info("set memory budget {}".format(budget.max_size))
+        self.memory_budget = budget
+        for trd in self.input_threads + self.output_threads:
+            for output in trd.pluginpod.iter_outputs():
+                if output.buffer is not None:
+                    output.buffer.set_memory_budget(budget)
+
     def link_output_thread_with_proxy(self, tag, queue):
         """Link input and output thread."""
         for otrd in self.output_threads:
@@ -272,13 +736,23 @@ class ServiceAgent(BaseAgent):
     def start(self):
         """Start service."""
         logging.critical("starting service agent '{}'".format(self.name))
-        assert len(self.input_threads) + len(self.output_threads) > 0, \
+        assert len(self.input_threads) + len(self.output_threads) +\
+            len(self.workers) > 0 or self.loop_thread is not None, \
             "There are no threads to start."
         # Start output threads first.
         for otrd in self.output_threads:
             otrd.start()
         for itrd in self.input_threads:
             itrd.start()
+        if self.loop_thread is not None:
+            self.loop_thread.start()
+        # Same for workers.
+        for worker in self.match_workers:
+            worker.start()
+        for worker in self.source_workers:
+            worker.start()
+        if self.monitor is not None:
+            self.monitor.start()
 
     def stop(self):
         """Stop service."""
@@ -286,6 +760,13 @@ class ServiceAgent(BaseAgent):
         logging.critical("stopping service agent '{}'".format(self.name))
         logging.info("--{}--".format(self.stop_event))
         self.stop_event.set()
+        # Output threads may be waiting for data.
+        for otrd in self.output_threads:
+            otrd.wakeup()
+        # Stop source workers only. Match workers are stopped at shutdown,
+        #  after receiving the rest of data.
+        if self.source_stop_event is not None:
+            self.source_stop_event.set()
 
     def shutdown(self):
         """Waiting for all threads to shut down."""
@@ -293,12 +774,62 @@ class ServiceAgent(BaseAgent):
             otrd.join()
         for itrd in self.input_threads:
             itrd.join()
+        if self.loop_thread is not None:
+            # no more writes from other threads.
+            self.loop_thread.release.set()
+            self.loop_thread.join()
+        if self.engine == 'process':
+            self.shutdown_workers()
+        if self.monitor is not None:
+            self.monitor.shutdown()
+        for queue in self.proxy_queues:
+            queue.close()
 
         # Other shutdown processes goes here.
 
         logging.critical("service agent has been successfully shut down for "
                          "'{}'".format(self.name))
 
+    def shutdown_workers(self):
+        """Shut down worker processes in order.
+
+        Source workers are joined first. Then match workers are stopped when
+         they have drained inter-process queues, so that no data in transit is
+         lost.
+        """
+        self.join_workers(self.source_workers)
+        deadline = time.time() + WORKER_DRAIN_TIMEOUT
+        while time.time() < deadline:
+            if not any(worker.is_alive() for worker in self.match_workers):
+                break
+            if all(queue.empty() for queue in self.proxy_queues):
+                break
+            time.sleep(DRAIN_POLL_INTERVAL)
+        self.match_stop_event.set()
+        if self.ring_notifier is not None:
+            # wake up match workers waiting for data.
+            self.ring_notifier.notify()
+        self.join_workers(self.match_workers)
+        with self.worker_lock:
+            for conn in self.worker_conns.values():
+                conn.close()
+            self.worker_conns = {}
+
+    def join_workers(self, workers):
+        """Join worker processes, terminate ones not finished in time.
+
+        Args:
+            workers (list): Worker processes.
+        """
+        for worker in workers:
+            worker.join(WORKER_JOIN_TIMEOUT)
+            if worker.is_alive():
+                logging.warning("worker '{}' did not finish in time, "
+                                "terminate it.".format(worker.name))
+                worker.terminate()
+                worker.join()
+
+
 if __name__ == '__main__':
     import yaml
     cfgs = '''
@@ -0,0 +1,283 @@
+"""This module implements coroutines for the asyncio engine.
+
+Asynchronous syntax and all uses of asyncio are kept in this module, which
+ needs Python 3.7 or later, so that other modules can be imported by Python
+ versions without it. Other modules import this lazily, and plugins reach
+ these through their methods, such as ``Input.aread``.
+"""
+
+import time
+import asyncio
+import logging
+
+from swak.util import is_signalled
+from swak.data import MultiDataStream
+
+
+async def agenerate_stream(ainput, agen_data, stop_event):
+    """Generate data stream from asynchronous data generator.
+
+    Same as ``Input.generate_stream``, but the data generator is iterated by
+     a task which fills the batch, so nothing is awaited per data. The stream
+     waits for the batch only until it is full or the latency or flush
+     deadline passes. The stop event is checked whenever the stream wakes
+     up, at least every ``wait_timeout`` of the input.
+
+    Note: Yield (None, None) tuple when no batch is ready in time, to give
+     agent a chance to flush.
+
+    Args:
+        ainput (Input): Input plugin.
+        agen_data (function): Asynchronous data generator function.
+        stop_event (threading.Event): Stop event
+
+    Yields:
+        tuple: (tag, DataStream)
+    """
+    logging.debug("agenerate_stream agen_data {}".format(agen_data))
+    max_record = ainput.batch_max_record
+    max_size = ainput.batch_max_size
+    max_latency = ainput.batch_max_latency
+    data_size = ainput.data_size
+
+    agen = agen_data(stop_event)
+    # stream, size and deadline of the batch being filled.
+    batch = [MultiDataStream(), 0, None]
+    # set when the batch got its deadline or is full.
+    ready = asyncio.Event()
+    # set when the full batch was taken.
+    room = asyncio.Event()
+
+    async def fill():
+        try:
+            async for utime, data in agen:
+                if len(data) == 0:
+                    continue
+                batch[0].append(utime, data)
+                if batch[2] is None and max_latency is not None:
+                    batch[2] = time.time() + max_latency
+                    ready.set()
+                if max_size is not None:
+                    batch[1] += data_size(data)
+                if (max_record is not None and
+                        len(batch[0]) >= max_record) or\
+                        (max_size is not None and batch[1] >= max_size):
+                    batch[2] = 0
+                    ready.set()
+                    room.clear()
+                    await room.wait()
+        finally:
+            # wake up the stream when the generator is finished.
+            ready.set()
+
+    filler = asyncio.ensure_future(fill())
+    try:
+        while not is_signalled(stop_event):
+            ready.clear()
+            timeout = ainput.wait_timeout()
+            if batch[2] is not None:
+                timeout = min(timeout, max(batch[2] - time.time(), 0.0))
+            timed_out = True
+            if filler.done():
+                pass
+            elif timeout > 0:
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout)
+                    timed_out = False
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(0)
+            deadline = batch[2]
+            if deadline is not None and time.time() >= deadline:
+                ds, size = batch[0], batch[1]
+                batch[:] = [MultiDataStream(), 0, None]
+                room.set()
+                ainput.metrics.count(0, len(ds), 0, size)
+                yield ainput.tag, ds
+            elif filler.done():
+                break
+            elif timed_out:
+                yield None, None
+    finally:
+        if not filler.done():
+            filler.cancel()
+            await asyncio.wait((filler,))
+        await agen.aclose()
+    if not filler.cancelled():
+        # raise the error of the generator, if any.
+        filler.result()
+
+    # yield remain data
+    ds = batch[0]
+    if not ds.empty():
+        ainput.metrics.count(0, len(ds), 0, batch[1])
+        yield ainput.tag, ds
+
+
+async def agenerate_records(ainput, stop_event):
+    """Generate data from asynchronous record generator of RecordInput.
+
+    Args:
+        ainput (RecordInput): Input plugin.
+        stop_event (threading.Event): Stop event
+
+    Yields:
+        tuple: time, data
+    """
+    async for record in ainput.agenerate_record():
+        if is_signalled(stop_event):
+            return
+        yield time.time(), record
+
+
+async def agenerate_lines(ainput, stop_event):
+    """Generate data from asynchronous line generator of TextInput.
+
+    Args:
+        ainput (TextInput): Input plugin.
+        stop_event (threading.Event): Stop event
+
+    Yields:
+        tuple: time, data
+    """
+    async for line in ainput.agenerate_line():
+        if is_signalled(stop_event):
+            return
+        data = ainput.process_line(line)
+        if data is not None:
+            yield time.time(), data
+
+
+async def paced(items, delay):
+    """Yield items, sleeping in the event loop between them.
+
+    Args:
+        items: Iterable of items.
+        delay (float): Seconds to sleep after each item.
+
+    Yields:
+        An item.
+    """
+    for item in items:
+        yield item
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def run_write(output, args):
+    """Run asynchronous ``_write`` of an output until it is done.
+
+    The write is run in the event loop of the engine, or in a new one if no
+     loop is set. So errors of the write are raised to the caller, such as
+     the buffer which retries the chunk.
+
+    Args:
+        output (Output): Output plugin.
+        args (tuple): Arguments of ``_write``.
+
+    Raises:
+        RuntimeError: If called in the thread of the event loop, which
+          would block the loop.
+    """
+    coro = output._write(*args)
+    loop = output.loop
+    if loop is None:
+        asyncio.run(coro)
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("asynchronous write can not block its event loop")
+    asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def aprocess(pod, stop_event):
+    """Read from asynchronous input and emit through router for service.
+
+    Emitting and flushing are run in an executor thread, so that a blocking
+     put to a full queue or a synchronous flush does not stall other sources
+     in the loop. Writes of asynchronous outputs are awaited in the loop, and
+     their errors reach the buffer as in other engines.
+
+    Args:
+        pod (PluginPod): Plugin pod to run.
+        stop_event (threading.Event): Stop event
+    """
+    loop = asyncio.get_running_loop()
+    pod.start()
+    logging.info("start processing {} in event loop".format(pod.name))
+    pod.input.set_wait_timeout_func(pod.time_to_flush)
+
+    async def call(func, *args):
+        return await loop.run_in_executor(None, func, *args)
+
+    def emit(tag, ds):
+        # Tag is None when no batch was ready in time.
+        if not(tag is None or ds.empty()):
+            pod.router.emit_stream(tag, ds, stop_event)
+        pod.may_flushing()
+
+    try:
+        async for tag, ds in pod.input.aread(stop_event):
+            await call(emit, tag, ds)
+        logging.info("stop event received")
+    finally:
+        await call(pod.stop)
+        await call(pod.shutdown)
+
+
+async def run_pods(pods, stop_event):
+    """Run plugin pods in the event loop until all of them finish.
+
+    Args:
+        pods (list): Plugin pods with asynchronous input.
+        stop_event (threading.Event): Stop event
+    """
+    loop = asyncio.get_running_loop()
+    for pod in pods:
+        for output in pod.iter_outputs():
+            output.set_loop(loop)
+    jobs = [pod.aprocess(stop_event) for pod in pods]
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    for pod, result in zip(pods, results):
+        if isinstance(result, Exception):
+            logging.error("'{}' failed in event loop: {}".
+                          format(pod.name, result))
+
+
+def run_event_loop(pods, stop_event, outputs=(), finished=None,
+                   release=None):
+    """Run plugin pods in a new event loop of this thread.
+
+    Asynchronous outputs of other threads write in the loop too, so that
+     they share the loop, and its clients, with the pods. The loop is kept
+     for them after the pods finish, until released.
+
+    Args:
+        pods (list): Plugin pods with asynchronous input.
+        stop_event (threading.Event): Stop event
+        outputs (list): Asynchronous outputs run by other threads.
+        finished (threading.Event): Set when the pods finished.
+        release (threading.Event): Event set when the outputs do not write
+          any more. The loop is closed when the pods finished if None.
+    """
+    async def main():
+        loop = asyncio.get_running_loop()
+        for output in outputs:
+            output.set_loop(loop)
+        try:
+            await run_pods(pods, stop_event)
+            if finished is not None:
+                finished.set()
+            if release is not None:
+                await loop.run_in_executor(None, release.wait)
+        finally:
+            # later writes, if any, run in their own loops.
+            for output in outputs:
+                output.set_loop(None)
+
+    asyncio.run(main())
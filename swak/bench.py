@@ -0,0 +1,195 @@
+"""This module implements end-to-end benchmark of service agent."""
+
+import os
+import sys
+import time
+
+import yaml
+try:
+    import resource
+except ImportError:
+    # not available on Windows.
+    resource = None
+
+from swak.agent import ServiceAgent
+from swak.exception import ConfigError
+from swak.metrics import Histogram
+from swak.plugin import Output
+from swak.util import init_home, update_dict
+
+DEFAULT_BENCH_NUMBER = 100000
+DEFAULT_BENCH_FIELD = 5
+# Seconds to wait for sources to finish.
+DEFAULT_BENCH_TIMEOUT = 600
+FINISH_POLL_INTERVAL = 0.05
+
+BENCH_CFG = '''
+sources:
+    - i.counter -n {number} -f {field} | tag bench
+
+matches:
+    bench: o.null
+'''
+
+# Keep standard output for the result.
+BENCH_LOG_CFG = '''
+logger:
+    handlers:
+        console:
+            stream: ext://sys.stderr
+    root:
+        level: WARNING
+'''
+
+
+def default_bench_cfg(number=DEFAULT_BENCH_NUMBER, field=DEFAULT_BENCH_FIELD):
+    """Return config of the default topology, from a counter to a null.
+
+    Args:
+        number (int): Number of records to generate.
+        field (int): Number of fields of a record.
+
+    Returns:
+        dict: Service config.
+    """
+    return yaml.load(BENCH_CFG.format(number=number, field=field))
+
+
+def load_bench_cfg(path):
+    """Load a service config file for benchmark.
+
+    Environment variables in the config are resolved as in the service.
+
+    Args:
+        path (str): Config file path.
+
+    Returns:
+        dict: Service config.
+    """
+    with open(path, 'r') as f:
+        raw = f.read()
+    return yaml.load(raw.format(**os.environ))
+
+
+def peak_rss():
+    """Return peak resident set size of this process in bytes.
+
+    Returns:
+        int: Peak RSS, or None if unknown.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports in kilobytes, macOS in bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def cpu_time():
+    """Return user and system CPU seconds of this process.
+
+    ``time.process_time`` is not in Python 2. ``resource`` is used for its
+     finer resolution, or ``os.times`` where it is not available.
+    """
+    if resource is None:
+        times = os.times()
+        return times[0] + times[1]
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def wait_sources(agent, timeout):
+    """Wait for sources of a started agent to finish and pass on their data.
+
+    Output threads stop with input threads by the same event, leaving data in
+     their queues. So the agent should be stopped after the queues are
+     drained, to count all data.
+
+    Args:
+        agent (ServiceAgent): Started service agent.
+        timeout (float): Maximum seconds to wait.
+
+    Returns:
+        bool: True if all sources finished and queues were drained in time.
+    """
+    threads = list(agent.input_threads)
+    loop_thread = agent.loop_thread
+    queues = [queue for otrd in agent.output_threads
+              for queue in otrd.proxy_input.recv_queues.values()]
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not any(trd.is_alive() for trd in threads) and\
+                (loop_thread is None or loop_thread.finished.is_set() or
+                 not loop_thread.is_alive()) and\
+                all(queue.empty() for queue in queues):
+            return True
+        time.sleep(FINISH_POLL_INTERVAL)
+    return False
+
+
+def iter_agent_outputs(agent):
+    """Iterate output plugins of all threads of an agent.
+
+    Default outputs of threads and proxies are not included.
+    """
+    threads = agent.input_threads + agent.output_threads
+    if agent.loop_thread is not None:
+        threads += agent.loop_thread.input_threads
+    for trd in threads:
+        for plugin in trd.plugins:
+            if isinstance(plugin, Output):
+                yield plugin
+
+
+def run_bench(cfg, timeout=DEFAULT_BENCH_TIMEOUT):
+    """Run a service agent until its sources finish, and measure it.
+
+    Records and bytes are counted at outputs. End-to-end latency is measured
+     by ``o.null`` outputs, from the time of each data to its arrival.
+
+    Args:
+        cfg (dict): Service config.
+        timeout (float): Maximum seconds to wait for sources to finish. The
+          agent is stopped after that.
+
+    Raises:
+        ConfigError: If the config is not valid for benchmark.
+
+    Returns:
+        dict: Benchmark result, or None if the agent could not be initialized.
+    """
+    engine = cfg.get('engine')
+    if engine == 'process':
+        raise ConfigError("Benchmark does not support 'process' engine, as "
+                          "plugins in worker processes can not be measured.")
+    cfg = update_dict(yaml.load(BENCH_LOG_CFG), cfg)
+    init_home(os.environ['SWAK_HOME'], cfg)
+    agent = ServiceAgent()
+    if not agent.init_from_cfg(cfg, False):
+        return None
+
+    cpu_start = cpu_time()
+    start = time.time()
+    agent.start()
+    finished = wait_sources(agent, timeout)
+    agent.stop()
+    agent.shutdown()
+    elapsed = time.time() - start
+    cpu_used = cpu_time() - cpu_start
+
+    records = nbytes = 0
+    latency = Histogram()
+    for output in iter_agent_outputs(agent):
+        records += output.metrics.records_in
+        nbytes += output.metrics.bytes_out
+        # Plugin modules are loaded by path, check by attribute not class.
+        e2e_latency = getattr(output, 'e2e_latency', None)
+        if e2e_latency is not None:
+            latency.merge(e2e_latency)
+
+    return dict(engine=agent.engine, finished=finished, elapsed=elapsed,
+                records=records, bytes=nbytes,
+                records_per_sec=records / elapsed,
+                bytes_per_sec=nbytes / elapsed,
+                latency_p50=latency.quantile(0.5),
+                latency_p99=latency.quantile(0.99),
+                cpu_time=cpu_used, peak_rss=peak_rss())
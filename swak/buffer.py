@@ -1,12 +1,124 @@
 """This module implements buffers."""
 
+import os
+import re
+import glob
+import json
+import mmap
+import time
+import struct
+import random
+import threading
+import itertools
+from functools import partial
 from collections import deque
 import logging
 
+from six import string_types
+from six.moves.queue import Queue, Full
+
+from swak.config import get_exe_dir
+from swak.util import time_value, size_value, make_dirs
+from swak.metrics import Histogram
+from swak.exception import ConfigError
+from swak import trace
+
+
+DEFAULT_CHUNK_MAX_RECORD = 1000
+DEFAULT_CHUNK_MAX_SIZE = '4m'
+DEFAULT_BUFFER_MAX_CHUNK = 4
+DEFAULT_FLUSH_WORKERS = 0
+DEFAULT_FLUSH_QUEUE_SIZE = 4
+DEFAULT_DRAIN_TIMEOUT = '10s'
+DEFAULT_RETRY_MAX = 8
+DEFAULT_RETRY_WAIT = '1s'
+DEFAULT_RETRY_MAX_WAIT = '1m'
+DEFAULT_BUFFER_MAX_SIZE = '512m'
+OVERFLOW_ACTIONS = ['block', 'drop_oldest', 'spill']
+DEFAULT_OVERFLOW_ACTION = 'block'
+CHUNK_EXT = '.chunk'
+KEY_EXT = '.key'
+MAX_BLOCK_WAIT = 0.5
+# Seconds to block for room before exceeding the limit.
+DEFAULT_BLOCK_TIMEOUT = 10
+
+FRAME_HEADER = struct.Struct('<I')
+
+
+def get_buffer_dir(tag, suffix=''):
+    """Get default directory for chunk files of a tag.
+
+    Args:
+        tag (str): Tag of the buffer.
+        suffix (str): Suffix for the directory name.
+
+    Returns:
+        str: ``SWAK_HOME/buffer/TAG``
+    """
+    home = os.environ.get('SWAK_HOME', get_exe_dir())
+    name = 'default' if tag is None else re.sub(r'[^\w.-]', '_', tag)
+    return os.path.join(home, 'buffer', name + suffix)
+
+
+class MemoryBudget(object):
+    """Memory budget shared by buffers.
+
+    Buffers reserve memory for their data from the budget, so that total
+     memory of buffers is bounded.
+    """
+
+    def __init__(self, max_size):
+        """Init.
+
+        Args:
+            max_size (int): Maximum bytes of the budget.
+        """
+        self.max_size = max_size
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def reserve(self, size):
+        """Reserve memory if available.
+
+        Args:
+            size (int): Bytes to reserve.
+
+        Returns:
+            bool: True if reserved, False otherwise.
+        """
+        with self.cond:
+            if self.used + size > self.max_size:
+                return False
+            self.used += size
+            return True
+
+    def force_reserve(self, size):
+        """Reserve memory even if exceeds the budget."""
+        with self.cond:
+            self.used += size
+
+    def release(self, size):
+        """Release reserved memory.
+
+        Args:
+            size (int): Bytes to release.
+        """
+        with self.cond:
+            self.used -= size
+            self.cond.notify_all()
+
+    def wait(self, timeout):
+        """Wait until memory is released or timeout."""
+        with self.cond:
+            self.cond.wait(timeout)
+
 
 class Chunk(object):
     """Chunk class."""
 
+    # Whether data is stored in memory or not.
+    memory = False
+
     def __init__(self, binary):
         """Init.
 
@@ -14,6 +126,14 @@ class Chunk(object):
             binary(bool): Whether store data as binary or not.
         """
         self.binary = binary
+        # Chunks of the same key are flushed in order by the same worker,
+        #  unkeyed chunks by workers in turn.
+        self.key = None
+        # Number of failed flushing and time for the next retry.
+        self.retry = 0
+        self.next_retry = None
+        # Whether the chunk size is counted in the buffer's budget.
+        self.budgeted = True
         self.reset()
 
     def reset(self):
@@ -27,7 +147,8 @@ class Chunk(object):
 
     def flush(self, output):
         """Flushing chunk into output."""
-        logging.debug("Chunk.flush")
+        if trace.TRACE:
+            logging.debug("Chunk.flush")
         self._flush(output)
         self.reset()
 
@@ -39,10 +160,23 @@ class Chunk(object):
         """Whether chunk empty or not."""
         return self.num_record == 0
 
+    def close(self):
+        """Close chunk for more data.
+
+        Called when the chunk is no more active.
+        """
+        pass
+
+    def discard(self):
+        """Discard chunk without flushing."""
+        pass
+
 
 class MemoryChunk(Chunk):
     """Memory chunk class."""
 
+    memory = True
+
     def __init__(self, binary):
         """Init."""
         super(MemoryChunk, self).__init__(binary)
@@ -55,7 +189,8 @@ class MemoryChunk(Chunk):
 
     def concat(self, data, adding_size):
         """Concat new data."""
-        logging.debug("MemoryChunk.concat adding_size {}".format(adding_size))
+        if trace.TRACE:
+            logging.debug("MemoryChunk.concat adding_size %d", adding_size)
         if self.binary:
             self.bulk += data
         else:
@@ -65,46 +200,514 @@ class MemoryChunk(Chunk):
 
     def _flush(self, output):
         """Flushing chunk into output."""
-        logging.debug("MemoryChunk._flush")
-        output.write(self.bulk)
+        if trace.TRACE:
+            logging.debug("MemoryChunk._flush")
+        output.write(self.bulk, self.key)
 
 
 class DiskChunk(Chunk):
-    """Disk chunk class."""
+    """Disk chunk class.
+
+    Data is appended to a file as length-prefixed frames. Appended frames are
+    collected in memory and written to the file in bulk, then read back via
+    ``mmap`` when flushing. The file is removed after flushed successfully.
+
+    The chunk key is saved as JSON in a key file next to the chunk file, so
+    that a recovered chunk is flushed with its key.
+    """
+
+    def __init__(self, binary, path, fsync='chunk', write_size=65536):
+        """Init.
+
+        Args:
+            binary (bool): Whether flush data as binary or not.
+            path (str or function): Chunk file path, or a function returning
+              a new path. A function is called when the first data arrives,
+              so an empty chunk does not create a file.
+            fsync (str): When to fsync the file. ``never``, ``chunk`` (when
+              closed) or ``always`` (every append).
+            write_size (int): Write appended data to the file when collected
+              data exceeds this size.
+        """
+        self.path = None if callable(path) else path
+        self.path_fn = path if callable(path) else None
+        self.fsync = fsync
+        self.write_size = write_size
+        self.fd = None
+        self.pending = bytearray()
+        self.closed = False
+        super(DiskChunk, self).__init__(binary)
+
+    @classmethod
+    def recover(cls, binary, path):
+        """Recover a chunk from existing chunk file.
+
+        A truncated last frame, which is left by abnormal termination, is
+        removed from the file.
+
+        Args:
+            binary (bool): Whether flush data as binary or not.
+            path (str): Chunk file path.
+
+        Returns:
+            DiskChunk: Closed chunk.
+        """
+        chunk = cls(binary, path)
+        offsets = chunk._frame_offsets()
+        size = os.path.getsize(path)
+        end = offsets[-1][1] if offsets else 0
+        if end < size:
+            logging.warning("truncate broken frame of chunk file {} from {} "
+                            "to {}".format(path, size, end))
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        chunk.num_record = len(offsets)
+        chunk.bytesize = sum(stop - start for start, stop in offsets)
+        chunk.key = chunk._read_key()
+        chunk.closed = True
+        return chunk
+
+    @property
+    def key_path(self):
+        """Return path of the key file."""
+        return self.path + KEY_EXT
+
+    def _write_key(self):
+        """Write the chunk key to the key file."""
+        if self.key is None:
+            return
+        with open(self.key_path, 'w') as f:
+            json.dump(self.key, f)
+            if self.fsync != 'never':
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_key(self):
+        """Read the chunk key from the key file.
+
+        Returns:
+            Chunk key, or None if there is no readable key file.
+        """
+        if not os.path.isfile(self.key_path):
+            return None
+        try:
+            with open(self.key_path, 'r') as f:
+                return json.load(f)
+        except ValueError as e:
+            logging.warning("can not read chunk key file {}: {}".
+                            format(self.key_path, e))
+            return None
+
+    def concat(self, data, adding_size):
+        """Concat new data."""
+        assert not self.closed, "Chunk already closed."
+        if isinstance(data, string_types):
+            data = data.encode('utf8')
+        self.pending += FRAME_HEADER.pack(len(data))
+        self.pending += data
+        self.num_record += 1
+        self.bytesize += adding_size
+        if self.fsync == 'always' or len(self.pending) >= self.write_size:
+            self._write_pending()
+
+    def _write_pending(self):
+        """Write collected data to the file."""
+        if len(self.pending) == 0:
+            return
+        if self.fd is None:
+            if self.path is None:
+                self.path = self.path_fn()
+            # the key file first, so a chunk file always has its key.
+            self._write_key()
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND |
+                              os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        view = memoryview(self.pending)
+        while len(view) > 0:
+            written = os.write(self.fd, view)
+            view = view[written:]
+        view.release()
+        self.pending = bytearray()
+        if self.fsync == 'always':
+            os.fsync(self.fd)
+
+    def close(self):
+        """Write remaining data and close the file."""
+        if self.closed:
+            return
+        self._write_pending()
+        if self.fd is not None:
+            if self.fsync != 'never':
+                os.fsync(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        self.closed = True
+
+    def _frame_offsets(self):
+        """Return (start, stop) offsets of complete frames in the file."""
+        offsets = []
+        if self.path is None or not os.path.isfile(self.path):
+            return offsets
+        size = os.path.getsize(self.path)
+        if size == 0:
+            return offsets
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                pos = 0
+                hsize = FRAME_HEADER.size
+                while pos + hsize <= size:
+                    length, = FRAME_HEADER.unpack_from(mm, pos)
+                    if pos + hsize + length > size:
+                        break
+                    offsets.append((pos + hsize, pos + hsize + length))
+                    pos += hsize + length
+            finally:
+                mm.close()
+        return offsets
+
+    def read_bulk(self):
+        """Read bulk from the file.
+
+        Returns:
+            bytearray or list: Concatenated data if binary, otherwise list of
+              strings.
+        """
+        offsets = self._frame_offsets()
+        if len(offsets) == 0:
+            return bytearray() if self.binary else []
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if self.binary:
+                    bulk = bytearray()
+                    for start, stop in offsets:
+                        bulk += mm[start:stop]
+                else:
+                    bulk = [mm[start:stop].decode('utf8') for start, stop in
+                            offsets]
+            finally:
+                mm.close()
+        return bulk
+
+    def _flush(self, output):
+        """Flushing chunk into output, then remove the file."""
+        if trace.TRACE:
+            logging.debug("DiskChunk._flush")
+        self.close()
+        output.write(self.read_bulk(), self.key)
+        self.discard()
+
+    def discard(self):
+        """Close and remove the chunk file."""
+        self.close()
+        if self.path is not None:
+            if os.path.isfile(self.path):
+                os.unlink(self.path)
+            if os.path.isfile(self.key_path):
+                os.unlink(self.key_path)
+
+
+class SecondaryFile(object):
+    """Secondary output which writes a failed chunk into a file.
+
+    Each bulk is written into a new file in the directory, so that it can be
+     inspected or replayed later.
+    """
+
+    def __init__(self, path):
+        """Init.
+
+        Args:
+            path (str): Directory for failed chunk files.
+        """
+        self.path = path
+        self.seq = itertools.count()
+
+    def write(self, bulk, key=None):
+        """Write a bulk into a new file.
+
+        Args:
+            bulk (bytearray or list): Chunk data.
+            key: Chunk key. Not used.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        fname = '{:016x}-{:08x}.failed'.format(int(time.time() * 1e6),
+                                               next(self.seq))
+        with open(os.path.join(self.path, fname), 'wb') as f:
+            if isinstance(bulk, list):
+                for line in bulk:
+                    f.write(line.encode('utf8') + b'\n')
+            else:
+                f.write(bulk)
 
 
 class Buffer(object):
-    """Base class for buffer."""
+    """Base class for buffer.
+
+    A buffer appends formatted data to its active chunk, makes a new chunk
+     when the active chunk is full, and flushes the oldest chunk when there
+     are too many chunks or flush interval has passed.
+
+    With flush workers, chunks to flush are handed to worker threads, so
+     that chunking and reading input go on while chunks are being written.
+
+    A chunk which failed to flush is kept at the head, and retried with
+     exponential backoff. After ``retry_max`` retries, it is written to the
+     secondary output if there is one, otherwise dropped.
+
+    Size of the buffered data is bounded by ``buffer_max_size`` and by the
+     memory budget shared with other buffers. When there is no room for new
+     data, ``overflow_action`` decides what to do:
 
-    def __init__(self, output, memory, binary, flush_at_shutdown):
+    - block: Block the appending thread, flushing chunks until there is room.
+        Data larger than the limit, or still without room after
+        ``block_timeout`` seconds or when stopped, exceeds the limit.
+    - drop_oldest: Drop the oldest chunk.
+    - spill: Move the oldest chunk in memory into a file. Spilled chunk files
+        left by the previous run are requeued when the buffer starts.
+    """
+
+    def __init__(self, output, memory, binary, flush_at_shutdown,
+                 chunk_max_record=DEFAULT_CHUNK_MAX_RECORD,
+                 chunk_max_size=DEFAULT_CHUNK_MAX_SIZE,
+                 buffer_max_chunk=DEFAULT_BUFFER_MAX_CHUNK,
+                 flush_interval=None, flush_workers=DEFAULT_FLUSH_WORKERS,
+                 flush_queue_size=DEFAULT_FLUSH_QUEUE_SIZE,
+                 drain_timeout=DEFAULT_DRAIN_TIMEOUT,
+                 retry_max=DEFAULT_RETRY_MAX, retry_wait=DEFAULT_RETRY_WAIT,
+                 retry_max_wait=DEFAULT_RETRY_MAX_WAIT, secondary=None,
+                 buffer_max_size=DEFAULT_BUFFER_MAX_SIZE,
+                 overflow_action=DEFAULT_OVERFLOW_ACTION, spill_path=None):
         """Init.
 
         Args:
             output (Output): An output.
             memory (bool): Store data to memory or disk.
             binary (bool): Store data as binary or not.
+            flush_at_shutdown (bool): Flush all chunks at shutdown or not.
+            chunk_max_record (int): Maximum records per chunk for slicing.
+            chunk_max_size (str): Maximum chunk size for slicing with suffix.
+            buffer_max_chunk (int): Maximum chunks per buffer for slicing.
+            flush_interval (str): Flush interval with time suffix.
+            flush_workers (int): Number of flush worker threads. If 0, chunks
+              are flushed synchronously.
+            flush_queue_size (int): Maximum chunks waiting for each worker.
+            drain_timeout (str): Time to wait for workers to flush remaining
+              chunks when stopping, with time suffix.
+            retry_max (int): Maximum retries of a failed chunk. Retry
+              forever if None.
+            retry_wait (str): Wait before the first retry, with time suffix.
+              Doubled for each retry.
+            retry_max_wait (str): Maximum wait between retries, with time
+              suffix.
+            secondary: An object with ``write(bulk, key=None)`` method, such
+              as an output, to write chunks which exceeded ``retry_max``.
+            buffer_max_size (str): Maximum size of buffered data with suffix.
+            overflow_action (str): ``block``, ``drop_oldest`` or ``spill``.
+            spill_path (str): Directory for spilled chunk files. Defaults to
+              ``SWAK_HOME/buffer/TAG.spill``.
         """
+        assert isinstance(chunk_max_size, string_types), "chunk_max_size must"\
+            " be a string."
+        assert flush_interval is None or \
+            isinstance(flush_interval, string_types),\
+            "flush_interval must be a string."
+
+        try:
+            chunk_max_size = size_value(chunk_max_size)
+            flush_interval = time_value(flush_interval)
+            drain_timeout = time_value(drain_timeout)
+            retry_wait = time_value(retry_wait)
+            retry_max_wait = time_value(retry_max_wait)
+            buffer_max_size = size_value(buffer_max_size)
+        except ValueError as e:
+            raise ConfigError(str(e))
+
+        # Validate arguements.
+        if chunk_max_record is not None and chunk_max_record <= 0:
+            raise ConfigError("chunk_max_record must be greater than 0..")
+        if buffer_max_chunk is not None and buffer_max_chunk <= 0:
+            raise ConfigError("buffer_max_chunk must be greater than 0.")
+        if chunk_max_size is not None and chunk_max_size <= 0:
+            raise ConfigError("chunk_max_size must be greater than 0.")
+        if flush_interval is not None and flush_interval <= 0:
+            raise ConfigError("flush_interval must be greater than 0.")
+        if flush_workers < 0:
+            raise ConfigError("flush_workers must not be negative.")
+        if flush_queue_size <= 0:
+            raise ConfigError("flush_queue_size must be greater than 0.")
+        if drain_timeout is not None and drain_timeout < 0:
+            raise ConfigError("drain_timeout must not be negative.")
+        if retry_max is not None and retry_max < 0:
+            raise ConfigError("retry_max must not be negative.")
+        if retry_wait <= 0 or retry_max_wait < retry_wait:
+            raise ConfigError("retry_wait must be greater than 0, and not "
+                              "greater than retry_max_wait.")
+        if buffer_max_size <= 0:
+            raise ConfigError("buffer_max_size must be greater than 0.")
+        if overflow_action not in OVERFLOW_ACTIONS:
+            raise ConfigError("overflow_action must be one of {}.".
+                              format(', '.join(OVERFLOW_ACTIONS)))
+        if overflow_action == 'spill' and not memory:
+            raise ConfigError("spill is only for memory buffer.")
+
+        self.chunk_max_record = chunk_max_record
+        self.chunk_max_size = chunk_max_size
+        self.buffer_max_chunk = buffer_max_chunk
+        self.flush_interval = flush_interval
+        self.flush_workers = flush_workers
+        self.flush_queue_size = flush_queue_size
+        self.drain_timeout = drain_timeout
+        self.retry_max = retry_max
+        self.retry_wait = retry_wait
+        self.retry_max_wait = retry_max_wait
+        self.secondary = secondary
+        self.buffer_max_size = buffer_max_size
+        self.overflow_action = overflow_action
+        self.spill_path = spill_path
+        self.block_timeout = DEFAULT_BLOCK_TIMEOUT
+        self.budget = MemoryBudget(buffer_max_size)
+        self.global_budget = None
+
+        logging.info("{}.__init__- chunk_max_record {}, chunk_max_size {}, "
+                     "buffer_max_chunk {}, flush_interval {}, flush_workers "
+                     "{}".format(self.__class__.__name__, chunk_max_record,
+                                 chunk_max_size, buffer_max_chunk,
+                                 flush_interval, flush_workers))
+
         self.output = output
         self.memory = memory
         self.binary = binary
         self.tag = None
+        self.seq = itertools.count()
         initial_chunk = self.new_chunk()
         self.chunks = deque([initial_chunk])
         self.last_flush = None
         self.cnt_flushing = 0
         self.cnt_chunking = 0
+        self.cnt_retry = 0
+        self.cnt_giveup = 0
+        self.cnt_overflow = 0
+        self.cnt_dropped = 0
+        self.cnt_spilled = 0
         self.started = None
         self.flush_at_shutdown = flush_at_shutdown
+        self.workers = []
+        self.worker_queues = []
+        self.worker_seq = itertools.count()
+        self.flush_latency = Histogram()
+        # Guards metrics updated by flush workers.
+        self.metrics_lock = threading.Lock()
 
     def set_tag(self, tag):
         """Set tag."""
         self.tag = tag
 
+    def set_binary(self, binary):
+        """Set whether store data as binary or not.
+
+        Should be called before any data is appended.
+
+        Args:
+            binary (bool): Store data as binary or not.
+        """
+        assert all(chunk.empty() for chunk in self.chunks)
+        self.binary = binary
+        for chunk in self.chunks:
+            chunk.binary = binary
+            chunk.reset()
+
+    def set_memory_budget(self, budget):
+        """Set memory budget shared with other buffers.
+
+        Args:
+            budget (MemoryBudget): Memory budget.
+        """
+        self.global_budget = budget
+
+    @property
+    def size(self):
+        """Return size of the buffered data counted in the budget."""
+        return self.budget.used
+
+    @property
+    def spill_dir(self):
+        """Return directory for spilled chunk files."""
+        if self.spill_path is not None:
+            return self.spill_path
+        return get_buffer_dir(self.tag, '.spill')
+
+    def new_chunk_path(self, adir):
+        """Make a path for new chunk file in the directory.
+
+        File names are ordered by creation.
+
+        Args:
+            adir (str): Directory for the chunk file.
+        """
+        make_dirs(adir)
+        fname = '{:016x}-{:08x}{}'.format(int(time.time() * 1e6),
+                                          next(self.seq), CHUNK_EXT)
+        return os.path.join(adir, fname)
+
+    def reserve(self, size, memory):
+        """Reserve room for data.
+
+        Args:
+            size (int): Bytes to reserve.
+            memory (bool): Whether the data is in memory or not. Only data in
+              memory is counted in the shared memory budget.
+
+        Returns:
+            bool: True if reserved, False if no room.
+        """
+        if not self.budget.reserve(size):
+            return False
+        if memory and self.global_budget is not None and\
+                not self.global_budget.reserve(size):
+            self.budget.release(size)
+            return False
+        return True
+
+    def force_reserve(self, size, memory):
+        """Reserve room for data even if it exceeds the limits.
+
+        Args:
+            size (int): Bytes to reserve.
+            memory (bool): Whether the data is in memory or not.
+        """
+        self.budget.force_reserve(size)
+        if memory and self.global_budget is not None:
+            self.global_budget.force_reserve(size)
+
+    def release(self, size, memory):
+        """Release reserved room.
+
+        Args:
+            size (int): Bytes to release.
+            memory (bool): Whether the data is in memory or not.
+        """
+        self.budget.release(size)
+        if memory and self.global_budget is not None:
+            self.global_budget.release(size)
+
+    def release_chunk(self, chunk, size=None):
+        """Release room of a chunk.
+
+        Args:
+            chunk (Chunk): A chunk which is flushed or dropped.
+            size (int): Size to release. Chunk size if None.
+        """
+        size = chunk.bytesize if size is None else size
+        if chunk.budgeted and size > 0:
+            self.release(size, chunk.memory)
+
     @property
     def empty(self):
         """All chunks empty or not."""
         for chunk in self.chunks:
-            if not chunk.empty:
+            if not chunk.empty():
                 return False
         return True
 
@@ -123,24 +726,389 @@ class Buffer(object):
         """Start buffer."""
         assert not self.started
         self.started = True
+        self.start_workers()
+        if self.overflow_action == 'spill':
+            self.recover_spilled()
+
+    def recover_spilled(self):
+        """Requeue chunk files spilled by the previous run ahead of chunks.
+
+        As spilled chunks, they are not counted in the budget.
+
+        Returns:
+            int: Number of requeued chunks.
+        """
+        known = set(getattr(chunk, 'path', None) for chunk in self.chunks)
+        paths = sorted(glob.glob(os.path.join(self.spill_dir,
+                                              '*' + CHUNK_EXT)))
+        recovered = []
+        for path in paths:
+            if path in known:
+                continue
+            chunk = DiskChunk.recover(self.binary, path)
+            if chunk.empty():
+                chunk.discard()
+                continue
+            chunk.budgeted = False
+            recovered.append(chunk)
+
+        for chunk in reversed(recovered):
+            self.chunks.appendleft(chunk)
+        if len(recovered) > 0:
+            logging.info("{}.recover_spilled - {} chunks requeued from {}".
+                         format(self.__class__.__name__, len(recovered),
+                                self.spill_dir))
+        return len(recovered)
 
     def stop(self):
         """Stop buffer."""
         assert self.started
         self.started = False
+        self.stop_workers()
 
-    def append(self, data):
-        """Append data stream to buffer.
+    def start_workers(self):
+        """Start flush worker threads."""
+        for i in range(self.flush_workers):
+            queue = Queue(self.flush_queue_size)
+            name = "Flush-{}-{}".format(self.tag, i)
+            worker = threading.Thread(target=self._flush_worker, name=name,
+                                      args=(queue,))
+            worker.daemon = True
+            worker.start()
+            self.worker_queues.append(queue)
+            self.workers.append(worker)
 
-        If matches flush condition, will call ``flush`` with chunk
+    def stop_workers(self):
+        """Stop flush workers after they flush queued chunks.
+
+        Chunks which are not flushed within drain timeout are lost for a
+         memory buffer.
+        """
+        if len(self.workers) == 0:
+            return
+        logging.info("{}.stop_workers".format(self.__class__.__name__))
+        deadline = None if self.drain_timeout is None else\
+            time.time() + self.drain_timeout
+        workers, queues = self.workers, self.worker_queues
+        self.workers, self.worker_queues = [], []
+
+        def remain():
+            if deadline is not None:
+                return max(deadline - time.time(), 0)
+
+        for queue in queues:
+            try:
+                queue.put(None, timeout=remain())
+            except Full:
+                pass
+        for worker in workers:
+            worker.join(remain())
+        for worker, queue in zip(workers, queues):
+            if worker.is_alive():
+                logging.warning("{} has not drained in time, {} chunks left".
+                                format(worker.name, queue.qsize()))
+
+    def _flush_worker(self, queue):
+        """Flush chunks from the queue until None is received.
+
+        A failed chunk is retried by the worker, so the order of chunks is
+         kept.
+        """
+        while True:
+            chunk = queue.get()
+            if chunk is None:
+                break
+            while True:
+                try:
+                    self.flush_release(chunk)
+                    break
+                except Exception as e:
+                    wait = self.flush_failed(chunk, e)
+                    if wait is None:
+                        break
+                    time.sleep(wait)
+
+    def retry_wait_time(self, retry):
+        """Return wait time before a retry.
+
+        Exponential backoff with jitter. The wait is between half and full of
+         the doubled wait, to prevent retries of many buffers at once.
+
+        Args:
+            retry (int): Number of retries so far, from 1.
+
+        Returns:
+            float: Wait time in seconds.
+        """
+        wait = min(self.retry_wait * 2 ** (retry - 1), self.retry_max_wait)
+        return wait * 0.5 + random.uniform(0, wait * 0.5)
+
+    def flush_failed(self, chunk, err):
+        """Handle a failed flushing of a chunk.
 
         Args:
-            data: Formatted event.
+            chunk (Chunk): Failed chunk.
+            err (Exception): Error from the output.
+
+        Returns:
+            float: Wait time before a retry, or None if gave up the chunk.
+        """
+        chunk.retry += 1
+        if self.retry_max is not None and chunk.retry > self.retry_max:
+            self.give_up(chunk, err)
+            return None
+        with self.metrics_lock:
+            self.cnt_retry += 1
+        wait = self.retry_wait_time(chunk.retry)
+        chunk.next_retry = time.time() + wait
+        logging.warning("{} flush failed: {}, retry {} after {:.2f} sec".
+                        format(self.__class__.__name__, err, chunk.retry,
+                               wait))
+        return wait
+
+    def give_up(self, chunk, err):
+        """Write a chunk to the secondary output, or drop it.
+
+        Args:
+            chunk (Chunk): Chunk to give up.
+            err (Exception): Last error from the output.
+        """
+        with self.metrics_lock:
+            self.cnt_giveup += 1
+        size = chunk.bytesize
+        if self.secondary is not None:
+            logging.error("{} gave up chunk after {} retries: {}, write to "
+                          "secondary".format(self.__class__.__name__,
+                                             self.retry_max, err))
+            try:
+                chunk.flush(self.secondary)
+                self.release_chunk(chunk, size)
+                return
+            except Exception as e:
+                logging.error("secondary write failed: {}".format(e))
+        logging.error("{} drop chunk of {} records after {} retries: {}".
+                      format(self.__class__.__name__, chunk.num_record,
+                             self.retry_max, err))
+        chunk.reset()
+        chunk.discard()
+        self.release_chunk(chunk, size)
+
+    @property
+    def retry_due(self):
+        """Return whether the head chunk is waiting for a retry or not.
+
+        Returns:
+            bool: True if waiting for a retry, False if retry is due, or None
+              if the head chunk has not failed.
+        """
+        if len(self.chunks) == 0:
+            return None
+        next_retry = self.chunks[0].next_retry
+        if next_retry is None:
+            return None
+        return next_retry <= time.time()
+
+    def flush_chunk(self, chunk):
+        """Flush a chunk directly or via a flush worker.
+
+        Args:
+            chunk (Chunk): A chunk to flush.
+        """
+        if len(self.workers) == 0:
+            self.flush_release(chunk)
+            return
+        if chunk.key is None:
+            # unkeyed chunks have no order to keep, spread them.
+            idx = next(self.worker_seq) % len(self.workers)
+        else:
+            idx = hash(chunk.key) % len(self.workers)
+        # Blocks when the worker lags behind, to keep the memory bounded.
+        self.worker_queues[idx].put(chunk)
+
+    def flush_release(self, chunk):
+        """Flush a chunk into the output and release its room.
+
+        Args:
+            chunk (Chunk): A chunk to flush.
+        """
+        size = chunk.bytesize
+        st = time.time()
+        chunk.flush(self.output)
+        elapsed = time.time() - st
+        with self.metrics_lock:
+            self.flush_latency.observe(elapsed)
+        # chunk sizes are known, so outputs need not measure their bulks.
+        with self.output.metrics_lock:
+            self.output.metrics.bytes_out += size
+        self.release_chunk(chunk, size)
+
+    def overflow(self, adding_size):
+        """Make room for new data by overflow action.
+
+        Args:
+            adding_size (int): New data size in bytes.
+
+        Returns:
+            Chunk: Active chunk.
+        """
+        self.cnt_overflow += 1
+        memory = self.active_chunk.memory
+        if self.overflow_action == 'block':
+            self.block(adding_size)
+            return self.active_chunk
+
+        make_room = self.drop_oldest if self.overflow_action == 'drop_oldest'\
+            else self.spill_oldest
+        while not self.reserve(adding_size, memory):
+            if not make_room():
+                logging.warning("{} has no chunk to make room, exceeds "
+                                "budget".format(self.__class__.__name__))
+                self.force_reserve(adding_size, memory)
+                break
+        return self.active_chunk
+
+    def block(self, adding_size):
+        """Block until there is room for new data, flushing chunks.
+
+        Exceeds the limit without blocking if the data is larger than the
+         limit, and after ``block_timeout`` seconds or when the buffer is
+         stopped, as other buffers holding the shared budget may never flush.
+
+        Args:
+            adding_size (int): New data size in bytes.
+        """
+        memory = self.active_chunk.memory
+        budgets = [self.budget]
+        if memory and self.global_budget is not None:
+            budgets.append(self.global_budget)
+        if any(adding_size > budget.max_size for budget in budgets):
+            logging.warning("{} got data of {} bytes larger than the limit, "
+                            "exceeds budget".format(self.__class__.__name__,
+                                                    adding_size))
+            self.force_reserve(adding_size, memory)
+            return
+        logging.warning("{} overflowed, block until flushed".
+                        format(self.__class__.__name__))
+        deadline = time.time() + self.block_timeout
+        while not self.reserve(adding_size, memory):
+            flushable = len(self.chunks) > 1 or not self.active_chunk.empty()
+            if flushable and self.retry_due is not False:
+                self.flushing()
+                continue
+            remain = deadline - time.time()
+            if remain <= 0 or not self.started:
+                logging.warning("{} has no room after blocking, exceeds "
+                                "budget".format(self.__class__.__name__))
+                self.force_reserve(adding_size, memory)
+                break
+            # Wait for a retry, or release by flush workers or other buffers.
+            timeout = self.time_to_flush()
+            timeout = MAX_BLOCK_WAIT if timeout is None else\
+                min(max(timeout, 0.001), MAX_BLOCK_WAIT)
+            budgets[-1].wait(min(timeout, remain))
+
+    def oldest_chunk(self, memory_only):
+        """Return the oldest non-empty chunk to make room.
+
+        If it is the active chunk, new active chunk is made.
+
+        Args:
+            memory_only (bool): Find only chunks in memory.
+
+        Returns:
+            Chunk: The oldest chunk, or None if there is no such chunk.
+        """
+        for chunk in self.chunks:
+            if chunk.empty() or not chunk.budgeted or\
+                    (memory_only and not chunk.memory):
+                continue
+            if chunk is self.active_chunk:
+                self.chunking()
+            return chunk
+
+    def drop_oldest(self):
+        """Drop the oldest chunk.
+
+        Returns:
+            bool: True if dropped, False if there is no chunk to drop.
+        """
+        chunk = self.oldest_chunk(False)
+        if chunk is None:
+            return False
+        logging.warning("{} overflowed, drop oldest chunk of {} records".
+                        format(self.__class__.__name__, chunk.num_record))
+        self.chunks.remove(chunk)
+        size = chunk.bytesize
+        chunk.reset()
+        chunk.discard()
+        self.release_chunk(chunk, size)
+        self.cnt_dropped += 1
+        return True
+
+    def spill_oldest(self):
+        """Move the oldest chunk in memory into a file.
+
+        The spilled chunk keeps its position, and is not counted in the
+         budget any more.
+
+        Returns:
+            bool: True if spilled, False if there is no chunk to spill.
+        """
+        chunk = self.oldest_chunk(True)
+        if chunk is None:
+            return False
+        logging.info("{} overflowed, spill oldest chunk of {} records".
+                     format(self.__class__.__name__, chunk.num_record))
+        disk = DiskChunk(self.binary, partial(self.new_chunk_path,
+                                              self.spill_dir), 'never')
+        disk.key = chunk.key
+        if self.binary:
+            disk.concat(chunk.bulk, chunk.bytesize)
+        else:
+            for data in chunk.bulk:
+                disk.concat(data, 0)
+        disk.close()
+        disk.num_record = chunk.num_record
+        disk.bytesize = chunk.bytesize
+        disk.retry = chunk.retry
+        disk.next_retry = chunk.next_retry
+        disk.budgeted = False
+        for i, achunk in enumerate(self.chunks):
+            if achunk is chunk:
+                self.chunks[i] = disk
+                break
+        self.release_chunk(chunk)
+        chunk.reset()
+        self.cnt_spilled += 1
+        return True
+
+    def append(self, data, binary_data=False, key=None):
+        """Append data stream to buffer.
+
+        Args:
+            data (bytearray or str) bytearry if this is a binary buffer,
+              otherwise string data.
+            binary_data (bool): Whether this data is already binarized or not.
+            key: Chunk key of the data. Data of a different key goes to a new
+              chunk, and the key is passed to the output when flushing.
 
         Returns:
             int: Adding size of data.
         """
-        raise NotImplementedError()
+        if trace.TRACE:
+            logging.debug("%s.append", self.__class__.__name__)
+        bytedata = data if binary_data else bytearray(data, encoding='utf8')
+        adding_size = len(bytedata)
+        if self.binary:
+            data = bytedata
+
+        chunk = self.may_chunking(adding_size, key)
+        if not self.reserve(adding_size, chunk.memory):
+            chunk = self.overflow(adding_size)
+        if chunk.empty():
+            chunk.key = key
+        chunk.concat(data, adding_size)
+        return adding_size
 
     def chunking(self):
         """Create new chunk and append.
@@ -148,59 +1116,80 @@ class Buffer(object):
         Returns:
             Chunk: Created chunk.
         """
-        logging.debug("Buffer.chunking")
+        if trace.TRACE:
+            logging.debug("Buffer.chunking")
+        if len(self.chunks) > 0:
+            self.active_chunk.close()
         new_chunk = self.new_chunk()
         self.chunks.append(new_chunk)
         self.cnt_chunking += 1
         return new_chunk
 
     def flushing(self, flush_all=False):
-        """Pop chunk and flush it.
+        """Flush head chunk and pop it.
 
-        If no remain chunks, create one and return it.
+        If the head chunk is the active one, a new chunk is made first. A
+         chunk failed to flush is kept at head for a retry.
 
         Args:
             flush_all (bool): Whether flush all or just one.
 
         Returns:
-            Chunk: Chunk created after flushing.
+            Chunk: Chunk created by flushing.
         """
-        logging.debug("Buffer.flushing")
-        while True:
-            try:
-                head_chunk = self.chunks.popleft()
-                # no flushing when chunk is empty
-                if not head_chunk.empty():
-                    if self.output is not None:
-                        head_chunk.flush(self.output)
+        if trace.TRACE:
+            logging.debug("Buffer.flushing")
+        new_chunk = None
+        while len(self.chunks) > 0:
+            if self.retry_due is False:
+                # head chunk is still waiting for a retry.
+                break
+            head_chunk = self.chunks[0]
+            # no flushing when chunk is empty
+            if not head_chunk.empty():
+                if head_chunk is self.active_chunk:
+                    new_chunk = self.chunking()
+                if self.output is None:
+                    self.release_chunk(head_chunk)
                     self.cnt_flushing += 1
-                if not flush_all:
-                    break
-            except IndexError:
+                else:
+                    try:
+                        self.flush_chunk(head_chunk)
+                        self.cnt_flushing += 1
+                    except Exception as e:
+                        if self.flush_failed(head_chunk, e) is not None:
+                            # keep the chunk at head for a retry.
+                            break
+            elif head_chunk is self.active_chunk:
                 break
+            else:
+                head_chunk.discard()
+            self.chunks.popleft()
+            if not flush_all:
+                break
+        return new_chunk
 
-        # If there are no left chunks, make one.
-        if self.num_chunk == 0:
-            logging.debug("no more chunk, make one")
-            return self.chunking()
-
-    def may_chunking(self, adding_size):
+    def may_chunking(self, adding_size, key=None):
         """Chunking if needed.
 
         If new chunk is need for new data, make one.
 
         Args:
             adding_size (int): New data size in bytes.
+            key: Chunk key of new data.
 
         Returns:
             Chunk: Active chunk.
         """
-        logging.debug("may_chunking adding_size {}".format(adding_size))
+        if trace.TRACE:
+            logging.debug("may_chunking adding_size %d", adding_size)
         active_chunk = self.active_chunk
         new_chunk = None
         # Check chunking
-        if self.need_chunking(adding_size):
-            logging.debug("need chunk, make one")
+        if self.need_chunking(adding_size) or (key != active_chunk.key and
+                                               not active_chunk.empty()):
+            if trace.TRACE:
+                logging.debug("need chunk, make one")
             new_chunk = self.chunking()
             active_chunk = new_chunk
 
@@ -216,27 +1205,93 @@ class Buffer(object):
         Returns:
             Chunk: Chunk created after flushing.
         """
-        # Check flushing
-        logging.debug("may_flushing")
-        if self.need_flushing(last_flush_interval):
-            return self.flushing()
+        # Check flushing, until no more condition met.
+        if trace.TRACE:
+            logging.debug("may_flushing")
+        new_chunk = None
+        while self.need_flushing(last_flush_interval):
+            new_chunk = self.flushing()
+        return new_chunk
+
+    def snapshot_metrics(self):
+        """Return current values of the buffer's metrics.
+
+        Returns:
+            dict: Counters, chunks and size of the buffer, and flush latency.
+        """
+        with self.metrics_lock:
+            flush_latency = self.flush_latency.snapshot()
+        return dict(chunks=len(self.chunks), size=self.size,
+                    flushing=self.cnt_flushing, chunking=self.cnt_chunking,
+                    retry=self.cnt_retry, giveup=self.cnt_giveup,
+                    overflow=self.cnt_overflow, dropped=self.cnt_dropped,
+                    spilled=self.cnt_spilled, flush_latency=flush_latency)
 
     def new_chunk(self):
         """New chunk."""
-        if self.memory:
-            return MemoryChunk(self.binary)
-        else:
-            return DiskChunk(self.binary)
-
-    def need_chunking(self):
-        """Need new chunk or not."""
         raise NotImplementedError()
 
+    def time_to_flush(self):
+        """Return seconds until next flushing by flush interval is due.
+
+        Returns:
+            float: Seconds to next flushing, or None if no flush interval.
+        """
+        due = None
+        if self.flush_interval is not None:
+            if self.last_flush is None:
+                due = self.flush_interval
+            else:
+                due = self.last_flush + self.flush_interval - time.time()
+        if len(self.chunks) > 0 and self.chunks[0].next_retry is not None:
+            remain = self.chunks[0].next_retry - time.time()
+            if due is None or remain < due:
+                due = remain
+        return due
+
+    def need_chunking(self, adding_size):
+        """Need new chunk or not.
+
+        Args:
+            adding_size (int): New data size in bytes.
+        """
+        chunk = self.active_chunk
+        if self.chunk_max_record is not None and chunk.num_record + 1 >\
+                self.chunk_max_record:
+            return True
+        if self.chunk_max_size is not None and chunk.bytesize + adding_size >\
+                self.chunk_max_size:
+            return True
+
     def need_flushing(self, last_flush_interval):
         """Need flushing or not.
 
+        Flush with the following conditions:
+        - if number of chunk is greater than buffer max chunk.
+        - if flush interval has passed.
+        - if last flush interval has passed.
+        - if retry of the head chunk is due.
+
+        No flushing while the head chunk is waiting for a retry.
+
         Args:
             last_flush_interval (float): Force flushing interval for input
               is terminated.
         """
-        raise NotImplementedError()
+        retry_due = self.retry_due
+        if retry_due is not None:
+            return retry_due
+        if len(self.chunks) > self.buffer_max_chunk:
+            # Force flushing to remove head chunk.
+            return True
+        cur = time.time()
+        if self.last_flush is None:
+            self.last_flush = time.time()
+        diff = cur - self.last_flush
+        if self.flush_interval is not None and diff >= self.flush_interval:
+            self.last_flush = cur
+            return True
+        if last_flush_interval is not None and diff >=\
+                last_flush_interval:
+            self.last_flush = cur
+            return True
@@ -4,6 +4,7 @@ from __future__ import print_function
 
 import re
 import sys
+import json
 import logging
 
 import click
@@ -13,6 +14,7 @@ from swak.util import check_python_version, query_stream_log_handler, LOG_FMT
 from swak.plugin import PREFIX, get_plugins_dir, init_plugin_dir,\
     iter_plugins
 from swak.core import TRunAgent
+from swak.trace import set_trace
 from swak import __version__
 
 check_python_version()
@@ -49,6 +51,8 @@ def set_log_verbosity(verbosity):
     Args:
         verbosity (int): verbose level.
     """
+    # Trace hot paths too at the highest verbosity.
+    set_trace(verbosity >= 3)
     level = _log_level_from_verbosity(verbosity)
     logger = logging.getLogger()
     logger.setLevel(level)
@@ -58,7 +62,8 @@ def set_log_verbosity(verbosity):
 
 
 @click.group()
-@click.option('-v', '--verbose', count=True, help="Increase verbosity.")
+@click.option('-v', '--verbose', count=True, help="Increase verbosity. "
+              "-vvv to trace data flow.")
 @click.pass_context
 def main(ctx, verbose):
     """Entry for CLI."""
@@ -196,6 +201,119 @@ def prepare_cli(ctx):
     set_log_verbosity(verbosity)
 
 
+@main.command(help="Benchmark a service config end to end.")
+@click.option('-c', '--config', 'cfg_path', type=click.Path(exists=True),
+              default=None, help="Service config file to run. A counter to "
+              "null topology is used if not given.")
+@click.option('-n', '--number', default=None, type=int,
+              help="Records to generate in the default topology.  [default: "
+              "100000]")
+@click.option('-f', '--field', default=None, type=int,
+              help="Fields of a record in the default topology.  [default: "
+              "5]")
+@click.option('-e', '--engine', default=None,
+              type=click.Choice(['thread', 'asyncio']),
+              help="Override engine of the config.")
+@click.option('-t', '--timeout', default=None, type=float,
+              help="Seconds to wait for sources to finish.  [default: 600]")
+def bench(cfg_path, number, field, engine, timeout):
+    """Run a service agent and print the result as JSON."""
+    from swak.bench import run_bench, default_bench_cfg, load_bench_cfg,\
+        DEFAULT_BENCH_NUMBER, DEFAULT_BENCH_FIELD, DEFAULT_BENCH_TIMEOUT
+    from swak.exception import ConfigError
+
+    if cfg_path is not None:
+        if number is not None or field is not None:
+            raise click.UsageError("--number and --field are only for the "
+                                   "default topology.")
+        cfg = load_bench_cfg(cfg_path)
+    else:
+        cfg = default_bench_cfg(number or DEFAULT_BENCH_NUMBER,
+                                field or DEFAULT_BENCH_FIELD)
+    if engine is not None:
+        cfg['engine'] = engine
+    try:
+        result = run_bench(cfg, timeout or DEFAULT_BENCH_TIMEOUT)
+    except ConfigError as e:
+        sys.stderr.write("{}\n".format(e))
+        sys.exit(1)
+    if result is None:
+        sys.exit(1)
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+@main.group(help="Micro-benchmark hot paths and compare with a baseline.")
+def microbench():
+    """Micro-benchmark group."""
+    pass
+
+
+@microbench.command('run', help="Run micro-benchmarks and print the result "
+                    "as JSON.")
+@click.option('-o', '--output', 'out_path', type=click.Path(), default=None,
+              help="Save the result to a file.")
+@click.option('-k', '--select', 'patterns', multiple=True,
+              help="Glob pattern of benchmark names to run. All if not given.")
+@click.option('-m', '--min-time', default=None, type=float,
+              help="Minimum seconds of a measurement.  [default: 0.2]")
+@click.option('-r', '--repeat', default=None, type=int,
+              help="Number of measurements.  [default: 5]")
+def microbench_run(out_path, patterns, min_time, repeat):
+    """Run micro-benchmarks."""
+    from swak.microbench import run_benchmarks, DEFAULT_MIN_TIME,\
+        DEFAULT_REPEAT
+
+    result = run_benchmarks(patterns, min_time or DEFAULT_MIN_TIME,
+                            repeat or DEFAULT_REPEAT)
+    if not result['benchmarks']:
+        sys.stderr.write("No benchmark matches.\n")
+        sys.exit(1)
+    body = json.dumps(result, indent=2)
+    if out_path is not None:
+        with open(out_path, 'w') as f:
+            f.write(body)
+    print(body)
+
+
+def _parse_slowdowns(values):
+    slowdowns = {}
+    for value in values:
+        match = re.match(r'^([^=]+)=([0-9.]+)$', value)
+        if match is None:
+            raise click.BadParameter("'{}' is not NAME=RATIO.".format(value))
+        slowdowns[match.group(1)] = float(match.group(2))
+    return slowdowns
+
+
+@microbench.command('compare', help="Compare micro-benchmark results with a "
+                    "baseline, and exit with 1 if any is slower than allowed.")
+@click.argument('baseline', type=click.Path(exists=True))
+@click.argument('current', type=click.Path(exists=True))
+@click.option('-s', '--max-slowdown', default=None, type=float,
+              help="Allowed slowdown ratio.  [default: 0.2]")
+@click.option('-b', '--bench-slowdown', 'bench_slowdowns', multiple=True,
+              help="Allowed slowdown ratio of a benchmark as NAME=RATIO.")
+def microbench_compare(baseline, current, max_slowdown, bench_slowdowns):
+    """Compare micro-benchmark results."""
+    from swak.microbench import compare_results, DEFAULT_MAX_SLOWDOWN
+
+    slowdowns = _parse_slowdowns(bench_slowdowns)
+    with open(baseline, 'r') as f:
+        base_result = json.load(f)
+    with open(current, 'r') as f:
+        cur_result = json.load(f)
+    if max_slowdown is None:
+        max_slowdown = DEFAULT_MAX_SLOWDOWN
+    rows = compare_results(base_result, cur_result, max_slowdown, slowdowns)
+    table = [(name, base * 1e6, cur * 1e6, ratio, 'ok' if passed else 'SLOW')
+             for name, base, cur, ratio, passed in rows]
+    header = ['Benchmark', 'Baseline (us/op)', 'Current (us/op)', 'Ratio',
+              'Result']
+    print(tabulate(table, headers=header, tablefmt='psql', floatfmt='.3f'))
+    if not all(row[4] for row in rows):
+        sys.exit(1)
+
+
 @main.command(help="Show Swak version.")
 def version():
     """Show version."""
@@ -8,10 +8,18 @@ from collections import Mapping
 import yaml
 
 from swak.exception import ConfigError
-from swak.util import parse_and_validate_cmds, validate_tag
+from swak.util import parse_and_validate_cmds, validate_tag, size_value,\
+    is_windows
+from swak.monitor import DEFAULT_MONITOR_HOST
 
 ENVVAR = 'SWAK_HOME'
 CFG_FNAME = 'config.yml'
+ENGINES = ['thread', 'process', 'asyncio']
+DEFAULT_ENGINE = 'thread'
+# asyncio engine needs asynchronous generators and asyncio.run.
+ASYNCIO_MIN_PYTHON = (3, 7)
+TRANSPORTS = ['queue', 'ring']
+DEFAULT_TRANSPORT = 'queue'
 MAIN_LOG_CFG = '''
 logger:
     version: 1
@@ -36,7 +44,7 @@ logger:
             backupCount: 10
 
     root:
-        level: DEBUG
+        level: INFO
         handlers: [console, file]
 '''
 
@@ -182,6 +190,43 @@ def get_pid_path(home, svc_name):
     return pid_path
 
 
+def get_socket_path(home, svc_name):
+    """Get monitor socket path with regards home and service name."""
+    sock_name = 'swak.sock' if svc_name is None else\
+        '{}.sock'.format(svc_name)
+    return os.path.join(home, 'run', sock_name)
+
+
+def get_monitor_address(cfg, home=None):
+    """Get listening address of the monitor server from config.
+
+    A relative Unix socket path is in the run directory of home.
+
+    Args:
+        cfg (dict): dict from parsing config text.
+        home (str): Home directory. From envvar or executable's directory if
+          None.
+
+    Returns:
+        dict: Keyword arguments for ``MonitorServer``, or None if no monitor
+          is configured.
+    """
+    mcfg = cfg.get('monitor')
+    if mcfg is None:
+        return None
+    if home is None:
+        home = os.environ.get(ENVVAR, get_exe_dir())
+    if 'unix_socket' in mcfg:
+        path = mcfg['unix_socket']
+        if path is True:
+            path = get_socket_path(home, cfg.get('svc_name'))
+        elif not os.path.isabs(path):
+            path = os.path.join(home, 'run', path)
+        return dict(unix_socket=path)
+    return dict(host=mcfg.get('host', DEFAULT_MONITOR_HOST),
+                port=mcfg['port'])
+
+
 def validate_cfg(cfg):
     """Validate config content."""
     _validate_agent_cfg(cfg)
@@ -237,8 +282,83 @@ def _validate_agent_cfg(cfg):
                 raise ConfigError(e)
             match_tags.add(tag)
 
+    # Memory budget
+    if 'memory_budget' in cfg:
+        try:
+            size = size_value(str(cfg['memory_budget']))
+        except ValueError as e:
+            raise ConfigError(e)
+        if size <= 0:
+            raise ConfigError("'memory_budget' must be greater than 0.")
+
+    # Engine
+    engine = cfg.get('engine', DEFAULT_ENGINE)
+    if engine not in ENGINES:
+        raise ConfigError("'engine' must be one of {}.".
+                          format(', '.join(ENGINES)))
+    if engine == 'asyncio' and sys.version_info < ASYNCIO_MIN_PYTHON:
+        raise ConfigError("'asyncio' engine needs Python {} or later.".
+                          format('.'.join(map(str, ASYNCIO_MIN_PYTHON))))
+    if 'match_shards' in cfg:
+        shards = cfg['match_shards']
+        if type(shards) is not int or shards <= 0:
+            raise ConfigError("'match_shards' must be an integer greater than"
+                              " 0.")
+        if shards > 1 and engine != 'process':
+            raise ConfigError("'match_shards' needs 'process' engine.")
+
+    # Transport
+    transport = cfg.get('transport', DEFAULT_TRANSPORT)
+    if transport not in TRANSPORTS:
+        raise ConfigError("'transport' must be one of {}.".
+                          format(', '.join(TRANSPORTS)))
+    if transport == 'ring' and engine == 'process':
+        from swak.ringqueue import can_share_ring
+        if not can_share_ring():
+            raise ConfigError("'ring' transport can not be shared with "
+                              "spawned worker processes without "
+                              "multiprocessing.shared_memory (Python 3.8 or "
+                              "later).")
+    if 'ring_size' in cfg:
+        try:
+            size = size_value(str(cfg['ring_size']))
+        except ValueError as e:
+            raise ConfigError(e)
+        if size <= 0:
+            raise ConfigError("'ring_size' must be greater than 0.")
+
+    # Trace
+    if 'trace' in cfg and type(cfg['trace']) is not bool:
+        raise ConfigError("'trace' must be true or false.")
+
+    # Monitor
+    if 'monitor' in cfg:
+        _validate_monitor_cfg(cfg['monitor'])
+
     for stag in source_tags:
         for mtag in match_tags:
             if not Rule(mtag, None).match(stag):
                 raise ConfigError("source tag '{}' does not have corresponding"
                                   " match tag.".format(stag))
+
+
+def _validate_monitor_cfg(mcfg):
+    if type(mcfg) is not dict:
+        raise ConfigError("The value of the 'monitor' field must be a "
+                          "dictionary content.")
+    if ('port' in mcfg) == ('unix_socket' in mcfg):
+        raise ConfigError("'monitor' needs either of 'port' or "
+                          "'unix_socket'.")
+    if 'port' in mcfg:
+        port = mcfg['port']
+        if type(port) is not int or not 0 <= port <= 65535:
+            raise ConfigError("'port' of 'monitor' must be an integer "
+                              "between 0 and 65535.")
+    else:
+        path = mcfg['unix_socket']
+        if path is not True and type(path) is not str:
+            raise ConfigError("'unix_socket' of 'monitor' must be true or a "
+                              "path.")
+        if is_windows():
+            raise ConfigError("'unix_socket' of 'monitor' is not supported "
+                              "on Windows.")
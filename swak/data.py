@@ -1,12 +1,15 @@
 """This module implements data stream classes."""
 
+from array import array
+from itertools import islice
+
+from six.moves import zip
+
 
 class DataStream(object):
     """DataStream class."""
 
-    def __init__(self):
-        """init."""
-        super(DataStream, self).__init__()
+    __slots__ = ()
 
     def __len__(self):
         """Length of data."""
@@ -16,10 +19,23 @@ class DataStream(object):
         """Wheter stream is empty."""
         return len(self) == 0
 
+    def batches(self, size):
+        """Iterate the stream by batches.
+
+        Args:
+            size (int): Maximum number of records per batch.
+
+        Yields:
+            DataStream: A batch of the stream.
+        """
+        yield self
+
 
 class OneDataStream(DataStream):
     """DataStream class."""
 
+    __slots__ = ('utime', 'record')
+
     def __init__(self, utime, record):
         """init.
 
@@ -27,61 +43,167 @@ class OneDataStream(DataStream):
             utime (float): emit time stamp.
             record (dict): record to emit.
         """
-        super(OneDataStream, self).__init__()
         self.utime = utime
         assert type(record) is dict
         self.record = record
 
     def __iter__(self):
         """Return iterator."""
-        self.iter_n = 0
-        return self
-
-    def __next__(self):
-        """Iterate next."""
-        if self.iter_n == 0:
-            self.iter_n += 1
-            return self.utime, self.record
-        raise StopIteration()
-
-    def next(self):
-        """Iterate next for Python2."""
-        return self.__next__()
+        return iter(((self.utime, self.record),))
 
     def __len__(self):
         """Length of datas."""
         return 1
 
+    @property
+    def times(self):
+        """Return time column."""
+        return array('d', (self.utime,))
+
+    @property
+    def records(self):
+        """Return record column."""
+        return [self.record]
+
 
 class MultiDataStream(DataStream):
-    """MultiDataStream class."""
+    """MultiDataStream class.
+
+    Times and records are stored as two parallel columns; times in an
+    ``array('d')`` and records in a list. A stream can be a view of another
+    stream's columns (see ``__getitem__`` and ``batches``), which shares the
+    columns instead of copying them.
+    """
+
+    __slots__ = ('_times', '_records', '_start', '_stop')
+
+    def __init__(self, times=None, records=None):
+        """init.
 
-    def __init__(self, times=[], records=[]):
-        """init."""
-        super(MultiDataStream, self).__init__()
+        Args:
+            times (array or list): Time stamps. An ``array('d')`` is used as
+              is, other sequences are converted.
+            records (list): Records. A list is used as is.
+        """
+        if times is None:
+            times = array('d')
+        elif not isinstance(times, array):
+            times = array('d', times)
+        if records is None:
+            records = []
+        elif type(records) is not list:
+            records = list(records)
         assert len(times) == len(records)
-        self.times = times
-        self.records = records
+        self._times = times
+        self._records = records
+        self._start = 0
+        self._stop = None
+
+    @classmethod
+    def _view(cls, times, records, start, stop):
+        """Make a view of columns without copying them."""
+        ds = cls.__new__(cls)
+        ds._times = times
+        ds._records = records
+        ds._start = start
+        ds._stop = stop
+        return ds
+
+    @property
+    def is_view(self):
+        """Whether this stream is a view of other stream's columns."""
+        return self._stop is not None
+
+    def _bounds(self):
+        stop = len(self._records) if self._stop is None else self._stop
+        return self._start, stop
+
+    def __reduce__(self):
+        """Pickle only the columns in bounds, not the whole shared ones."""
+        if not self.is_view:
+            return self.__class__, (self._times, self._records)
+        start, stop = self._bounds()
+        return self.__class__, (self._times[start:stop],
+                                self._records[start:stop])
+
+    @property
+    def times(self):
+        """Return time column.
+
+        Returns:
+            array: Time stamps. A view returns a slice of the column, as a
+              memoryview would lock the shared column against appends.
+        """
+        if not self.is_view:
+            return self._times
+        start, stop = self._bounds()
+        return self._times[start:stop]
+
+    @property
+    def records(self):
+        """Return record column.
+
+        Returns:
+            list: Records. A view returns a shallow slice of the column.
+        """
+        if not self.is_view:
+            return self._records
+        start, stop = self._bounds()
+        return self._records[start:stop]
 
     def __iter__(self):
-        """Return iterator."""
-        self.iter_n = 0
-        self.iter_max = len(self.times)
-        return self
-
-    def __next__(self):
-        """Iterate next."""
-        if self.iter_n < self.iter_max:
-            utime, record = self.times[self.iter_n], self.records[self.iter_n]
-            self.iter_n += 1
-            return utime, record
-        else:
-            raise StopIteration()
-
-    def next(self):
-        """Iterate next for Python2."""
-        return self.__next__()
+        """Return a new iterator of (time, record) tuples."""
+        if not self.is_view:
+            return zip(self._times, self._records)
+        start, stop = self._bounds()
+        return zip(islice(self._times, start, stop),
+                   islice(self._records, start, stop))
 
     def __len__(self):
         """Length of data."""
-        return len(self.records)
+        start, stop = self._bounds()
+        return stop - start
+
+    def __getitem__(self, key):
+        """Return a (time, record) tuple or a view for a slice."""
+        start, stop = self._bounds()
+        if isinstance(key, slice):
+            sstart, sstop, step = key.indices(stop - start)
+            assert step == 1, "Step slicing is not supported."
+            sstop = max(sstart, sstop)
+            return self._view(self._times, self._records, start + sstart,
+                              start + sstop)
+        if key < 0:
+            key += stop - start
+        if not 0 <= key < stop - start:
+            raise IndexError("stream index out of range")
+        return self._times[start + key], self._records[start + key]
+
+    def batches(self, size):
+        """Iterate the stream by views of at most ``size`` records.
+
+        Args:
+            size (int): Maximum number of records per batch.
+
+        Yields:
+            MultiDataStream: A view of the stream.
+        """
+        assert size > 0
+        start, stop = self._bounds()
+        if stop - start <= size:
+            yield self
+            return
+        for bstart in range(start, stop, size):
+            yield self._view(self._times, self._records, bstart,
+                             min(bstart + size, stop))
+
+    def append(self, utime, record):
+        """Append a record.
+
+        Args:
+            utime (float): Time stamp.
+            record: A record.
+        """
+        assert not self.is_view, "Can not append to a view."
+        self._times.append(utime)
+        self._records.append(record)
@@ -2,13 +2,16 @@
 import logging
 
 from swak.data import MultiDataStream, OneDataStream
-from swak.match import MatchPattern, OrMatchPattern
+from swak.match import MatchPattern, OrMatchPattern, TagTrie
 from swak.plugin import Modifier, Output, is_kind_of_output
 from swak.config import select_and_parse
+from swak.util import LRUCache
+from swak import trace
 
 _, cfg = select_and_parse()
 DEBUG = cfg['debug']
 default_placeholder = None
+DEFAULT_MATCH_CACHE_SIZE = 4096
 
 
 class Pipeline(object):
@@ -34,7 +37,7 @@ class Pipeline(object):
         logging.debug("set_output {}".format(output))
         self.output = output
 
-    def emit_stream(self, tag, ds, stop_event):
+    def emit_stream(self, tag, ds, stop_event=None):
         """Emit data stream output.
 
         Modify data and emit them.
@@ -47,13 +50,17 @@ class Pipeline(object):
         Returns:
             int: Adding size of the stream.
         """
-        logging.debug("emit_stream")
+        if trace.TRACE:
+            logging.debug("emit_stream")
         modified = self.modify_stream(tag, ds)
         return self.output.emit_stream(tag, modified, stop_event)
 
     def modify_stream(self, tag, ds):
         """Modify data stream.
 
+        Each modifier modifies whole columns of the stream by
+         ``modify_batch``.
+
         Args:
             ds (DataStream): data stream to be modified.
 
@@ -71,23 +78,15 @@ class Pipeline(object):
         for mod in self.modifiers:
             mod.prepare_for_stream(tag, ds)
 
-        # Modify each records
-        logging.debug("modify_stream")
-        times = []
-        records = []
-        for utime, record in ds:
-            skip = False
-            for mod in self.modifiers:
-                logging.debug("apply modifier {}".format(mod))
-                result = mod.modify(tag, utime, record)
-                if result is None:
-                    skip = True
-                    break
-                utime, record = result
-            if not skip:
-                times.append(utime)
-                records.append(record)
-        logging.debug("modified records {}".format(records))
+        if trace.TRACE:
+            logging.debug("modify_stream")
+        times, records = ds.times, ds.records
+        for mod in self.modifiers:
+            cnt = len(records)
+            times, records = mod.modify_batch(tag, times, records)
+            mod.metrics.count(cnt, len(records))
+            if len(records) == 0:
+                break
         return MultiDataStream(times, records)
 
 
@@ -101,7 +100,8 @@ class Rule(object):
             pattern (str): Glob style patterns seperated by space.
             collector: Modifier or Output
         """
-        patterns = [MatchPattern().create(ptrn) for ptrn in pattern.split()]
+        self.patterns = pattern.split()
+        patterns = [MatchPattern().create(ptrn) for ptrn in self.patterns]
         self.pattern = patterns[0] if len(patterns) == 1 else\
             OrMatchPattern(patterns)
         self.collector = collector
@@ -113,7 +113,7 @@ class Rule(object):
             tag (str): data tag
 
         Returns:
-            (SRE_Match): Returns match object if tag matches, None otherwise.
+            (bool): True if tag matches.
         """
         return self.pattern.match(tag)
 
@@ -141,15 +141,17 @@ class DataRouter(object):
     Collector is either of Output, Modifier.
     """
 
-    def __init__(self, def_output):
+    def __init__(self, def_output, match_cache_size=DEFAULT_MATCH_CACHE_SIZE):
         """init.
 
         Args:
             def_output (Output): Default output plugin
+            match_cache_size (int): Maximum number of cached pipelines.
         """
         super(DataRouter, self).__init__()
         self.rules = []
-        self.match_cache = {}
+        self.match_cache = LRUCache(match_cache_size)
+        self._trie = None
         assert isinstance(def_output, Output)
         self.def_output = def_output
 
@@ -166,7 +168,7 @@ class DataRouter(object):
         """
         return self.emit_stream(tag, OneDataStream(utime, record))
 
-    def emit_stream(self, tag, ds, stop_event):
+    def emit_stream(self, tag, ds, stop_event=None):
         """Emit an data stream with tag.
 
         Args:
@@ -177,7 +179,8 @@ class DataRouter(object):
         Returns:
             int: Adding size of the stream if succeeded, or None.
         """
-        logging.debug("emit_stream tag '{}' ds {}".format(tag, ds))
+        if trace.TRACE:
+            logging.debug("emit_stream tag '%s' ds %s", tag, ds)
         try:
             adding_size = self.match(tag).emit_stream(tag, ds, stop_event)
             return adding_size
@@ -201,6 +204,31 @@ class DataRouter(object):
             self.rules.insert(0, rule)
         else:
             self.rules.append(rule)
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop cached pipelines and rule trie.
+
+        Called when rules are changed, so that pipelines are rebuilt with
+         the new rules.
+        """
+        self._trie = None
+        if len(self.match_cache) > 0:
+            logging.info("DataRouter.invalidate - {} cached pipelines".
+                         format(len(self.match_cache)))
+        self.match_cache.invalidate()
+
+    def snapshot_stats(self):
+        """Return stats of rules and the pipeline cache.
+
+        Returns:
+            dict: Stat values.
+        """
+        cache = self.match_cache
+        return dict(rules=len(self.rules), cache_size=len(cache),
+                    cache_max_size=cache.max_size, cache_hits=cache.hits,
+                    cache_misses=cache.misses,
+                    cache_evictions=cache.evictions)
 
     def match(self, tag):
         """Match pipeline by tag.
@@ -211,15 +239,38 @@ class DataRouter(object):
         Returns:
             ``Pipeline``
         """
-        if tag not in self.match_cache:
-            logging.debug("DataRouter.match - not found in cache '{}'".
-                          format(tag))
+        pline = self.match_cache.get(tag)
+        if pline is None:
+            logging.debug("DataRouter.match - not found in cache '%s'", tag)
             pline = self.build_pipeline(tag)
             self.match_cache[tag] = pline
-        else:
-            pline = self.match_cache[tag]
         return pline
 
+    @property
+    def trie(self):
+        """Return a trie of all rule patterns, building it if needed.
+
+        Values of the trie are indices of rules.
+        """
+        if self._trie is None:
+            trie = TagTrie()
+            for idx, rule in enumerate(self.rules):
+                for ptrn in rule.patterns:
+                    trie.add(ptrn, idx)
+            self._trie = trie
+        return self._trie
+
+    def match_rules(self, tag):
+        """Return matching rules in order.
+
+        Args:
+            tag (str): data tag.
+
+        Returns:
+            list: Matching rules.
+        """
+        return [self.rules[idx] for idx in sorted(self.trie.match(tag))]
+
     def build_pipeline(self, tag):
         """Build a pipeline for tag and returns it.
 
@@ -231,9 +282,7 @@ class DataRouter(object):
         """
         logging.info("build_pipeline for tag '{}'".format(tag))
         pipeline = Pipeline(tag)
-        for rule in self.rules:
-            if not rule.match(tag):
-                continue
+        for rule in self.match_rules(tag):
             logging.info("matched tag '{}' rule {}".format(tag, rule))
             if isinstance(rule.collector, Modifier):
                 pipeline.add_modifier(rule.collector)
@@ -0,0 +1,149 @@
+"""This module implements file buffer."""
+
+import os
+import glob
+import logging
+
+from swak.buffer import Buffer, DiskChunk, DEFAULT_CHUNK_MAX_RECORD,\
+    DEFAULT_CHUNK_MAX_SIZE, DEFAULT_BUFFER_MAX_CHUNK, DEFAULT_FLUSH_WORKERS,\
+    DEFAULT_FLUSH_QUEUE_SIZE, DEFAULT_DRAIN_TIMEOUT, DEFAULT_RETRY_MAX,\
+    DEFAULT_RETRY_WAIT, DEFAULT_RETRY_MAX_WAIT, DEFAULT_BUFFER_MAX_SIZE,\
+    DEFAULT_OVERFLOW_ACTION, CHUNK_EXT, get_buffer_dir
+from swak.util import size_value
+from swak.exception import ConfigError
+
+
+FSYNC_POLICIES = ['never', 'chunk', 'always']
+DEFAULT_FSYNC = 'chunk'
+DEFAULT_WRITE_SIZE = '64k'
+
+
+class FileBuffer(Buffer):
+    """Buffer which store its chunks in files.
+
+    Each chunk is an append-only file in the buffer directory. Chunk files
+     left by the previous run are requeued ahead of new chunks when the buffer
+     starts, so buffered data survives a restart or an output outage.
+    """
+
+    def __init__(self, output, binary, path=None,
+                 chunk_max_record=DEFAULT_CHUNK_MAX_RECORD,
+                 chunk_max_size=DEFAULT_CHUNK_MAX_SIZE,
+                 buffer_max_chunk=DEFAULT_BUFFER_MAX_CHUNK,
+                 flush_interval=None, fsync=DEFAULT_FSYNC,
+                 write_size=DEFAULT_WRITE_SIZE, flush_at_shutdown=False,
+                 flush_workers=DEFAULT_FLUSH_WORKERS,
+                 flush_queue_size=DEFAULT_FLUSH_QUEUE_SIZE,
+                 drain_timeout=DEFAULT_DRAIN_TIMEOUT,
+                 retry_max=DEFAULT_RETRY_MAX, retry_wait=DEFAULT_RETRY_WAIT,
+                 retry_max_wait=DEFAULT_RETRY_MAX_WAIT, secondary=None,
+                 buffer_max_size=DEFAULT_BUFFER_MAX_SIZE,
+                 overflow_action=DEFAULT_OVERFLOW_ACTION):
+        """Init.
+
+        Args:
+            output (Output): An output.
+            binary (bool): Store data as binary or not.
+            path (str): Directory for chunk files. Defaults to
+              ``SWAK_HOME/buffer/TAG``.
+            chunk_max_record (int): Maximum records per chunk for slicing.
+            chunk_max_size (str): Maximum chunk size for slicing with suffix.
+            buffer_max_chunk (int): Maximum chunks per buffer for slicing.
+            flush_interval (str): Flush interval with time suffix.
+            fsync (str): When to fsync chunk files. ``never``, ``chunk``
+              (when a chunk is closed) or ``always`` (every append).
+            write_size (str): Bulk write size with size suffix.
+            flush_at_shutdown (bool): Flush all chunks at shutdown or leave
+              them for the next run.
+            flush_workers (int): Number of flush worker threads.
+            flush_queue_size (int): Maximum chunks waiting for each worker.
+            drain_timeout (str): Time to wait for workers to flush remaining
+              chunks when stopping, with time suffix. Chunks not flushed in
+              time are recovered at the next run.
+            retry_max (int): Maximum retries of a failed chunk. Retry
+              forever if None.
+            retry_wait (str): Wait before the first retry, with time suffix.
+            retry_max_wait (str): Maximum wait between retries, with time
+              suffix.
+            secondary: Output for chunks which exceeded ``retry_max``.
+            buffer_max_size (str): Maximum size of chunk files with suffix.
+            overflow_action (str): ``block`` or ``drop_oldest``.
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ConfigError("fsync must be one of {}.".
+                              format(', '.join(FSYNC_POLICIES)))
+        try:
+            write_size = size_value(write_size)
+        except ValueError as e:
+            raise ConfigError(str(e))
+        if write_size <= 0:
+            raise ConfigError("write_size must be greater than 0.")
+
+        self.path = path
+        self.fsync = fsync
+        self.write_size = write_size
+        super(FileBuffer, self).__init__(output, False, binary,
+                                         flush_at_shutdown, chunk_max_record,
+                                         chunk_max_size, buffer_max_chunk,
+                                         flush_interval, flush_workers,
+                                         flush_queue_size, drain_timeout,
+                                         retry_max, retry_wait,
+                                         retry_max_wait, secondary,
+                                         buffer_max_size, overflow_action)
+
+    @property
+    def chunk_dir(self):
+        """Return directory for chunk files."""
+        if self.path is not None:
+            return self.path
+        return get_buffer_dir(self.tag)
+
+    def new_chunk(self):
+        """New chunk."""
+        return DiskChunk(self.binary, self.new_file_path, self.fsync,
+                         self.write_size)
+
+    def new_file_path(self):
+        """Make a path for new chunk file in the chunk directory."""
+        return self.new_chunk_path(self.chunk_dir)
+
+    def start(self):
+        """Start buffer and requeue chunks of the previous run."""
+        super(FileBuffer, self).start()
+        if self.active_chunk.closed:
+            self.chunking()
+        self.recover()
+
+    def stop(self):
+        """Stop buffer and write all chunk data to files."""
+        super(FileBuffer, self).stop()
+        for chunk in self.chunks:
+            chunk.close()
+
+    def recover(self):
+        """Requeue chunk files in the buffer directory ahead of chunks.
+
+        Returns:
+            int: Number of requeued chunks.
+        """
+        known = set(chunk.path for chunk in self.chunks)
+        paths = sorted(glob.glob(os.path.join(self.chunk_dir,
+                                              '*' + CHUNK_EXT)))
+        recovered = []
+        for path in paths:
+            if path in known:
+                continue
+            chunk = DiskChunk.recover(self.binary, path)
+            if chunk.empty():
+                chunk.discard()
+                continue
+            # count the size, even if it exceeds the budget.
+            self.budget.force_reserve(chunk.bytesize)
+            recovered.append(chunk)
+
+        for chunk in reversed(recovered):
+            self.chunks.appendleft(chunk)
+        if len(recovered) > 0:
+            logging.info("FileBuffer.recover - {} chunks requeued from {}".
+                         format(len(recovered), self.chunk_dir))
+        return len(recovered)
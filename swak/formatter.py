@@ -1,8 +1,18 @@
 """This module implements formatters."""
 
+import math
+import json
 from datetime import datetime
 
 import pytz
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from swak.exception import ConfigError
+
+MAX_TIME_CACHE = 1024
 
 
 class Formatter(object):
@@ -21,6 +31,10 @@ class Formatter(object):
         """
         self.binary = binary
         self.localtime = localtime
+        # formatted datetime parts by time stamp second.
+        self.time_cache = {}
+        # tzinfo by minute of naive datetime.
+        self.tzinfo_cache = {}
         self.set_timezone(timezone)
         assert timezone is not None or time_format is None or\
             ('%z' not in time_format and '%Z' not in time_format), "You need"\
@@ -37,6 +51,8 @@ class Formatter(object):
             self.timezone = None
         else:
             self.timezone = pytz.timezone(timezone)
+        self.time_cache.clear()
+        self.tzinfo_cache.clear()
 
     def format(self, tag, dtime, record):
         """Format an event.
@@ -48,24 +64,122 @@ class Formatter(object):
         """
         raise NotImplemented()
 
+    def format_stream(self, tag, dtimes, records):
+        """Format a stream by columns.
+
+        Args:
+            tag (str): data tag.
+            dtimes (list): data datetimes.
+            records (list): data records.
+
+        Returns:
+            list: Formatted data. Bytes if the formatter is binary.
+        """
+        fmt = self.format
+        return [fmt(tag, dtime, record) for dtime, record in
+                zip(dtimes, records)]
+
     def timestamp_to_datetime(self, utime):
         """Convert UTC Unix time stamp to datetime.
 
+        Datetime parts without microsecond are cached by second, as most of
+         data in a stream share the same second.
+
         Args:
             utime (float): Unix time stamp
 
         Returns:
             str: Datetime string.
         """
+        # split like ``datetime.fromtimestamp`` does.
+        frac, sec = math.modf(utime)
+        usec = int(round(frac * 1e6))
+        if usec >= 1000000:
+            sec += 1
+            usec -= 1000000
+        elif usec < 0:
+            sec -= 1
+            usec += 1000000
+        sec = int(sec)
+
+        parts = self.time_cache.get(sec)
+        if parts is None:
+            parts = self._format_second(sec)
+        if parts is None:
+            # format depends on microsecond.
+            dtime = self._to_datetime(sec).replace(microsecond=usec)
+            return dtime.strftime(self.time_format).strip()
+        prefix, suffix = parts
+        if suffix is None:
+            return prefix
+        if usec == 0:
+            return prefix + suffix
+        return '{}.{:06d}{}'.format(prefix, usec, suffix)
+
+    def timestamps_to_datetimes(self, times):
+        """Convert a column of UTC Unix time stamps to datetimes.
+
+        Args:
+            times (array or list): Unix time stamps.
+
+        Returns:
+            list: Datetime strings.
+        """
+        convert = self.timestamp_to_datetime
+        result = []
+        append = result.append
+        last_utime = last_dtime = None
+        for utime in times:
+            if utime != last_utime:
+                last_utime = utime
+                last_dtime = convert(utime)
+            append(last_dtime)
+        return result
+
+    def _to_datetime(self, sec):
+        """Convert a time stamp second to datetime with timezone."""
         converter = datetime.fromtimestamp if self.localtime else\
             datetime.utcfromtimestamp
-        dtime = converter(utime)
+        dtime = converter(sec)
         if self.timezone is not None:
-            dtime = self.timezone.localize(dtime)
+            dtime = dtime.replace(tzinfo=self._tzinfo(dtime))
+        return dtime
+
+    def _tzinfo(self, dtime):
+        """Return tzinfo to localize naive datetime.
+
+        UTC offset only changes at DST transitions, so tzinfo is computed once
+         per minute of naive datetime.
+        """
+        minute = dtime.replace(second=0)
+        tzinfo = self.tzinfo_cache.get(minute)
+        if tzinfo is None:
+            if len(self.tzinfo_cache) >= MAX_TIME_CACHE:
+                self.tzinfo_cache.clear()
+            tzinfo = self.timezone.localize(dtime).tzinfo
+            self.tzinfo_cache[minute] = tzinfo
+        return tzinfo
+
+    def _format_second(self, sec):
+        """Format a time stamp second and cache the result.
+
+        Returns:
+            tuple: Datetime prefix and suffix around microsecond part. Suffix
+              is None if the prefix is the whole. None if the time format
+              depends on microsecond.
+        """
+        if self.time_format is not None and '%f' in self.time_format:
+            return None
+        dtime = self._to_datetime(sec)
         if self.time_format is None:
-            return dtime.isoformat()
+            iso = dtime.isoformat()
+            parts = (iso[:19], iso[19:])
         else:
-            return dtime.strftime(self.time_format).strip()
+            parts = (dtime.strftime(self.time_format).strip(), None)
+        if len(self.time_cache) >= MAX_TIME_CACHE:
+            self.time_cache.clear()
+        self.time_cache[sec] = parts
+        return parts
 
 
 class StdoutFormatter(Formatter):
@@ -93,3 +207,106 @@ class StdoutFormatter(Formatter):
         """
         return "{dtime}\t{tag}\t{record}".format(dtime=dtime, tag=tag,
                                                  record=record)
+
+
+class RecordFormatter(Formatter):
+    """Base class for formatters which serialize records to bytes.
+
+    Datetime and tag are added to the record by their keys.
+    """
+
+    def __init__(self, localtime=True, timezone=None, time_format=None,
+                 time_key='time', tag_key='tag'):
+        """Init.
+
+        Args:
+            localtime (bool): Convert timestamp as local datetime or not.
+            timezone (str): Attach timezone to converted datetime.
+            time_format (str): Time format.
+            time_key (str): Record key for datetime. Not added if None.
+            tag_key (str): Record key for tag. Not added if None.
+        """
+        super(RecordFormatter, self).__init__(True, localtime, timezone,
+                                              time_format)
+        self.time_key = time_key
+        self.tag_key = tag_key
+
+    def make_record(self, tag, dtime, record):
+        """Make a record to serialize with datetime and tag."""
+        if self.time_key is None and self.tag_key is None:
+            return record
+        record = dict(record)
+        if self.time_key is not None:
+            record[self.time_key] = dtime
+        if self.tag_key is not None:
+            record[self.tag_key] = tag
+        return record
+
+    def format(self, tag, dtime, record):
+        """Format an data.
+
+        Args:
+            tag (str): data tag
+            dtime (datetime): data datetime
+            record (dict): data record
+
+        Returns:
+            bytes: Serialized record.
+        """
+        return self.serialize(self.make_record(tag, dtime, record))
+
+    def format_stream(self, tag, dtimes, records):
+        """Format a stream by columns.
+
+        Args:
+            tag (str): data tag.
+            dtimes (list): data datetimes.
+            records (list): data records.
+
+        Returns:
+            list: Serialized records.
+        """
+        serialize = self.serialize
+        make_record = self.make_record
+        return [serialize(make_record(tag, dtime, record)) for dtime, record
+                in zip(dtimes, records)]
+
+    def serialize(self, record):
+        """Serialize a record into bytes."""
+        raise NotImplementedError()
+
+
+class JsonFormatter(RecordFormatter):
+    """Formatter class for JSON lines."""
+
+    def __init__(self, localtime=True, timezone=None, time_format=None,
+                 time_key='time', tag_key='tag'):
+        """Init."""
+        super(JsonFormatter, self).__init__(localtime, timezone, time_format,
+                                            time_key, tag_key)
+        self.encode = json.JSONEncoder(ensure_ascii=False,
+                                       separators=(',', ':'),
+                                       default=str).encode
+
+    def serialize(self, record):
+        """Serialize a record into a JSON line.
+
+        The JSON string is encoded to utf8 once, as the json module makes
+         a string.
+        """
+        return (self.encode(record) + '\n').encode('utf8')
+
+
+class MessagePackFormatter(RecordFormatter):
+    """Formatter class for MessagePack."""
+
+    def __init__(self, localtime=True, timezone=None, time_format=None,
+                 time_key='time', tag_key='tag'):
+        """Init."""
+        if msgpack is None:
+            raise ConfigError("MessagePack formatter requires msgpack "
+                              "package.")
+        super(MessagePackFormatter, self).__init__(localtime, timezone,
+                                                   time_format, time_key,
+                                                   tag_key)
+        self.serialize = msgpack.Packer(use_bin_type=True, default=str).pack
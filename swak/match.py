@@ -21,14 +21,13 @@ class MatchPattern(object):
 class AllMatchPattern(MatchPattern):
     """AllMatchPattern class."""
 
-    def __init__(self, arg):
-        """init."""
-        super(AllMatchPattern, self).__init__()
-        self.arg = arg
+    def match(self, strn):
+        """Match any string."""
+        return True
 
     def __repr__(self):
         """Canonical string representation."""
-        return "<AllMatchPattern arg '{}'>".format(self.arg)
+        return "<AllMatchPattern>"
 
 
 class GlobMatchPattern(MatchPattern):
@@ -91,7 +90,7 @@ class GlobMatchPattern(MatchPattern):
             elif re.search(r'[a-zA-Z0-9_]', c) is not None:
                 regex[-1] += c
             else:
-                regex[-1] += "\\#{}".format(c)
+                regex[-1] += re.escape(c)
 
             i += 1
 
@@ -110,7 +109,7 @@ class GlobMatchPattern(MatchPattern):
         Returns:
             (bool): True if string matches.
         """
-        return len(self.regex.findall(strn)) > 0
+        return self.regex.match(strn) is not None
 
     def __repr__(self):
         """Canonical string representation."""
@@ -141,8 +140,176 @@ class OrMatchPattern(MatchPattern):
         for pattern in self.patterns:
             if pattern.match(strn):
                 return True
+        return False
 
     def __repr__(self):
         """Canonical string representation."""
         pats = [repr(pat) for pat in self.patterns]
         return "<OrMatchPattern {}>".format(', '.join(pats))
+
+
+def expand_braces(pat):
+    """Expand or(brace) patterns into multiple patterns.
+
+    Args:
+        pat (str): Glob pattern.
+
+    Returns:
+        list: Glob patterns without braces, or None if the pattern can not be
+          expanded.
+    """
+    if '\\' in pat:
+        return None
+    start = pat.find('{')
+    if start < 0:
+        return None if '}' in pat or ',' in pat else [pat]
+    depth = 0
+    alts = []
+    last = start + 1
+    for i in range(start, len(pat)):
+        c = pat[i]
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                alts.append(pat[last:i])
+                break
+        elif c == ',' and depth == 1:
+            alts.append(pat[last:i])
+            last = i + 1
+    else:
+        # unbalanced
+        return None
+    if '}' in pat[:start] or ',' in pat[:start]:
+        return None
+    result = []
+    for alt in alts:
+        expanded = expand_braces(pat[:start] + alt + pat[i + 1:])
+        if expanded is None:
+            return None
+        result += expanded
+    return result
+
+
+class _TrieNode(object):
+    """Node of TagTrie."""
+
+    __slots__ = ('children', 'wildcards', 'recursive', 'loop', 'values')
+
+    def __init__(self, loop=False):
+        self.children = {}
+        self.wildcards = []
+        self.recursive = None
+        # Whether this node is reached by recursive wildcard, which consumes
+        #  any number of segments.
+        self.loop = loop
+        self.values = []
+
+
+class TagTrie(object):
+    """Trie of tag patterns by dot seperated segments.
+
+    Matching a tag walks the trie once by the segments of the tag, and
+     returns values of all matching patterns. A segment of pattern can be a
+     literal, a wildcard(``*``) in a segment, or a recursive wildcard(``**``).
+     Braces are expanded into multiple patterns. Patterns which can not be
+     split by segments, like ``a**``, are matched by regular expression.
+    """
+
+    def __init__(self):
+        """Init."""
+        self.root = _TrieNode()
+        self.fallbacks = []
+
+    def add(self, pat, value):
+        """Add a pattern.
+
+        Args:
+            pat (str): Glob pattern.
+            value: Value for the pattern.
+        """
+        pats = expand_braces(pat)
+        if pats is None or not all(self._add(apat, value) for apat in
+                                   pats):
+            self.fallbacks.append((GlobMatchPattern(pat), value))
+
+    def _add(self, pat, value):
+        segs = pat.split('.')
+        for seg in segs:
+            if seg == '' or ('**' in seg and seg != '**'):
+                return False
+
+        node = self.root
+        for seg in segs:
+            if seg == '**':
+                if node.recursive is None:
+                    node.recursive = _TrieNode(True)
+                node = node.recursive
+            elif '*' in seg:
+                regex = ''.join('[^.]*' if c == '*' else re.escape(c) for c in
+                                seg)
+                regex = re.compile('^{}$'.format(regex))
+                for wregex, child in node.wildcards:
+                    if wregex.pattern == regex.pattern:
+                        node = child
+                        break
+                else:
+                    child = _TrieNode()
+                    node.wildcards.append((regex, child))
+                    node = child
+            else:
+                if seg not in node.children:
+                    node.children[seg] = _TrieNode()
+                node = node.children[seg]
+        if value not in node.values:
+            node.values.append(value)
+        return True
+
+    @staticmethod
+    def _closure(nodes):
+        """Add nodes reachable without consuming a segment."""
+        result = []
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if node in result:
+                continue
+            result.append(node)
+            if node.recursive is not None:
+                stack.append(node.recursive)
+        return result
+
+    def match(self, tag):
+        """Match a tag.
+
+        Args:
+            tag (str): data tag.
+
+        Returns:
+            set: Values of matching patterns.
+        """
+        nodes = self._closure([self.root])
+        for seg in tag.split('.'):
+            nexts = []
+            for node in nodes:
+                if node.loop:
+                    nexts.append(node)
+                child = node.children.get(seg)
+                if child is not None:
+                    nexts.append(child)
+                for regex, child in node.wildcards:
+                    if regex.match(seg) is not None:
+                        nexts.append(child)
+            if len(nexts) == 0:
+                nodes = nexts
+                break
+            nodes = self._closure(nexts)
+
+        values = set()
+        for node in nodes:
+            values.update(node.values)
+        for pattern, value in self.fallbacks:
+            if value not in values and pattern.match(tag):
+                values.add(value)
+        return values
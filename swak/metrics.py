@@ -0,0 +1,187 @@
+"""This module implements metrics."""
+
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+# Upper bounds of latency histogram buckets in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """Histogram of values with fixed buckets."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """Init.
+
+        Args:
+            bounds (tuple): Sorted upper bounds of buckets. Values greater
+              than the last bound are counted in an extra bucket.
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Count a value.
+
+        Args:
+            value (float): A value to count.
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        """Add counts of another histogram with the same bounds.
+
+        Args:
+            other (Histogram): A histogram to add.
+        """
+        assert other.bounds == self.bounds
+        for idx, cnt in enumerate(other.counts):
+            self.counts[idx] += cnt
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """Estimate a quantile of the values.
+
+        The value is interpolated linearly within the bucket the quantile
+         falls in, assuming the values are spread evenly in it.
+
+        Args:
+            q (float): Quantile between 0 and 1.
+
+        Returns:
+            float: Estimated value, or None if no value is counted. The last
+              bound if the quantile falls in the extra bucket.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cum = 0
+        for idx, cnt in enumerate(self.counts):
+            if cnt > 0 and cum + cnt >= rank:
+                if idx == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[idx - 1] if idx > 0 else 0.0
+                upper = self.bounds[idx]
+                return lower + (upper - lower) * (rank - cum) / cnt
+            cum += cnt
+        return self.bounds[-1]
+
+    def snapshot(self):
+        """Return counts of the histogram.
+
+        Returns:
+            dict: Total count, sum and count of each bucket by upper bound.
+              The last bucket's bound is ``inf``.
+        """
+        bounds = [str(bound) for bound in self.bounds] + ['inf']
+        return dict(count=self.count, sum=self.sum,
+                    buckets=OrderedDict(zip(bounds, self.counts)))
+
+
+class PluginMetrics(object):
+    """Counters of a plugin.
+
+    Counters are increased once per batch, not per record, so that counting
+     costs little.
+    """
+
+    __slots__ = ('batches', 'records_in', 'records_out', 'bytes_in',
+                 'bytes_out', 'latency')
+
+    def __init__(self):
+        """Init."""
+        self.batches = 0
+        self.records_in = 0
+        self.records_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # Histogram of plugin specific latency, if the plugin measures one.
+        self.latency = None
+
+    def count(self, records_in, records_out, bytes_in=0, bytes_out=0):
+        """Count a batch.
+
+        Args:
+            records_in (int): Number of records received.
+            records_out (int): Number of records passed on.
+            bytes_in (int): Bytes received.
+            bytes_out (int): Bytes passed on.
+        """
+        self.batches += 1
+        self.records_in += records_in
+        self.records_out += records_out
+        self.bytes_in += bytes_in
+        if bytes_out:
+            # may be counted by flush workers of a buffer at the same time.
+            self.bytes_out += bytes_out
+
+    def snapshot(self):
+        """Return values of counters.
+
+        Returns:
+            dict: Counters with ``dropped``, which is records received but
+              not passed on.
+        """
+        snap = dict(batches=self.batches, records_in=self.records_in,
+                    records_out=self.records_out, bytes_in=self.bytes_in,
+                    bytes_out=self.bytes_out)
+        if self.records_in > 0:
+            snap['dropped'] = max(self.records_in - self.records_out, 0)
+        if self.latency is not None:
+            snap['latency'] = self.latency.snapshot()
+        return snap
+
+
+class MetricsRegistry(object):
+    """Registry of metric sources.
+
+    A source is a function which returns a dictionary of current values. The
+     registry calls them only when a snapshot is taken.
+    """
+
+    def __init__(self):
+        """Init."""
+        self.sources = OrderedDict()
+
+    def register(self, name, source):
+        """Register a metric source.
+
+        Args:
+            name (str): Name of the source. A suffix is added if the name has
+              already been registered.
+            source (function): Returns a dictionary of current values.
+
+        Returns:
+            str: Registered name.
+        """
+        uname = name
+        idx = 1
+        while uname in self.sources:
+            idx += 1
+            uname = "{}#{}".format(name, idx)
+        self.sources[uname] = source
+        return uname
+
+    def unregister(self, name):
+        """Unregister a metric source."""
+        del self.sources[name]
+
+    def snapshot(self):
+        """Take a snapshot of all sources.
+
+        Returns:
+            dict: Snapshot time and values of each source by name.
+        """
+        metrics = OrderedDict()
+        for name, source in list(self.sources.items()):
+            metrics[name] = source()
+        return dict(time=time.time(), metrics=metrics)
@@ -0,0 +1,283 @@
+"""This module implements micro-benchmarks of hot paths.
+
+Each benchmark runs one code path in isolation, without threads. Results are
+ saved as JSON, so that a baseline can be compared with later results.
+"""
+
+import time
+import platform
+from fnmatch import fnmatch
+from collections import OrderedDict
+
+from six.moves.queue import Empty
+
+from swak.data import MultiDataStream
+from swak.match import GlobMatchPattern
+from swak.datarouter import DataRouter
+from swak.formatter import StdoutFormatter, JsonFormatter
+from swak.memorybuffer import MemoryBuffer
+from swak.plugin import ProxyOutput, ProxyQueue
+from swak.stdplugins.null.o_null import Null
+from swak.stdplugins.filter.m_filter import Filter
+from swak.stdplugins.reform.m_reform import Reform
+
+# Minimum seconds of a measurement.
+DEFAULT_MIN_TIME = 0.2
+DEFAULT_REPEAT = 5
+# Allowed slowdown ratio against baseline.
+DEFAULT_MAX_SLOWDOWN = 0.2
+BATCH_RECORD = 1000
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """Register a benchmark.
+
+    The decorated function sets up a benchmark, and returns a function to
+     measure and the number of operations it runs per call.
+
+    Args:
+        name (str): Benchmark name.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def make_stream(cnt=BATCH_RECORD):
+    """Make a data stream of sample records."""
+    now = time.time()
+    times = [now + i * 0.001 for i in range(cnt)]
+    records = [dict(f1=str(i), f2='value', f3=i) for i in range(cnt)]
+    return MultiDataStream(times, records)
+
+
+def make_tags(cnt):
+    """Make sample tags."""
+    return ['svc{}.app{}.log'.format(i % 10, i) for i in range(cnt)]
+
+
+def make_router():
+    """Make a data router with outputs for different tags."""
+    router = DataRouter(Null())
+    for i in range(10):
+        router.add_rule('svc{}.**'.format(i), Null(), False)
+    router.add_rule('other.*', Null(), False)
+    return router
+
+
+@benchmark('match.glob')
+def bench_match_glob():
+    """Match tags with a glob pattern."""
+    match = GlobMatchPattern('svc*.{app1,app2}*.**').match
+    tags = make_tags(100)
+
+    def run():
+        for tag in tags:
+            match(tag)
+    return run, len(tags)
+
+
+@benchmark('router.match_hot')
+def bench_router_match_hot():
+    """Match tags with pipelines in cache."""
+    router = make_router()
+    tags = make_tags(100)
+    for tag in tags:
+        router.match(tag)
+
+    def run():
+        for tag in tags:
+            router.match(tag)
+    return run, len(tags)
+
+
+@benchmark('router.match_cold')
+def bench_router_match_cold():
+    """Match tags building pipelines."""
+    router = make_router()
+    tags = make_tags(100)
+
+    def run():
+        router.match_cache.invalidate()
+        for tag in tags:
+            router.match(tag)
+    return run, len(tags)
+
+
+def bench_pipeline(modifier):
+    """Benchmark of modifying a stream through a pipeline."""
+    router = DataRouter(Null())
+    router.add_rule('test', modifier, False)
+    router.add_rule('test', Null(), False)
+    pipeline = router.match('test')
+    ds = make_stream()
+
+    def run():
+        pipeline.modify_stream('test', ds)
+    return run, len(ds)
+
+
+@benchmark('pipeline.filter')
+def bench_pipeline_filter():
+    """Modify a stream with m.filter."""
+    return bench_pipeline(Filter([('f1', '^[1-5]')], [('f2', 'none')]))
+
+
+@benchmark('pipeline.reform')
+def bench_pipeline_reform():
+    """Modify a stream with m.reform.
+
+    Records are modified in place, so only writes are used to reuse the
+     stream.
+    """
+    return bench_pipeline(Reform([('host', '${hostname}'),
+                                  ('svc', '${tag_parts[0]}'),
+                                  ('f4', '${record[f1]}')]))
+
+
+@benchmark('formatter.stdout')
+def bench_formatter_stdout():
+    """Format records with time conversion."""
+    formatter = StdoutFormatter()
+    ds = make_stream()
+    to_datetime = formatter.timestamp_to_datetime
+    fmt = formatter.format
+
+    def run():
+        for utime, record in ds:
+            fmt('test', to_datetime(utime), record)
+    return run, len(ds)
+
+
+def bench_buffer_append(binary):
+    """Benchmark of appending formatted data to a new memory buffer."""
+    formatter = JsonFormatter() if binary else StdoutFormatter()
+    ds = make_stream()
+    dtimes = formatter.timestamps_to_datetimes(ds.times)
+    datas = formatter.format_stream('test', dtimes, ds.records)
+
+    def run():
+        append = MemoryBuffer(None, binary).append
+        for data in datas:
+            append(data, binary)
+    return run, len(datas)
+
+
+@benchmark('buffer.append_text')
+def bench_buffer_append_text():
+    """Append text data to a memory buffer."""
+    return bench_buffer_append(False)
+
+
+@benchmark('buffer.append_binary')
+def bench_buffer_append_binary():
+    """Append binary data to a memory buffer."""
+    return bench_buffer_append(True)
+
+
+@benchmark('proxy.emit_stream')
+def bench_proxy_emit_stream():
+    """Hand off a stream through ProxyOutput and its queue."""
+    queue = ProxyQueue()
+    proxy = ProxyOutput(queue)
+    ds = make_stream()
+
+    def run():
+        proxy.emit_stream('test', ds, None)
+        try:
+            while True:
+                queue.get_nowait()
+        except Empty:
+            pass
+    return run, len(ds)
+
+
+def measure(func, min_time=DEFAULT_MIN_TIME, repeat=DEFAULT_REPEAT):
+    """Measure a function.
+
+    Loops are doubled until a measurement takes ``min_time``, then the best
+     of ``repeat`` measurements is taken.
+
+    Args:
+        func (function): Function to measure.
+        min_time (float): Minimum seconds of a measurement.
+        repeat (int): Number of measurements.
+
+    Returns:
+        float: Seconds per call.
+        int: Loops of a measurement.
+    """
+    def timeit(loops):
+        st = time.perf_counter()
+        for _ in range(loops):
+            func()
+        return time.perf_counter() - st
+
+    loops = 1
+    elapsed = timeit(loops)
+    while elapsed < min_time:
+        loops *= 2
+        elapsed = timeit(loops)
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, timeit(loops))
+    return best / loops, loops
+
+
+def run_benchmarks(patterns=None, min_time=DEFAULT_MIN_TIME,
+                   repeat=DEFAULT_REPEAT):
+    """Run benchmarks.
+
+    Args:
+        patterns (list): Glob patterns of benchmark names to run. All if
+          None or empty.
+        min_time (float): Minimum seconds of a measurement.
+        repeat (int): Number of measurements.
+
+    Returns:
+        dict: Environment and results by benchmark name. A result has
+          seconds per operation, operations per call and loops.
+    """
+    results = OrderedDict()
+    for name, setup in BENCHMARKS.items():
+        if patterns and not any(fnmatch(name, ptrn) for ptrn in patterns):
+            continue
+        func, ops = setup()
+        per_call, loops = measure(func, min_time, repeat)
+        results[name] = OrderedDict([('per_op', per_call / ops),
+                                     ('ops', ops), ('loops', loops)])
+    return dict(python=platform.python_version(),
+                platform=platform.platform(), time=time.time(),
+                benchmarks=results)
+
+
+def compare_results(baseline, current, max_slowdown=DEFAULT_MAX_SLOWDOWN,
+                    slowdowns=None):
+    """Compare benchmark results with a baseline.
+
+    Args:
+        baseline (dict): Baseline results from ``run_benchmarks``.
+        current (dict): Current results from ``run_benchmarks``.
+        max_slowdown (float): Allowed slowdown ratio. 0.2 allows 20% slower.
+        slowdowns (dict): Allowed slowdown ratio by benchmark name, over
+          ``max_slowdown``.
+
+    Returns:
+        list: (name, baseline per_op, current per_op, ratio, passed) tuples
+          of benchmarks in both results.
+    """
+    slowdowns = slowdowns or {}
+    rows = []
+    base_benchs = baseline['benchmarks']
+    for name, result in current['benchmarks'].items():
+        if name not in base_benchs:
+            continue
+        base = base_benchs[name]['per_op']
+        ratio = result['per_op'] / base
+        allowed = slowdowns.get(name, max_slowdown)
+        rows.append((name, base, result['per_op'], ratio,
+                     ratio <= 1 + allowed))
+    return rows
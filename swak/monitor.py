@@ -0,0 +1,204 @@
+"""This module implements monitor server."""
+
+import os
+import json
+import socket
+import logging
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+
+from swak import trace
+
+DEFAULT_MONITOR_HOST = '127.0.0.1'
+
+
+class MonitorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Request handler of monitor server.
+
+    Serves a snapshot of the agent's stats as JSON at ``/`` and ``/stats``.
+     Tracing of the agent is turned on or off by POST to ``/trace/on`` or
+     ``/trace/off``.
+    """
+
+    def do_GET(self):  # NOQA
+        """Handle GET request."""
+        path = self.path.split('?')[0].rstrip('/')
+        if path not in ('', '/stats'):
+            self.send_error(404)
+            return
+        try:
+            stats = self.server.stats_fn()
+        except Exception as e:
+            logging.error("MonitorHandler - snapshot failed: {}".format(e))
+            self.send_error(500)
+            return
+        self.send_json(stats)
+
+    def do_POST(self):  # NOQA
+        """Handle POST request."""
+        path = self.path.split('?')[0].rstrip('/')
+        if path not in ('/trace/on', '/trace/off'):
+            self.send_error(404)
+            return
+        self.server.trace_fn(path == '/trace/on')
+        self.send_json(dict(trace=trace.TRACE))
+
+    def send_json(self, obj):
+        """Send an object as JSON response."""
+        body = json.dumps(obj).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        """Return client address, which is empty for a Unix socket."""
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, fmt, *args):
+        """Log requests to the logger, not to stderr."""
+        logging.debug("MonitorHandler - " + fmt, *args)
+
+
+class TCPMonitorServer(socketserver.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    """HTTP monitor server on a TCP port."""
+
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class UnixMonitorServer(socketserver.ThreadingMixIn,
+                            socketserver.UnixStreamServer):
+        """HTTP monitor server on a Unix domain socket."""
+
+        daemon_threads = True
+else:
+    UnixMonitorServer = None
+
+
+class MonitorServer(object):
+    """Monitor server embedded in a service agent.
+
+    Runs an HTTP server in a daemon thread, which calls the stats function
+     for each request. The server listens either on a TCP port of a host, or
+     on a Unix domain socket.
+    """
+
+    def __init__(self, stats_fn, host=DEFAULT_MONITOR_HOST, port=None,
+                 unix_socket=None, trace_fn=trace.set_trace):
+        """Init.
+
+        Args:
+            stats_fn (function): Returns a dictionary of stats to serve.
+            host (str): Host address to listen on.
+            port (int): TCP port to listen on. A free port is chosen if 0.
+            unix_socket (str): Unix domain socket path to listen on, instead
+              of a TCP port.
+            trace_fn (function): Turns tracing on or off by the argument.
+              Defaults to the switch of this process.
+        """
+        assert (port is None) != (unix_socket is None)
+        self.stats_fn = stats_fn
+        self.trace_fn = trace_fn
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.server = None
+        self.thread = None
+
+    @property
+    def address(self):
+        """Return the listening address.
+
+        Returns:
+            tuple or str: (host, port) or Unix socket path.
+        """
+        if self.server is None:
+            return None
+        return self.server.server_address
+
+    def start(self):
+        """Start the server."""
+        if self.unix_socket is not None:
+            if UnixMonitorServer is None:
+                raise RuntimeError("Unix domain socket is not supported.")
+            if os.path.exists(self.unix_socket):
+                # Left by a process which was not shut down properly.
+                os.remove(self.unix_socket)
+            server = UnixMonitorServer(self.unix_socket, MonitorHandler)
+        else:
+            server = TCPMonitorServer((self.host, self.port), MonitorHandler)
+        server.stats_fn = self.stats_fn
+        server.trace_fn = self.trace_fn
+        self.server = server
+        logging.info("start monitor server at {}".format(self.address))
+        self.thread = threading.Thread(target=server.serve_forever,
+                                       name="MonTrd")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        """Shut down the server."""
+        if self.server is None:
+            return
+        logging.info("shutting down monitor server")
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+        self.server = None
+
+
+def request_stats(address):
+    """Request stats to a monitor server.
+
+    Args:
+        address (tuple or str): (host, port) or Unix socket path.
+
+    Returns:
+        dict: Stats of the agent.
+    """
+    return _request(address, 'GET', '/stats')
+
+
+def request_trace(address, enable):
+    """Request a monitor server to turn tracing on or off.
+
+    Args:
+        address (tuple or str): (host, port) or Unix socket path.
+        enable (bool): Whether to trace or not.
+
+    Returns:
+        dict: Tracing state of the agent.
+    """
+    return _request(address, 'POST', '/trace/on' if enable else '/trace/off')
+
+
+def _request(address, method, path):
+    family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        req = "{} {} HTTP/1.0\r\nContent-Length: 0\r\n\r\n".format(method,
+                                                                   path)
+        sock.sendall(req.encode('utf8'))
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    header, _, body = b''.join(chunks).partition(b'\r\n\r\n')
+    status = header.split(b'\r\n')[0]
+    if b' 200 ' not in status:
+        raise IOError("monitor server responded '{}'".
+                      format(status.decode('utf8')))
+    return json.loads(body.decode('utf8'))
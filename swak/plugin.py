@@ -7,17 +7,28 @@ from collections import namedtuple
 import logging
 import types
 import time
-from queue import Empty, Full
+import threading
+from array import array
+from queue import Queue, Empty, Full
 
 from swak.config import get_exe_dir
 from swak.exception import UnsupportedPython
 from swak.const import PLUGINDIR_PREFIX
 from swak.formatter import StdoutFormatter
-from swak.util import get_plugin_module_name, stop_iter_when_signalled
-from swak.data import OneDataStream
+from swak.util import get_plugin_module_name, is_signalled, size_value,\
+    is_coroutine_function
+from swak.data import MultiDataStream
+from swak.metrics import PluginMetrics, Histogram
+from swak import trace
 
 
 PUT_WAIT_TIME = 1.0
+MAX_WAIT_TIME = 1.0
+POLL_WAIT_TIME = 0.05
+PROXY_BATCH_RECORD = 1000
+DEFAULT_BATCH_MAX_RECORD = 1000
+DEFAULT_BATCH_MAX_SIZE = '1m'
+DEFAULT_BATCH_MAX_LATENCY = 0.1
 PREFIX = ['i', 'p', 'm', 'o']
 
 PluginInfo = namedtuple('PluginInfo', ['fname', 'pname', 'dname', 'cname',
@@ -31,11 +42,20 @@ class Plugin(object):
         """Init."""
         self.started = self.shutdowned = False
         self.tag = None
+        self.metrics = PluginMetrics()
 
     def set_tag(self, tag):
         """Set tag."""
         self.tag = tag
 
+    def snapshot_metrics(self):
+        """Return current values of the plugin's metrics.
+
+        Returns:
+            dict: Metric values.
+        """
+        return self.metrics.snapshot()
+
     def start(self):
         """Start plugin.
 
@@ -99,6 +119,56 @@ class Input(Plugin):
         super(Input, self).__init__()
         self.encoding = None
         self.proxy = False
+        self.wait_timeout_fn = None
+        self.batch_max_record = DEFAULT_BATCH_MAX_RECORD
+        self.batch_max_size = size_value(DEFAULT_BATCH_MAX_SIZE)
+        self.batch_max_latency = DEFAULT_BATCH_MAX_LATENCY
+
+    @property
+    def is_async(self):
+        """Whether this input can generate data in an event loop."""
+        return False
+
+    def set_wait_timeout_func(self, func):
+        """Set function which tells how long to wait for data.
+
+        Args:
+            func (function): Returns seconds until next flushing is due, or
+              None if there is no due.
+        """
+        self.wait_timeout_fn = func
+
+    def wait_timeout(self, max_wait=MAX_WAIT_TIME):
+        """Return seconds to wait for data.
+
+        Args:
+            max_wait (float): Maximum seconds to wait.
+        """
+        if self.wait_timeout_fn is None:
+            return max_wait
+        timeout = self.wait_timeout_fn()
+        if timeout is None:
+            return max_wait
+        return min(max(timeout, 0.0), max_wait)
+
+    def set_batch(self, max_record=None, max_size=None, max_latency=None):
+        """Set limits of a data stream batch.
+
+        A batch is yielded when any of the limits is reached. Omitted limits
+         keep their current values.
+
+        Args:
+            max_record (int): Maximum records per batch.
+            max_size (str): Maximum data size per batch with size suffix.
+            max_latency (float): Maximum seconds to hold the first data of a
+              batch.
+        """
+        if max_record is not None:
+            self.batch_max_record = max_record
+        if max_size is not None:
+            self.batch_max_size = size_value(max_size)
+        if max_latency is not None:
+            self.batch_max_latency = max_latency
 
     def read(self, stop_event):
         """Generate data stream.
@@ -115,6 +185,19 @@ class Input(Plugin):
         for tag, ds in self.generate_stream(self.generate_data, stop_event):
             yield tag, ds
 
+    def aread(self, stop_event):
+        """Generate data stream in an event loop.
+
+        Args:
+            stop_event (threading.Event): Stop event
+
+        Returns:
+            An asynchronous generator of (tag, DataStream) tuples.
+        """
+        from swak.aio import agenerate_stream
+        logging.debug("Input.aread")
+        return agenerate_stream(self, self.agenerate_data, stop_event)
+
     def generate_data(self):
         """Generate data.
 
@@ -123,10 +206,34 @@ class Input(Plugin):
         """
         raise NotImplementedError()
 
+    def agenerate_data(self, stop_event):
+        """Generate data asynchronously.
+
+        Returns:
+            An asynchronous generator of (time, data) tuples.
+        """
+        raise NotImplementedError()
+
+    def data_size(self, data):
+        """Return size of data to limit batch size.
+
+        Args:
+            data (dict or str): Generated data.
+
+        Returns:
+            int: Size of string data, 0 for others.
+        """
+        if isinstance(data, (str, bytes)):
+            return len(data)
+        return 0
+
     def generate_stream(self, gen_data, stop_event):
         """Generate data stream from data generator.
 
-        Inefficient default implementation.
+        Collect data into a MultiDataStream and yield it when any of the batch
+        limits is reached. The latency limit is checked whenever the generator
+        yields, so asynchronous generators which yield empty data under
+        blocking situations get their batch yielded in time.
 
         Args:
             gen_data (function): Data generator function.
@@ -136,15 +243,68 @@ class Input(Plugin):
             tuple: (tag, DataStream)
         """
         logging.debug("Input.generate_stream gen_data {}".format(gen_data))
+        max_record = self.batch_max_record
+        max_size = self.batch_max_size
+        max_latency = self.batch_max_latency
+        data_size = self.data_size
+
+        ds = MultiDataStream()
+        size = 0
+        deadline = None
         for utime, data in gen_data(stop_event):
             # Omit blank data that would have been generated under
             #  inappropriate input conditions.
-            if len(data) == 0:
-                continue
-            logging.warning("yield inefficient OneDataStream from {}. "
-                            "Implement optimized generate_stream!.".
-                            format(self))
-            yield self.tag, OneDataStream(utime, data)
+            if len(data) > 0:
+                ds.append(utime, data)
+                if deadline is None and max_latency is not None:
+                    deadline = time.time() + max_latency
+                if max_size is not None:
+                    size += data_size(data)
+                    if size >= max_size:
+                        deadline = 0
+                if max_record is not None and len(ds) >= max_record:
+                    deadline = 0
+            if deadline is not None and (deadline == 0 or
+                                         time.time() >= deadline):
+                self.metrics.count(0, len(ds), 0, size)
+                yield self.tag, ds
+                ds = MultiDataStream()
+                size = 0
+                deadline = None
+
+        # yield remain data
+        if not ds.empty():
+            self.metrics.count(0, len(ds), 0, size)
+            yield self.tag, ds
+
+
+class ProxyQueue(Queue):
+    """Inter-thread queue which wakes up its receiver on put.
+
+    This class is used in the aggregated thread model.
+    """
+
+    def __init__(self, maxsize=0):
+        """Init.
+
+        Args:
+            maxsize (int): Maximum number of items in the queue.
+        """
+        Queue.__init__(self, maxsize)
+        self.wakeup = None
+
+    def set_wakeup(self, event):
+        """Set an event to set whenever an item is put.
+
+        Args:
+            event (threading.Event): Wakeup event of the receiver.
+        """
+        self.wakeup = event
+
+    def _put(self, item):
+        Queue._put(self, item)
+        if self.wakeup is not None:
+            self.wakeup.set()
 
 
 class ProxyInput(Input):
@@ -158,23 +318,54 @@ class ProxyInput(Input):
         super(ProxyInput, self).__init__()
         self.recv_queues = {}
         self.proxy = True
+        self.wakeup = threading.Event()
+        # Notifier of ring queues, which are waited on instead of wakeup.
+        self.notifier = None
+        self.polling = False
 
     def append_recv_queue(self, tag, queue):
         """Append receive queue.
 
         Args:
             tag (str): data tag.
-            queue (Queue): Receiving queue
+            queue (Queue): Receiving queue. If it is a ``ProxyQueue``, it
+              wakes up this proxy on put. If it is a ``RingQueue``, this proxy
+              waits on its notifier. Otherwise the proxy polls it.
         """
         assert queue not in self.recv_queues, "The queue has already been "\
             "appended."
+        has_proxy_queue = any(isinstance(q, ProxyQueue) for q in
+                              self.recv_queues.values())
         self.recv_queues[tag] = queue
+        notifier = getattr(queue, 'notifier', None)
+        if isinstance(queue, ProxyQueue) and self.notifier is None:
+            queue.set_wakeup(self.wakeup)
+        elif notifier is not None and not has_proxy_queue and\
+                self.notifier in (None, notifier):
+            self.notifier = notifier
+        else:
+            # can not wait for all of the queues at once.
+            self.polling = True
+
+    def wake(self):
+        """Wake up this proxy waiting for data."""
+        self.wakeup.set()
+        if self.notifier is not None:
+            self.notifier.notify()
+
+    def wait_timeout(self):
+        """Return seconds to wait for data when all queues are empty."""
+        max_wait = POLL_WAIT_TIME if self.polling else MAX_WAIT_TIME
+        return super(ProxyInput, self).wait_timeout(max_wait)
 
     def generate_stream(self, gen_data, stop_event):
         """Generate data stream from data generator.
 
-        Note: Yield (None, None) tuple if the queue is empty to give agent a
-         chance to flush,
+        Receive from each queue in turn. When all queues are empty, sleep
+         until data arrives, the wakeup event is set or next flushing is due.
+
+        Note: Yield (None, None) tuple before sleeping to give agent a chance
+         to flush.
 
         Args:
             gen_data: Data generator.
@@ -183,21 +374,29 @@ class ProxyInput(Input):
         Yields:
             tuple: (tag, DataStream)
         """
-        while True:
-            # Loop each receive queue
+        wakeup = self.wakeup
+        notifier = None if self.polling else self.notifier
+        while not is_signalled(stop_event):
+            # Clear first not to miss a put during the receiving round.
+            wakeup.clear()
+            count = notifier.count() if notifier is not None else None
+            received = False
             for tag, queue in self.recv_queues.items():
-                while True:
-                    try:
-                        stop_iter_when_signalled(stop_event)
-                        ds = queue.get_nowait()
-                    except Empty:
-                        # Give a chance to flush.
-                        yield None, None
-                        # Process next queue
-                        break
-                    else:
-                        logging.debug("yield ds")
-                        yield tag, ds
+                try:
+                    ds = queue.get_nowait()
+                except Empty:
+                    continue
+                received = True
+                self.metrics.count(len(ds), len(ds))
+                yield tag, ds
+
+            if not received:
+                # Give a chance to flush, then wait.
+                yield None, None
+                if notifier is not None:
+                    notifier.wait(count, self.wait_timeout())
+                else:
+                    wakeup.wait(self.wait_timeout())
 
 
 class RecordInput(Input):
@@ -225,9 +424,30 @@ class RecordInput(Input):
         """
         logging.debug("RecordInput.generate_data")
         for record in self.generate_record():
-            stop_iter_when_signalled(stop_event)
+            if is_signalled(stop_event):
+                return
             yield time.time(), record
 
+    # Implement as an asynchronous generator to run in an event loop.
+    agenerate_record = None
+
+    @property
+    def is_async(self):
+        """Whether this input can generate data in an event loop."""
+        return self.agenerate_record is not None
+
+    def agenerate_data(self, stop_event):
+        """Generate data from asynchronous record generator.
+
+        Args:
+            stop_event (threading.Event): Stop event
+
+        Returns:
+            An asynchronous generator of (time, data) tuples.
+        """
+        from swak.aio import agenerate_records
+        return agenerate_records(self, stop_event)
+
     def generate_record(self):
         """Generate records.
 
@@ -261,6 +481,7 @@ class TextInput(Input):
         self.parser = None
         self.filter_fn = None
         self.encoding = None
+        self.line_size = 0
 
     def set_encoding(self, encoding):
         """Set encoding of input source.
@@ -286,19 +507,65 @@ class TextInput(Input):
             tuple: time, data
         """
         for line in self.generate_line():
-            stop_iter_when_signalled(stop_event)
+            if is_signalled(stop_event):
+                return
+            data = self.process_line(line)
+            if data is not None:
+                yield time.time(), data
 
-            if self.encoding is not None:
-                line = line.decode(self.encoding)
-            # Test by filter function
-            if self.filter_fn is not None:
-                if not self.filter_fn(line):
-                    continue
-            if self.parser is not None:
-                data = self.parser.parse(line)
-            else:
-                data = line
-            yield time.time(), data
+    # Implement as an asynchronous generator to run in an event loop.
+    agenerate_line = None
+
+    @property
+    def is_async(self):
+        """Whether this input can generate data in an event loop."""
+        return self.agenerate_line is not None
+
+    def agenerate_data(self, stop_event):
+        """Generate data from asynchronous line generator.
+
+        Args:
+            stop_event (threading.Event): Stop event
+
+        Returns:
+            An asynchronous generator of (time, data) tuples.
+        """
+        from swak.aio import agenerate_lines
+        return agenerate_lines(self, stop_event)
+
+    def process_line(self, line):
+        """Decode, filter and parse a line.
+
+        Args:
+            line (bytes): A line. Empty under blocking situations.
+
+        Returns:
+            Data from the line, or None if filtered out.
+        """
+        self.line_size = len(line)
+        if self.line_size == 0:
+            # no line under blocking situations.
+            return line
+        if self.encoding is not None:
+            line = line.decode(self.encoding)
+        # Test by filter function
+        if self.filter_fn is not None:
+            if not self.filter_fn(line):
+                return None
+        if self.parser is not None:
+            return self.parser.parse(line)
+        return line
+
+    def data_size(self, data):
+        """Return size of the source line of data to limit batch size.
+
+        Args:
+            data (dict or str): Generated data.
+
+        Returns:
+            int: Size of the last read line.
+        """
+        return self.line_size
 
     def generate_line(self):
         """Generate lines.
@@ -345,6 +612,9 @@ class Modifier(Plugin):
 
     Following methods should be implemented:
         modify
+
+    A modifier can also implement ``modify_batch`` to modify whole columns of
+     a stream at once.
     """
 
     def prepare_for_stream(self, tag, ds):
@@ -374,6 +644,34 @@ class Modifier(Plugin):
         """
         raise NotImplementedError()
 
+    def modify_batch(self, tag, times, records):
+        """Modify columns of data.
+
+        Default implementation calls ``modify`` for each record.
+
+        Args:
+            tag (str): data tag
+            times (array): Data time stamps.
+            records (list): Data records.
+
+        Returns:
+            array: Modified time stamps.
+            list: Modified records. Removed records are excluded.
+        """
+        mtimes = array('d')
+        mrecords = []
+        tappend = mtimes.append
+        rappend = mrecords.append
+        modify = self.modify
+        for utime, record in zip(times, records):
+            result = modify(tag, utime, record)
+            if result is None:
+                continue
+            utime, record = result
+            tappend(utime)
+            rappend(record)
+        return mtimes, mrecords
+
 
 class Output(Plugin):
     """Base class for output plugin.
@@ -393,9 +691,55 @@ class Output(Plugin):
         super(Output, self).__init__()
         if abuffer is not None and abuffer.output is None:
             abuffer.output = self
+        if abuffer is not None and formatter is not None and\
+                formatter.binary and not abuffer.binary:
+            # binary formatter writes straight into binary chunks.
+            abuffer.set_binary(True)
         self.formatter = formatter
         self.buffer = abuffer
         self.proxy = False
+        self.loop = None
+        # write latency
+        self.metrics.latency = Histogram()
+        # Guards metrics updated by flush workers of the buffer.
+        self.metrics_lock = threading.Lock()
+
+    def snapshot_metrics(self):
+        """Return current values of the output's and its buffer's metrics.
+
+        Returns:
+            dict: Metric values.
+        """
+        with self.metrics_lock:
+            snap = super(Output, self).snapshot_metrics()
+        if self.buffer is not None:
+            snap['buffer'] = self.buffer.snapshot_metrics()
+        return snap
+
+    @property
+    def is_async(self):
+        """Whether ``_write`` of this output is a coroutine function."""
+        return is_coroutine_function(self._write)
+
+    def set_loop(self, loop):
+        """Set an event loop to run asynchronous writes in.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): Event loop of the engine.
+        """
+        self.loop = loop
+
+    def _write_async(self, args):
+        """Run asynchronous ``_write`` until it is done.
+
+        The write is run in the event loop set, or in a new one if no loop is
+         set. Should not be called in the thread of the event loop.
+
+        Args:
+            args (tuple): Arguments of ``_write``.
+        """
+        from swak.aio import run_write
+        run_write(self, args)
 
     def _shutdown(self):
         """Shut down the plugin."""
@@ -412,13 +756,20 @@ class Output(Plugin):
             flush_all (bool): Whether flush all or just one.
         """
         if self.buffer is not None:
-            logging.debug("Output.flush")
+            if trace.TRACE:
+                logging.debug("Output.flush")
             self.buffer.flushing(flush_all)
 
     def set_buffer(self, buffer):
         """Set output bufer."""
         self.buffer = buffer
 
+    def set_tag(self, tag):
+        """Set tag of this output and its buffer."""
+        super(Output, self).set_tag(tag)
+        if self.buffer is not None:
+            self.buffer.set_tag(tag)
+
     def _start(self):
         """Implement start."""
         if self.buffer is not None:
@@ -440,47 +791,100 @@ class Output(Plugin):
         Returns:
             int: Adding size of the stream.
         """
-        logging.debug("Output.handle_stream")
+        if trace.TRACE:
+            logging.debug("Output.handle_stream")
         adding_size = 0
-        for utime, record in ds:
-            dtime = self.formatter.timestamp_to_datetime(utime)
-            formatted = self.formatter.format(tag, dtime, record)
-            if self.buffer is not None:
-                adding_size += self.buffer.append(formatted)
+        formatter = self.formatter
+        times = ds.times
+        dtimes = formatter.timestamps_to_datetimes(times)
+        datas = formatter.format_stream(tag, dtimes, ds.records)
+        keys = self.chunk_keys(tag, times)
+        binary = formatter.binary
+        if self.buffer is not None:
+            append = self.buffer.append
+            if keys is None:
+                for data in datas:
+                    adding_size += append(data, binary)
             else:
-                self.write(formatted)
+                for data, key in zip(datas, keys):
+                    adding_size += append(data, binary, key)
+        elif keys is None:
+            # write the whole stream as a bulk.
+            bulk = b''.join(datas) if binary else datas
+            self.write(bulk)
+            self.metrics.bytes_out += len(bulk) if binary else\
+                sum(map(len, bulk))
+        else:
+            # write a bulk for each run of the same key.
+            start = 0
+            for i in range(1, len(keys) + 1):
+                if i < len(keys) and keys[i] == keys[start]:
+                    continue
+                bulk = datas[start:i]
+                self.write(b''.join(bulk) if binary else bulk, keys[start])
+                start = i
+            self.metrics.bytes_out += sum(map(len, datas))
+        self.metrics.count(len(ds), 0, adding_size)
         return adding_size
 
-    def write(self, bulk):
+    def chunk_keys(self, tag, times):
+        """Return chunk keys of data.
+
+        Data are chunked by their keys, and the key of a chunk is passed to
+         ``_write``. Override this to write data to different targets.
+         Keys must be JSON serializable to be saved with chunk files.
+
+        Args:
+            tag (str): Data tag.
+            times (array): Time stamps of data.
+
+        Returns:
+            list: Chunk keys for each data, or None for no keys.
+        """
+        return None
+
+    def write(self, bulk, key=None):
         """Write a bulk.
 
         NOTE: A bulk can have the following types:
-        - str: When there is no buffer
+        - bytes: When there is no buffer and the formatter is binary
         - bytearray: When there is a buffer of binary format
-        - list: When there is a buffer of string format
+        - list: When there is a buffer of string format, or no buffer
 
         The output must support various bulk types depending on the presence
          and supported formats of the buffer.
 
         Args:
             bulk:
+            key: Chunk key if the output has ``chunk_keys``.
         """
         if len(bulk) == 0:
             return
-        logging.debug("Output.write")
-        self._write(bulk)
+        if trace.TRACE:
+            logging.debug("Output.write")
+        args = (bulk,) if key is None else (bulk, key)
+        st = time.time()
+        if self.is_async:
+            self._write_async(args)
+        else:
+            self._write(*args)
+        elapsed = time.time() - st
+        with self.metrics_lock:
+            self.metrics.latency.observe(elapsed)
 
     def _write(self, bulk):
         """Write a bulk to the output.
 
         NOTE: A bulk can have the following types:
-        - str: When there is no buffer
+        - bytes: When there is no buffer and the formatter is binary
         - bytearray: When there is a buffer of binary format
-        - list: When there is a buffer of string format
+        - list: When there is a buffer of string format, or no buffer
 
         An output plugin must support various bulk types depending on the
          presence and supported formats of the buffer.
 
+        This can be a coroutine function to write in an event loop.
+
         Args:
             bulk:
         """
@@ -498,7 +902,8 @@ class Output(Plugin):
             force_flushing_interval (float): Force flushing interval for input
               is terminated.
         """
-        logging.debug("may_flushing")
+        if trace.TRACE:
+            logging.debug("may_flushing")
         if self.buffer is not None:
             self.buffer.may_flushing(last_flush_interval)
 
@@ -509,16 +914,35 @@ class ProxyOutput(Plugin):
     This class is used in the aggregated thread model.
     """
 
-    def __init__(self, queue):
+    def __init__(self, queue, batch_record=PROXY_BATCH_RECORD):
         """Init.
 
         Args:
             queue (Queue): Sending queue.
+            batch_record (int): Maximum records of a data stream to put into
+              the queue at once. Larger streams are put by batches.
         """
         super(ProxyOutput, self).__init__()
         self.send_queue = queue
+        self.batch_record = batch_record
         logging.debug("ProxyOutput queue {}".format(queue))
         self.proxy = True
+        # queue put latency
+        self.metrics.latency = Histogram()
+
+    def snapshot_metrics(self):
+        """Return current values of metrics with the queue depth.
+
+        Returns:
+            dict: Metric values.
+        """
+        snap = super(ProxyOutput, self).snapshot_metrics()
+        try:
+            snap['queue_depth'] = self.send_queue.qsize()
+        except NotImplementedError:
+            # not supported by multiprocessing queue on some platforms.
+            pass
+        return snap
 
     def emit_stream(self, tag, ds, stop_event):
         """Emit data stream to inter-thread queue.
@@ -528,26 +952,31 @@ class ProxyOutput(Plugin):
             ds (datatream): Data stream.
             stop_event (threading.Event): Stop event.
         """
-        logging.debug("ProxyOutput.emit_stream")
-        # Put data stream to the queue, block if necessary.
+        if trace.TRACE:
+            logging.debug("ProxyOutput.emit_stream")
+        # Put data stream to the queue by batches, block if necessary.
         st = time.time()
 
-        while True:
-            try:
-                self.send_queue.put(ds, True, PUT_WAIT_TIME)
-            except Full:
-                logging.info(" queue full!")
-                if stop_event is not None:
-                    if stop_event.wait(0.0):
-                        logging.info(" stop_event triggered!")
-                        # stop event triggered. exit.
-                        return
-            else:
-                break
+        for batch in ds.batches(self.batch_record):
+            while True:
+                try:
+                    self.send_queue.put(batch, True, PUT_WAIT_TIME)
+                except Full:
+                    logging.info(" queue full!")
+                    if stop_event is not None:
+                        if stop_event.wait(0.0):
+                            logging.info(" stop_event triggered!")
+                            # stop event triggered. exit.
+                            return
+                else:
+                    break
 
         latency = time.time() - st
-        logging.debug("ProxyOutput.emit_events - queue put latency {:.2f}".
-                      format(latency))
+        self.metrics.count(len(ds), len(ds))
+        self.metrics.latency.observe(latency)
+        if trace.TRACE:
+            logging.debug("ProxyOutput.emit_stream - queue put latency %.2f",
+                          latency)
 
 
 def is_kind_of_output(plugin):
@@ -768,9 +1197,9 @@ class DummyOutput(Output):
         """Write a bulk to the output.
 
         NOTE: A bulk can have the following types:
-        - str: When there is no buffer
+        - bytes: When there is no buffer and the formatter is binary
         - bytearray: When there is a buffer of binary format
-        - list: When there is a buffer of string format
+        - list: When there is a buffer of string format, or no buffer
 
         An output plugin must support various bulk types depending on the
          presence and supported formats of the buffer.
@@ -1,9 +1,12 @@
 """This module implements pluginpod."""
 
 import logging
+from collections import OrderedDict
 
 from swak.datarouter import DataRouter
-from swak.plugin import create_plugin_by_name, Input, Output, ProxyInput
+from swak.plugin import create_plugin_by_name, Input, Output, ProxyInput,\
+    ProxyOutput
+from swak import trace
 
 
 MAX_BUFFER_RECORD = 10
@@ -114,7 +117,8 @@ class PluginPod(object):
         Args:
             flush_all (bool): Whether flush all or just one.
         """
-        logging.debug("flushing all output plugins")
+        if trace.TRACE:
+            logging.debug("flushing all output plugins")
         for output in self.iter_outputs():
             output.flush(flush_all)
 
@@ -143,10 +147,41 @@ class PluginPod(object):
 
     def may_flushing(self, last_flush_interval=None):
         """Flushing for all outputs if needed."""
-        logging.debug("may_flushing")
+        if trace.TRACE:
+            logging.debug("may_flushing")
         for output in self.iter_outputs():
             output.may_flushing(last_flush_interval)
 
+    def snapshot_metrics(self):
+        """Return metrics of all plugins.
+
+        Returns:
+            OrderedDict: Metrics of each plugin by its order and class name.
+        """
+        plugins = list(self.plugins)
+        if not plugins or not isinstance(plugins[-1], (Output, ProxyOutput)):
+            plugins.append(self.router.def_output)
+        snap = OrderedDict()
+        for idx, plugin in enumerate(plugins):
+            name = "{}.{}".format(idx, plugin.__class__.__name__)
+            snap[name] = plugin.snapshot_metrics()
+        return snap
+
+    def time_to_flush(self):
+        """Return seconds until the earliest flushing by time is due.
+
+        Returns:
+            float: Seconds to next flushing, or None if there is no due.
+        """
+        due = None
+        for output in self.iter_outputs():
+            if output.buffer is None:
+                continue
+            remain = output.buffer.time_to_flush()
+            if remain is not None and (due is None or remain < due):
+                due = remain
+        return due
+
     def process(self, stop_event):
         """Read from input and emit through router for service.
 
@@ -169,6 +204,20 @@ class PluginPod(object):
         self.stop()
         self.shutdown()
 
+    def aprocess(self, stop_event):
+        """Read from asynchronous input and emit through router for service.
+
+        This funciont is for the asyncio engine.
+
+        Args:
+            stop_event (threading.Event): Stop event
+
+        Returns:
+            A coroutine to run in the event loop.
+        """
+        from swak.aio import aprocess
+        return aprocess(self, stop_event)
+
     def simple_process(self, input_pl):
         """Read from input and emit through router.
 
@@ -0,0 +1,259 @@
+"""This module implements shared memory ring queue."""
+
+import os
+import mmap
+import pickle
+import struct
+import multiprocessing
+from array import array
+
+from six import PY2
+from six.moves.queue import Empty, Full
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from swak.data import MultiDataStream
+from swak.util import is_windows
+
+DEFAULT_RING_SIZE = '16m'
+
+# Frame size, then number of records of a serialized stream.
+FRAME_HEADER = struct.Struct('<I')
+COUNT_HEADER = struct.Struct('<I')
+TIME_SIZE = array('d').itemsize
+
+
+def serialize_stream(ds):
+    """Serialize a data stream into parts of a frame.
+
+    Time stamps are copied as raw doubles. Only records are pickled.
+
+    Args:
+        ds (DataStream): A data stream.
+
+    Returns:
+        list: Byte strings of the frame body.
+    """
+    times = ds.times
+    # python 2 array has neither tobytes nor the buffer interface.
+    times = times.tostring() if PY2 else memoryview(times).tobytes()
+    records = pickle.dumps(ds.records, pickle.HIGHEST_PROTOCOL)
+    return [COUNT_HEADER.pack(len(ds)), times, records]
+
+
+def deserialize_stream(body):
+    """Deserialize a frame body into a data stream.
+
+    Args:
+        body (bytes): Frame body.
+
+    Returns:
+        MultiDataStream: A data stream.
+    """
+    body = memoryview(body)
+    cnt = COUNT_HEADER.unpack_from(body)[0]
+    tstart = COUNT_HEADER.size
+    rstart = tstart + cnt * TIME_SIZE
+    times = array('d')
+    if PY2:
+        times.fromstring(body[tstart:rstart].tobytes())
+        records = pickle.loads(body[rstart:].tobytes())
+    else:
+        times.frombytes(body[tstart:rstart])
+        records = pickle.loads(body[rstart:])
+    return MultiDataStream(times, records)
+
+
+def can_share_ring():
+    """Return whether a ring can be shared with worker processes.
+
+    An anonymous ``mmap``, used without ``multiprocessing.shared_memory``,
+     is inherited by forked processes only and can not be pickled to spawned
+     ones.
+    """
+    if shared_memory is not None:
+        return True
+    get_start_method = getattr(multiprocessing, 'get_start_method', None)
+    if get_start_method is None:
+        # python 2 forks except on Windows.
+        return not is_windows()
+    return get_start_method() == 'fork'
+
+
+class RingNotifier(object):
+    """Notifier of puts into rings, to wait for any of them without polling.
+
+    This is an event count. A receiver reads ``count`` before checking its
+     rings, and waits with it only if they were empty, so a put between the
+     check and the wait is not missed.
+    """
+
+    def __init__(self):
+        """Init."""
+        self.cond = multiprocessing.Condition()
+        self.seq = multiprocessing.RawValue('q', 0)
+
+    def count(self):
+        """Return the number of notifications so far."""
+        return self.seq.value
+
+    def notify(self):
+        """Wake up all waiting receivers."""
+        with self.cond:
+            self.seq.value += 1
+            self.cond.notify_all()
+
+    def wait(self, count, timeout):
+        """Wait for a notification after count.
+
+        Args:
+            count (int): Count read before checking the rings.
+            timeout (float): Maximum seconds to wait.
+        """
+        with self.cond:
+            if self.seq.value == count:
+                self.cond.wait(timeout)
+
+
+class RingQueue(object):
+    """Queue of data streams in a fixed size ring of shared memory.
+
+    Data streams are serialized into length-prefixed frames in the ring, so
+     the capacity is in bytes and the ring can be shared between processes.
+     The ring is from ``multiprocessing.shared_memory`` if available, or an
+     anonymous ``mmap`` shared with forked processes otherwise.
+
+    This is a drop-in for the inter-proxy queue, as ``ProxyOutput`` puts and
+     ``ProxyInput`` gets data streams with ``put`` and ``get_nowait``. Puts
+     are notified by the ``notifier``, which ``ProxyInput`` waits on.
+    """
+
+    def __init__(self, capacity, notifier=None):
+        """Init.
+
+        Args:
+            capacity (int): Ring size in bytes.
+            notifier (RingNotifier): Notifier of puts. Rings sharing one can
+              be waited together. A new one if None.
+        """
+        assert capacity > FRAME_HEADER.size
+        self.capacity = capacity
+        if shared_memory is not None:
+            self.shm = shared_memory.SharedMemory(create=True, size=capacity)
+            self.mm = None
+        else:
+            self.shm = None
+            self.mm = mmap.mmap(-1, capacity)
+        self.owner_pid = os.getpid()
+        # Read offset and used bytes of the ring.
+        self.state = multiprocessing.RawArray('q', 2)
+        self.lock = multiprocessing.Lock()
+        self.not_full = multiprocessing.Condition(self.lock)
+        self.notifier = notifier if notifier is not None else RingNotifier()
+
+    @property
+    def buf(self):
+        """Return the ring memory."""
+        return self.shm.buf if self.shm is not None else self.mm
+
+    def _write(self, pos, data):
+        """Write data at a position, wrapping around the ring."""
+        size = len(data)
+        first = min(size, self.capacity - pos)
+        buf = self.buf
+        buf[pos:pos + first] = data[:first]
+        if first < size:
+            buf[:size - first] = data[first:]
+        return (pos + size) % self.capacity
+
+    def _read(self, pos, size):
+        """Read data at a position, wrapping around the ring."""
+        first = min(size, self.capacity - pos)
+        buf = self.buf
+        data = bytes(buf[pos:pos + first])
+        if first < size:
+            data += bytes(buf[:size - first])
+        return data, (pos + size) % self.capacity
+
+    def put(self, ds, block=True, timeout=None):
+        """Put a data stream into the ring.
+
+        A stream larger than the ring is put by halves.
+
+        Args:
+            ds (DataStream): A data stream.
+            block (bool): Wait for free space or not.
+            timeout (float): Maximum seconds to wait. Wait forever if None.
+
+        Raises:
+            Full: If no space is available in time.
+            ValueError: If a record is larger than the ring.
+        """
+        parts = serialize_stream(ds)
+        size = FRAME_HEADER.size + sum(len(part) for part in parts)
+        if size > self.capacity:
+            if len(ds) <= 1:
+                raise ValueError("A record is larger than the ring.")
+            half = len(ds) // 2
+            self.put(ds[:half], block, timeout)
+            self.put(ds[half:], block, timeout)
+            return
+
+        state = self.state
+        with self.not_full:
+            while self.capacity - state[1] < size:
+                if not block:
+                    raise Full
+                if not self.not_full.wait(timeout):
+                    raise Full
+            pos = (state[0] + state[1]) % self.capacity
+            pos = self._write(pos, FRAME_HEADER.pack(size -
+                                                     FRAME_HEADER.size))
+            for part in parts:
+                pos = self._write(pos, part)
+            state[1] += size
+        self.notifier.notify()
+
+    def put_nowait(self, ds):
+        """Put a data stream without waiting."""
+        self.put(ds, False)
+
+    def get_nowait(self):
+        """Get a data stream from the ring.
+
+        Returns:
+            MultiDataStream: A data stream.
+
+        Raises:
+            Empty: If the ring is empty.
+        """
+        state = self.state
+        with self.not_full:
+            if state[1] == 0:
+                raise Empty
+            header, pos = self._read(state[0], FRAME_HEADER.size)
+            body_size = FRAME_HEADER.unpack(header)[0]
+            body, pos = self._read(pos, body_size)
+            state[0] = pos
+            state[1] -= FRAME_HEADER.size + body_size
+            self.not_full.notify_all()
+        return deserialize_stream(body)
+
+    def qsize(self):
+        """Return used bytes of the ring."""
+        return self.state[1]
+
+    def empty(self):
+        """Return whether the ring is empty."""
+        return self.state[1] == 0
+
+    def close(self):
+        """Release the ring. The ring is removed by the creating process."""
+        if self.shm is not None:
+            self.shm.close()
+            if os.getpid() == self.owner_pid:
+                self.shm.unlink()
+        else:
+            self.mm.close()
@@ -28,4 +28,18 @@
                 None
         """
         raise NotImplementedError()
+
+    # Implement following method to modify whole columns of a stream at once.
+    # def modify_batch(self, tag, times, records):
+    #     """Modify columns of data.
+    #
+    #     Args:
+    #         tag (str): data tag
+    #         times (array or memoryview): Data time stamps.
+    #         records (list): Data records.
+    #
+    #     Returns:
+    #         array or memoryview: Modified time stamps.
+    #         list: Modified records. Removed records are excluded.
+    #     """
 {% endblock %}
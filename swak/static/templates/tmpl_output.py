@@ -2,9 +2,13 @@
 
 {% block import_body %}
 from swak.formatter import Formatter, StdoutFormatter
-from swak.buffer import Buffer
+from swak.buffer import Buffer, SecondaryFile, OVERFLOW_ACTIONS
 from swak.memorybuffer import MemoryBuffer, DEFAULT_CHUNK_MAX_RECORD,\
-    DEFAULT_CHUNK_MAX_SIZE, DEFAULT_BUFFER_MAX_CHUNK
+    DEFAULT_CHUNK_MAX_SIZE, DEFAULT_BUFFER_MAX_CHUNK, DEFAULT_FLUSH_WORKERS,\
+    DEFAULT_FLUSH_QUEUE_SIZE, DEFAULT_DRAIN_TIMEOUT, DEFAULT_RETRY_MAX,\
+    DEFAULT_RETRY_WAIT, DEFAULT_RETRY_MAX_WAIT, DEFAULT_BUFFER_MAX_SIZE,\
+    DEFAULT_OVERFLOW_ACTION
+from swak.filebuffer import FileBuffer, FSYNC_POLICIES, DEFAULT_FSYNC
 {% endblock %}
 
 {% block class_body %}
@@ -12,9 +16,9 @@ from swak.memorybuffer import MemoryBuffer, DEFAULT_CHUNK_MAX_RECORD,\
         """Write a bulk to the output.
 
         NOTE: A bulk can have the following types:
-        - str: When there is no buffer
+        - bytes: When there is no buffer and the formatter is binary
         - bytearray: When there is a buffer of binary format
-        - list: When there is a buffer of string format
+        - list: When there is a buffer of string format, or no buffer
 
         An output plugin must support various bulk types depending on the
          presence and supported formats of the buffer.
@@ -69,13 +73,110 @@ def f_stdout(timezone):
 @click.option('-r', '--chunk-max-record', default=DEFAULT_CHUNK_MAX_RECORD,
               type=int, show_default=True, help="Maximum records per chunk.")
 @click.option('-s', '--chunk-max-size', default=DEFAULT_CHUNK_MAX_SIZE,
-              show_default=True, help="Maximum chunks per buffer.")
+              show_default=True, help="Maximum size per chunk.")
 @click.option('-c', '--buffer-max-chunk', default=DEFAULT_BUFFER_MAX_CHUNK,
               show_default=True, help="Maximum chunks per buffer.")
+@click.option('-w', '--flush-workers', default=DEFAULT_FLUSH_WORKERS,
+              type=int, show_default=True, help="Number of flush worker "
+              "threads. Flush synchronously if 0.")
+@click.option('-q', '--flush-queue-size', default=DEFAULT_FLUSH_QUEUE_SIZE,
+              type=int, show_default=True, help="Maximum chunks waiting for "
+              "a flush worker.")
+@click.option('--drain-timeout', default=DEFAULT_DRAIN_TIMEOUT,
+              show_default=True, help="Time to wait for flush workers at "
+              "shutdown.")
+@click.option('--retry-max', default=DEFAULT_RETRY_MAX, type=int,
+              show_default=True, help="Maximum retries of a failed chunk.")
+@click.option('--retry-wait', default=DEFAULT_RETRY_WAIT, show_default=True,
+              help="Wait before the first retry. Doubled for each retry.")
+@click.option('--retry-max-wait', default=DEFAULT_RETRY_MAX_WAIT,
+              show_default=True, help="Maximum wait between retries.")
+@click.option('--secondary-dir', default=None, type=str, help="Directory to "
+              "write chunks which exceeded retry max. Dropped if not given.")
+@click.option('--buffer-max-size', default=DEFAULT_BUFFER_MAX_SIZE,
+              show_default=True, help="Maximum size of buffered data.")
+@click.option('--overflow-action', default=DEFAULT_OVERFLOW_ACTION,
+              type=click.Choice(OVERFLOW_ACTIONS), show_default=True,
+              help="Action when buffer max size or memory budget is "
+              "exceeded.")
+@click.option('--spill-path', default=None, type=str, help="Directory for "
+              "spilled chunk files. Defaults to SWAK_HOME/buffer/TAG.spill")
 def b_memory(flush_interval, chunk_max_record, chunk_max_size,
-             buffer_max_chunk):
+             buffer_max_chunk, flush_workers, flush_queue_size,
+             drain_timeout, retry_max, retry_wait, retry_max_wait,
+             secondary_dir, buffer_max_size, overflow_action, spill_path):
     """Formatter entry."""
+    secondary = None if secondary_dir is None else\
+        SecondaryFile(secondary_dir)
     return MemoryBuffer(None, False, flush_interval=flush_interval,
                         buffer_max_chunk=buffer_max_chunk,
-                        chunk_max_record=chunk_max_record)
+                        chunk_max_record=chunk_max_record,
+                        chunk_max_size=chunk_max_size,
+                        flush_workers=flush_workers,
+                        flush_queue_size=flush_queue_size,
+                        drain_timeout=drain_timeout, retry_max=retry_max,
+                        retry_wait=retry_wait, retry_max_wait=retry_max_wait,
+                        secondary=secondary, buffer_max_size=buffer_max_size,
+                        overflow_action=overflow_action,
+                        spill_path=spill_path)
+
+
+# MODIFY FOLLOWING BUFFER INIT CODE TO FIT YOUR OUTPUT PLUGIN
+
+@main.command('b.file', help="File buffer for this output.")
+@click.option('-p', '--path', default=None, type=str, help="Directory for "
+              "chunk files. Defaults to SWAK_HOME/buffer/TAG")
+@click.option('-f', '--flush-interval', default=None, type=str,
+              show_default=True, help="Flush interval.")
+@click.option('-r', '--chunk-max-record', default=DEFAULT_CHUNK_MAX_RECORD,
+              type=int, show_default=True, help="Maximum records per chunk.")
+@click.option('-s', '--chunk-max-size', default=DEFAULT_CHUNK_MAX_SIZE,
+              show_default=True, help="Maximum size per chunk.")
+@click.option('-c', '--buffer-max-chunk', default=DEFAULT_BUFFER_MAX_CHUNK,
+              show_default=True, help="Maximum chunks per buffer.")
+@click.option('--fsync', default=DEFAULT_FSYNC, show_default=True,
+              type=click.Choice(FSYNC_POLICIES), help="When to fsync chunk "
+              "files.")
+@click.option('--flush-at-shutdown', is_flag=True, help="Flush all chunks "
+              "at shutdown instead of leaving them for the next run.")
+@click.option('-w', '--flush-workers', default=DEFAULT_FLUSH_WORKERS,
+              type=int, show_default=True, help="Number of flush worker "
+              "threads. Flush synchronously if 0.")
+@click.option('-q', '--flush-queue-size', default=DEFAULT_FLUSH_QUEUE_SIZE,
+              type=int, show_default=True, help="Maximum chunks waiting for "
+              "a flush worker.")
+@click.option('--drain-timeout', default=DEFAULT_DRAIN_TIMEOUT,
+              show_default=True, help="Time to wait for flush workers at "
+              "shutdown.")
+@click.option('--retry-max', default=DEFAULT_RETRY_MAX, type=int,
+              show_default=True, help="Maximum retries of a failed chunk.")
+@click.option('--retry-wait', default=DEFAULT_RETRY_WAIT, show_default=True,
+              help="Wait before the first retry. Doubled for each retry.")
+@click.option('--retry-max-wait', default=DEFAULT_RETRY_MAX_WAIT,
+              show_default=True, help="Maximum wait between retries.")
+@click.option('--secondary-dir', default=None, type=str, help="Directory to "
+              "write chunks which exceeded retry max. Dropped if not given.")
+@click.option('--buffer-max-size', default=DEFAULT_BUFFER_MAX_SIZE,
+              show_default=True, help="Maximum size of buffered data.")
+@click.option('--overflow-action', default=DEFAULT_OVERFLOW_ACTION,
+              type=click.Choice(['block', 'drop_oldest']), show_default=True,
+              help="Action when buffer max size is exceeded.")
+def b_file(path, flush_interval, chunk_max_record, chunk_max_size,
+           buffer_max_chunk, fsync, flush_at_shutdown, flush_workers,
+           flush_queue_size, drain_timeout, retry_max, retry_wait,
+           retry_max_wait, secondary_dir, buffer_max_size, overflow_action):
+    """Buffer entry."""
+    secondary = None if secondary_dir is None else\
+        SecondaryFile(secondary_dir)
+    return FileBuffer(None, False, path, flush_interval=flush_interval,
+                      buffer_max_chunk=buffer_max_chunk,
+                      chunk_max_record=chunk_max_record,
+                      chunk_max_size=chunk_max_size, fsync=fsync,
+                      flush_at_shutdown=flush_at_shutdown,
+                      flush_workers=flush_workers,
+                      flush_queue_size=flush_queue_size,
+                      drain_timeout=drain_timeout, retry_max=retry_max,
+                      retry_wait=retry_wait, retry_max_wait=retry_max_wait,
+                      secondary=secondary, buffer_max_size=buffer_max_size,
+                      overflow_action=overflow_action)
 {% endblock %}
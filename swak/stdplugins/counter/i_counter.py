@@ -6,9 +6,6 @@ import click
 from six.moves import range
 
 from swak.plugin import RecordInput
-# from swak.data import MultiDataStream
-
-YIELD_STEP = 10
 
 DEFAULT_NUMBER = 3
 DEFAUTL_FIELD = 1
@@ -51,12 +48,8 @@ class Counter(RecordInput):
         """
         last_time = time.time()
         for idx in range(self.number):
-            record = {}
-            for f in range(self.field):
-                key = "f{}".format(f + 1)
-                record[key] = idx + 1
             last_time = time.time()
-            yield record
+            yield self.make_record(idx)
 
             if not (self.delay is None or self.delay == 0):
                 # wait delay
@@ -67,28 +60,30 @@ class Counter(RecordInput):
                     else:
                         break
 
-    # def generate_stream(self, gen_data, stop_event):
-    #     """Generate data stream from data generator.
-
-    #     Args:
-    #         gen_data (function): Data generator function.
-    #         stop_event (threading.Event): Stop event
-
-    #     Yields:
-    #         tuple: (tag, DataStream)
-    #     """
-    #     times = []
-    #     datas = []
-    #     for i, event in enumerate(gen_data(stop_event)):
-    #         utime, data = event
-    #         times.append(utime)
-    #         datas.append(data)
-    #         if i % YIELD_STEP == 0:
-    #             yield self.tag, MultiDataStream(times, datas)
-    #             times = []
-    #             datas = []
-    #     # yield remain data
-    #     yield self.tag, MultiDataStream(times, datas)
+    def agenerate_record(self):
+        """Generate records, sleeping in the event loop between them.
+
+        Returns:
+            An asynchronous generator of records.
+        """
+        from swak.aio import paced
+        records = (self.make_record(idx) for idx in range(self.number))
+        return paced(records, self.delay)
+
+    def make_record(self, idx):
+        """Make a record for a count.
+
+        Args:
+            idx (int): Zero based count index.
+
+        Returns:
+            dict: A record
+        """
+        record = {}
+        for f in range(self.field):
+            key = "f{}".format(f + 1)
+            record[key] = idx + 1
+        return record
 
 
 @click.command(help="Generate incremental numbers.")
@@ -0,0 +1,307 @@
+"""File output module."""
+from __future__ import absolute_import
+
+import os
+import re
+import gzip
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+import click
+
+from swak.plugin import Output
+from swak.formatter import Formatter, StdoutFormatter
+from swak.buffer import Buffer
+from swak.memorybuffer import MemoryBuffer
+from swak.clicmds import f_stdout, f_json, f_msgpack, b_memory, b_file
+from swak.util import size_value, make_dirs
+from swak.exception import ConfigError
+from swak import trace
+
+DEFAULT_MAX_OPEN = 16
+MAX_PATH_CACHE = 1024
+TAG_PLACEHOLDER = '{tag}'
+
+
+class FileHandle(object):
+    """Opened output file."""
+
+    __slots__ = ('fd', 'size')
+
+    def __init__(self, path):
+        """Init.
+
+        Args:
+            path (str): File path to open for append.
+        """
+        adir = os.path.dirname(path)
+        if adir != '':
+            make_dirs(adir)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT |
+                          getattr(os, 'O_BINARY', 0), 0o644)
+        self.size = os.fstat(self.fd).st_size
+
+    def write(self, data):
+        """Write data with as few system calls as possible."""
+        view = memoryview(data)
+        while len(view) > 0:
+            written = os.write(self.fd, view)
+            view = view[written:]
+        self.size += len(data)
+
+    def close(self):
+        """Close the file."""
+        os.close(self.fd)
+
+
+def compress_file(path):
+    """Gzip a file and remove it.
+
+    Args:
+        path (str): File path. Gzipped to ``path.gz``.
+    """
+    try:
+        with open(path, 'rb') as fi, gzip.open(path + '.gz', 'wb') as fo:
+            shutil.copyfileobj(fi, fo)
+        os.remove(path)
+    except (IOError, OSError) as e:
+        logging.error("compress_file - failed to gzip {}: {}".format(path, e))
+        return
+    logging.info("compress_file - {} to {}.gz".format(path, path))
+
+
+class File(Output):
+    """File output class.
+
+    Data is written to files of path, which can have time format of
+     ``strftime`` and ``{tag}`` placeholder. Paths are used as chunk keys, so
+     a flushed chunk goes out to one file in a single write.
+
+    Characters of tag other than word, ``.`` and ``-`` are replaced with
+     ``_`` for the placeholder. Rotated files are gzipped in background
+     threads.
+    """
+
+    def __init__(self, path, formatter=None, abuffer=None, max_size=None,
+                 max_open=DEFAULT_MAX_OPEN, compress=False, utc=False):
+        """Init.
+
+        Args:
+            path (str): File path with optional time format and ``{tag}``
+              placeholder. A new file is used when the formatted time changes.
+            formatter (Formatter): Swak formatter for this output.
+            abuffer (Buffer): Swak buffer for this output. Defaults to a
+              memory buffer.
+            max_size (str): Rotate a file when it exceeds this size with
+              suffix. Not rotated if None.
+            max_open (int): Maximum opened files. The least recently used file
+              is closed when exceeded.
+            compress (bool): Gzip rotated files or not.
+            utc (bool): Format time of path in UTC or local time.
+        """
+        logging.info("File.__init__")
+        if max_size is not None:
+            try:
+                max_size = size_value(max_size)
+            except ValueError as e:
+                raise ConfigError(str(e))
+            if max_size <= 0:
+                raise ConfigError("max_size must be greater than 0.")
+        if max_open <= 0:
+            raise ConfigError("max_open must be greater than 0.")
+
+        formatter = formatter if formatter is not None else StdoutFormatter()
+        abuffer = abuffer if abuffer is not None else\
+            MemoryBuffer(None, False)
+        super(File, self).__init__(formatter, abuffer)
+        self.path = path
+        self.max_size = max_size
+        self.max_open = max_open
+        self.compress = compress
+        self.utc = utc
+        self.templated = '%' in path or TAG_PLACEHOLDER in path
+        self.path_cache = {}
+        self.handles = OrderedDict()
+        self.lock = threading.Lock()
+        self.cnt_rotate = 0
+        self.compressors = []
+
+    def render_path(self, tag, utime):
+        """Render path for data.
+
+        Args:
+            tag (str): Data tag.
+            utime (float): Data time stamp.
+
+        Returns:
+            str: File path.
+        """
+        sec = int(utime)
+        key = (tag, sec)
+        path = self.path_cache.get(key)
+        if path is None:
+            if len(self.path_cache) >= MAX_PATH_CACHE:
+                self.path_cache.clear()
+            tm = time.gmtime(sec) if self.utc else time.localtime(sec)
+            path = time.strftime(self.path, tm)
+            path = path.replace(TAG_PLACEHOLDER,
+                                re.sub(r'[^\w.-]', '_', tag))
+            self.path_cache[key] = path
+        return path
+
+    def chunk_keys(self, tag, times):
+        """Return paths of data as chunk keys.
+
+        Args:
+            tag (str): Data tag.
+            times (array): Time stamps of data.
+
+        Returns:
+            list: Paths for each data, or None if the path is not templated.
+        """
+        if not self.templated:
+            return None
+        render = self.render_path
+        return [render(tag, utime) for utime in times]
+
+    def _write(self, bulk, key=None):
+        """Write a bulk to the file of key.
+
+        Args:
+            bulk (bytearray or list): If the chunk that passes the argument is
+              a binary type, bulk is an array of bytes, otherwise it is a list
+              of strings.
+            key (str): File path. Defaults to the path.
+        """
+        if trace.TRACE:
+            logging.debug("File._write")
+        if type(bulk) is list:
+            data = ('\n'.join(bulk) + '\n').encode('utf8')
+        elif isinstance(bulk, bytearray) or self.formatter.binary:
+            data = bulk
+        else:
+            data = (bulk + '\n').encode('utf8')
+
+        path = key if key is not None else self.path
+        with self.lock:
+            handle = self.open_handle(path)
+            if self.max_size is not None and handle.size > 0 and\
+                    handle.size + len(data) > self.max_size:
+                self.rotate(path)
+                handle = self.open_handle(path)
+            handle.write(data)
+
+    def open_handle(self, path):
+        """Return opened handle of path, opening it if needed."""
+        handle = self.handles.pop(path, None)
+        if handle is None:
+            while len(self.handles) >= self.max_open:
+                _, old = self.handles.popitem(last=False)
+                old.close()
+            handle = FileHandle(path)
+        self.handles[path] = handle
+        return handle
+
+    def rotate(self, path):
+        """Close and rename the file of path, then start to gzip it if needed.
+
+        Returns:
+            str: Rotated file path before gzipped.
+        """
+        handle = self.handles.pop(path, None)
+        if handle is not None:
+            handle.close()
+        seq = 1
+        while os.path.exists('{}.{}'.format(path, seq)) or\
+                os.path.exists('{}.{}.gz'.format(path, seq)):
+            seq += 1
+        rpath = '{}.{}'.format(path, seq)
+        os.rename(path, rpath)
+        logging.info("File.rotate - {} to {}".format(path, rpath))
+        if self.compress:
+            self.compressors = [th for th in self.compressors
+                                if th.is_alive()]
+            compressor = threading.Thread(target=compress_file, args=(rpath,),
+                                          name="FileCompressor")
+            compressor.start()
+            self.compressors.append(compressor)
+        self.cnt_rotate += 1
+        return rpath
+
+    def wait_compress(self):
+        """Wait until rotated files are gzipped."""
+        for compressor in self.compressors:
+            compressor.join()
+        self.compressors = []
+
+    def close_handles(self):
+        """Close all opened files."""
+        with self.lock:
+            for handle in self.handles.values():
+                handle.close()
+            self.handles.clear()
+
+    def _stop(self):
+        """Stop and close files."""
+        super(File, self)._stop()
+        self.close_handles()
+
+    def _shutdown(self):
+        """Shut down and close files written at shutdown."""
+        super(File, self)._shutdown()
+        self.close_handles()
+        self.wait_compress()
+
+
+@click.group(chain=True, invoke_without_command=True,
+             help="Output to files.")
+@click.option('-f', '--path', required=True, help="File path. Can have "
+              "strftime format and {tag} placeholder.")
+@click.option('-s', '--max-size', default=None, help="Rotate a file when it "
+              "exceeds this size.")
+@click.option('-n', '--max-open', default=DEFAULT_MAX_OPEN, type=int,
+              show_default=True, help="Maximum opened files.")
+@click.option('-z', '--compress', is_flag=True, help="Gzip rotated files.")
+@click.option('--utc', is_flag=True, help="Format time of path in UTC.")
+@click.pass_context
+def main(ctx, path, max_size, max_open, compress, utc):
+    """Plugin entry."""
+    pass
+
+
+@main.resultcallback()
+def process_components(components, path, max_size, max_open, compress, utc):
+    """Process components and build a File.
+
+    Args:
+        components (list)
+        path (str): File path.
+        max_size (str): Size to rotate.
+        max_open (int): Maximum opened files.
+        compress (bool): Gzip rotated files or not.
+        utc (bool): Format time of path in UTC or not.
+
+    Returns:
+        File
+    """
+    _formatter = _buffer = None
+    for com in components:
+        if isinstance(com, Formatter):
+            _formatter = com
+        if isinstance(com, Buffer):
+            _buffer = com
+    return File(path, _formatter, _buffer, max_size, max_open, compress, utc)
+
+
+main.add_command(f_stdout)
+main.add_command(f_json)
+main.add_command(f_msgpack)
+main.add_command(b_memory)
+main.add_command(b_file)
+
+
+if __name__ == '__main__':
+    main()
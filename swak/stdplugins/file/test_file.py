@@ -0,0 +1,107 @@
+"""Test file output plugin."""
+import os
+import gzip
+import calendar
+
+import pytest
+
+from swak.core import TRunAgent
+from swak.exception import ConfigError
+from swak.memorybuffer import MemoryBuffer
+from swak.filebuffer import FileBuffer
+from swak.data import MultiDataStream
+
+from .o_file import File
+
+UTIME = calendar.timegm((2017, 9, 29, 1, 56, 26))
+
+
+def test_file_basic(tmpdir):
+    """Test writing files by time and tag."""
+    with pytest.raises(ConfigError):
+        File('out', max_open=0)
+
+    path = str(tmpdir.join('{tag}', '%Y%m%d%H.log'))
+    out = File(path, utc=True)
+    ds = MultiDataStream([UTIME, UTIME + 1, UTIME + 3600],
+                         [dict(k=1), dict(k=2), dict(k=3)])
+    out.emit_stream('a', ds, None)
+    out.emit_stream('b', ds[:1], None)
+    # different paths go to different chunks.
+    assert 3 == out.buffer.num_chunk
+    out.flush(True)
+    out.close_handles()
+
+    with open(str(tmpdir.join('a', '2017092901.log'))) as f:
+        lines = f.readlines()
+    assert 2 == len(lines)
+    assert "'k': 2" in lines[1]
+    assert os.path.isfile(str(tmpdir.join('a', '2017092902.log')))
+    assert os.path.isfile(str(tmpdir.join('b', '2017092901.log')))
+
+    # tag can not escape the directory.
+    out.emit_stream('../c d', ds[:1], None)
+    out.flush(True)
+    out.close_handles()
+    assert os.path.isfile(str(tmpdir.join('.._c_d', '2017092901.log')))
+
+
+def test_file_rotate(tmpdir):
+    """Test size rotation and open file limit."""
+    path = str(tmpdir.join('out.log'))
+    out = File(path, abuffer=MemoryBuffer(None, False, chunk_max_record=2),
+               max_size='10', compress=True)
+    ds = MultiDataStream([0, 1, 2, 3], ['0123', '4567', 'abcd', 'efgh'])
+    out.emit_stream('test', ds, None)
+    out.flush(True)
+    out.close_handles()
+    assert 1 == out.cnt_rotate
+    out.wait_compress()
+    assert not os.path.exists(path + '.1')
+    with gzip.open(path + '.1.gz') as f:
+        assert 2 == len(f.readlines())
+    with open(path) as f:
+        assert 2 == len(f.readlines())
+
+    # least recently used file is closed.
+    out = File(str(tmpdir.join('%S.log')), max_open=1, utc=True)
+    out.emit_stream('test', ds, None)
+    out.flush(True)
+    assert 1 == len(out.handles)
+    out.close_handles()
+    for i in range(4):
+        assert os.path.isfile(str(tmpdir.join('{:02d}.log'.format(i))))
+
+
+def test_file_restart(tmpdir):
+    """Test chunks left by the previous run are written to their paths."""
+    path = str(tmpdir.join('out', '%Y-{tag}.log'))
+    chunk_dir = str(tmpdir.join('chunks'))
+    out = File(path, abuffer=FileBuffer(None, False, chunk_dir), utc=True)
+    out.start()
+    out.emit_stream('a', MultiDataStream([UTIME], [dict(k=1)]), None)
+    # dies with the chunk left.
+    out.stop()
+    out.shutdown()
+    assert len(os.listdir(chunk_dir)) == 2
+
+    out = File(path, abuffer=FileBuffer(None, False, chunk_dir), utc=True)
+    out.start()
+    out.stop()
+    out.flush(True)
+    out.close_handles()
+    with open(str(tmpdir.join('out', '2017-a.log'))) as f:
+        assert "'k': 1" in f.read()
+    assert not os.path.exists(path)
+    assert len(os.listdir(chunk_dir)) == 0
+
+
+def test_file_cmds(tmpdir):
+    """Test file output with trun cmds."""
+    path = str(tmpdir.join('out.log'))
+    TRunAgent().run_commands('i.counter -n 3 | o.file -f {} f.json'.
+                             format(path))
+    with open(path) as f:
+        lines = f.readlines()
+    assert 3 == len(lines)
+    assert '"f1":3' in lines[2]
@@ -0,0 +1,430 @@
+"""File tail input plugin module."""
+from __future__ import absolute_import
+
+import os
+import re
+import sys
+import glob
+import time
+import errno
+import select
+import hashlib
+import logging
+import ctypes
+import ctypes.util
+
+import click
+
+from swak.plugin import TextInput
+from swak.config import get_exe_dir
+from swak.util import size_value, make_dirs
+from swak.exception import ConfigError
+
+DEFAULT_READ_SIZE = '64k'
+DEFAULT_POLL_INTERVAL = 0.5
+DEFAULT_ENCODING = 'utf-8'
+# Maximum blocks to read from a file at once, so that other files are served.
+MAX_READ_BLOCK = 16
+
+# inotify events to wake up.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO |\
+    IN_CREATE | IN_DELETE
+
+
+class Inotify(object):
+    """Minimal inotify wrapper to wait for changes in directories."""
+
+    def __init__(self, libc, fd):
+        """Init.
+
+        Args:
+            libc (ctypes.CDLL): C library.
+            fd (int): Inotify file descriptor.
+        """
+        self.libc = libc
+        self.fd = fd
+        self.watches = {}
+
+    @classmethod
+    def create(cls):
+        """Create an inotify instance.
+
+        Returns:
+            Inotify: Inotify instance, or None if not supported.
+        """
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK |
+                                    getattr(os, 'O_CLOEXEC', 0))
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def watch(self, adir):
+        """Watch a directory for changes of files in it."""
+        if adir in self.watches:
+            return
+        path = adir.encode(sys.getfilesystemencoding())
+        wd = self.libc.inotify_add_watch(self.fd, path, WATCH_MASK)
+        if wd >= 0:
+            self.watches[adir] = wd
+
+    def wait(self, timeout):
+        """Wait for changes.
+
+        Args:
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            bool: True if there were changes.
+        """
+        try:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+        except (OSError, select.error):
+            # interrupted
+            return False
+        if len(readable) == 0:
+            return False
+        # events are not inspected, just drained.
+        try:
+            while len(os.read(self.fd, 65536)) > 0:
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        return True
+
+    def close(self):
+        """Close inotify."""
+        os.close(self.fd)
+
+
+class TailFile(object):
+    """A file being tailed.
+
+    Attributes:
+        pos (int): Offset after the last line passed to the input.
+    """
+
+    def __init__(self, path):
+        """Init.
+
+        Args:
+            path (str): File path.
+
+        Raises:
+            OSError: If the file can't be opened.
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self.inode = os.fstat(self.fd).st_ino
+        self.pos = 0
+        self.read_pos = 0
+        self.remain = b''
+
+    def seek(self, pos):
+        """Seek to a position to read from."""
+        os.lseek(self.fd, pos, os.SEEK_SET)
+        self.pos = self.read_pos = pos
+        self.remain = b''
+
+    @property
+    def size(self):
+        """Return size of the opened file."""
+        return os.fstat(self.fd).st_size
+
+    def read_lines(self, read_size, max_block=MAX_READ_BLOCK):
+        """Read blocks and split them into lines.
+
+        Args:
+            read_size (int): Block size to read.
+            max_block (int): Maximum number of blocks to read.
+
+        Returns:
+            list: Complete lines without line separator.
+        """
+        if self.size < self.read_pos:
+            logging.info("TailFile.read_lines - {} truncated".
+                         format(self.path))
+            self.seek(0)
+
+        blocks = [self.remain]
+        for _ in range(max_block):
+            block = os.read(self.fd, read_size)
+            if len(block) == 0:
+                break
+            self.read_pos += len(block)
+            blocks.append(block)
+        if len(blocks) == 1:
+            return []
+        lines = b''.join(blocks).split(b'\n')
+        self.remain = lines.pop()
+        return lines
+
+    def rotated(self):
+        """Check rotation of the file.
+
+        Returns:
+            bool: True if the path is removed or points another file.
+        """
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return True
+
+    def close(self):
+        """Close the file."""
+        os.close(self.fd)
+
+
+class FileTail(TextInput):
+    """FileTail class.
+
+    Follow files matching a glob pattern from one thread. Files are read by
+     large blocks and split into lines in bulk. Changes are waited with
+     inotify if possible, or by polling otherwise.
+
+    Positions of files are saved in a position file, so that tailing resumes
+     from there after restart.
+    """
+
+    def __init__(self, path, pos_file=None, read_from_head=False,
+                 read_size=DEFAULT_READ_SIZE,
+                 poll_interval=DEFAULT_POLL_INTERVAL,
+                 encoding=DEFAULT_ENCODING):
+        """Init.
+
+        Args:
+            path (str): Glob pattern of files to tail.
+            pos_file (str): Position file path. Defaults to
+              ``SWAK_HOME/run/filetail/TAG-HASH.pos``, where ``HASH`` is from
+              the glob pattern, so that each source has its own file.
+            read_from_head (bool): Read files found at start from the head,
+              instead of the end. Files found later are read from the head.
+            read_size (str): Block size to read with size suffix.
+            poll_interval (float): Maximum seconds to wait for changes.
+            encoding (str): Encoding of files.
+        """
+        super(FileTail, self).__init__()
+        try:
+            read_size = size_value(read_size)
+        except ValueError as e:
+            raise ConfigError(str(e))
+        if read_size <= 0:
+            raise ConfigError("read_size must be greater than 0.")
+        if poll_interval <= 0:
+            raise ConfigError("poll_interval must be greater than 0.")
+
+        self.path = path
+        self.pos_file = pos_file
+        self.read_from_head = read_from_head
+        self.read_size = read_size
+        self.poll_interval = poll_interval
+        self.set_encoding(encoding)
+        self.tails = {}
+        self.positions = {}
+        self.saved = None
+        self.inotify = None
+
+    @property
+    def pos_path(self):
+        """Return path of the position file."""
+        if self.pos_file is not None:
+            return self.pos_file
+        home = os.environ.get('SWAK_HOME', get_exe_dir())
+        name = 'default' if self.tag is None else\
+            re.sub(r'[^\w.-]', '_', self.tag)
+        digest = hashlib.md5(os.path.abspath(self.path).encode('utf8'))
+        name = '{}-{}.pos'.format(name, digest.hexdigest()[:8])
+        return os.path.join(home, 'run', 'filetail', name)
+
+    def load_positions(self):
+        """Load positions of files from the position file.
+
+        Returns:
+            dict: (inode, position) by file path.
+        """
+        positions = {}
+        path = self.pos_path
+        if os.path.isfile(path):
+            with open(path, 'rt') as f:
+                for line in f:
+                    elms = line.rstrip('\n').split('\t')
+                    if len(elms) != 3:
+                        continue
+                    positions[elms[0]] = (int(elms[1], 16), int(elms[2], 16))
+        return positions
+
+    def save_positions(self):
+        """Save positions of tailed files, if changed."""
+        lines = ['{}\t{:x}\t{:x}\n'.format(tail.path, tail.inode, tail.pos)
+                 for tail in self.tails.values()]
+        content = ''.join(sorted(lines))
+        if content == self.saved:
+            return
+        path = self.pos_path
+        make_dirs(os.path.dirname(path))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wt') as f:
+            f.write(content)
+        if os.name == 'nt' and os.path.isfile(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+        self.saved = content
+
+    def scan(self, first):
+        """Find new files to tail.
+
+        Args:
+            first (bool): Whether this is the first scan.
+        """
+        for path in sorted(glob.glob(self.path)):
+            if path in self.tails or not os.path.isfile(path):
+                continue
+            try:
+                tail = TailFile(path)
+            except OSError as e:
+                logging.warning("FileTail.scan - can't open {}: {}".
+                                format(path, e))
+                continue
+            inode, pos = self.positions.pop(path, (None, None))
+            if inode == tail.inode and pos <= tail.size:
+                tail.seek(pos)
+            elif first and not self.read_from_head:
+                tail.seek(tail.size)
+            logging.info("FileTail.scan - tail {} from {}".
+                         format(path, tail.pos))
+            self.tails[path] = tail
+            if self.inotify is not None:
+                self.inotify.watch(os.path.dirname(os.path.abspath(path)))
+
+    def tail_lines(self, tail):
+        """Generate lines of a file, following its rotation.
+
+        Position of the file is advanced after a line is taken.
+
+        Args:
+            tail (TailFile): A file being tailed.
+
+        Yields:
+            bytes: A line.
+        """
+        for line in tail.read_lines(self.read_size):
+            yield line
+            tail.pos += len(line) + 1
+
+        if not tail.rotated():
+            return
+        # drain the rotated file
+        lines = tail.read_lines(self.read_size, sys.maxsize)
+        if len(tail.remain) > 0:
+            lines.append(tail.remain)
+        tail.close()
+        del self.tails[tail.path]
+        logging.info("FileTail.tail_lines - {} rotated".format(tail.path))
+        for line in lines:
+            yield line
+        try:
+            new_tail = TailFile(tail.path)
+        except OSError:
+            return
+        self.tails[tail.path] = new_tail
+
+    def wait(self, timeout):
+        """Wait for changes of files.
+
+        Returns:
+            bool: True if there were changes, False if unknown.
+        """
+        if self.inotify is not None:
+            return self.inotify.wait(timeout)
+        time.sleep(timeout)
+        return False
+
+    def generate_line(self):
+        """Generate lines of files.
+
+        Yields an empty line when there is no new line.
+
+        Yields:
+            bytes: A line.
+        """
+        self.positions = self.load_positions()
+        self.inotify = Inotify.create()
+        if self.inotify is None:
+            logging.info("FileTail - inotify is not available, poll files.")
+        else:
+            pattern_dir = os.path.dirname(os.path.abspath(self.path))
+            if not glob.has_magic(pattern_dir) and os.path.isdir(pattern_dir):
+                self.inotify.watch(pattern_dir)
+
+        timeout = self.poll_interval
+        if self.batch_max_latency is not None:
+            timeout = min(timeout, self.batch_max_latency)
+        first = changed = True
+        last_scan = None
+        while True:
+            now = time.time()
+            if changed or now - last_scan >= self.poll_interval:
+                self.scan(first)
+                first = False
+                last_scan = now
+
+            idle = True
+            for tail in list(self.tails.values()):
+                for line in self.tail_lines(tail):
+                    idle = False
+                    yield line
+
+            changed = False
+            if idle:
+                self.save_positions()
+                yield b''
+                changed = self.wait(timeout)
+
+    def _stop(self):
+        """Save positions and close files."""
+        super(FileTail, self)._stop()
+        self.save_positions()
+        for tail in self.tails.values():
+            tail.close()
+        self.tails = {}
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+@click.command(help="Tail files.")
+@click.option('-f', '--file', 'path', required=True, help="Glob pattern of "
+              "files to tail.")
+@click.option('-p', '--pos-file', default=None, help="Position file path. "
+              "Defaults to SWAK_HOME/run/filetail/TAG-HASH.pos, HASH from the "
+              "glob pattern.")
+@click.option('--read-from-head', is_flag=True, help="Read files found at "
+              "start from the head.")
+@click.option('-s', '--read-size', default=DEFAULT_READ_SIZE,
+              show_default=True, help="Block size to read.")
+@click.option('-i', '--poll-interval', default=DEFAULT_POLL_INTERVAL,
+              type=float, show_default=True, help="Maximum seconds to wait "
+              "for changes.")
+@click.option('-e', '--encoding', default=DEFAULT_ENCODING,
+              show_default=True, help="Encoding of files.")
+def main(path, pos_file, read_from_head, read_size, poll_interval, encoding):
+    """Plugin entry."""
+    return FileTail(path, pos_file, read_from_head, read_size, poll_interval,
+                    encoding)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Test file tail plugin."""
+import os
+import threading
+
+import pytest
+
+from swak.exception import ConfigError
+
+from .i_filetail import FileTail, Inotify
+
+
+def read_until_idle(gen):
+    """Read lines from data generator until no more line."""
+    lines = []
+    while True:
+        _, line = next(gen)
+        if len(line) == 0:
+            return lines
+        lines.append(line)
+
+
+def append_lines(path, lines):
+    """Append lines to a file."""
+    with open(path, 'ab') as f:
+        f.write(lines)
+
+
+@pytest.mark.parametrize('inotify', [True, False])
+def test_filetail_basic(tmpdir, monkeypatch, inotify):
+    """Test tailing files with rotation and position file."""
+    if not inotify:
+        monkeypatch.setattr(Inotify, 'create', classmethod(lambda cls: None))
+    with pytest.raises(ConfigError):
+        FileTail('*.log', read_size='0')
+
+    path = str(tmpdir.join('a.log'))
+    pos_path = str(tmpdir.join('tail.pos'))
+    append_lines(path, b'old1\nold2\n')
+    ftail = FileTail(str(tmpdir.join('*.log')), pos_path, poll_interval=0.01)
+    ftail.start()
+    stop_event = threading.Event()
+    gen = ftail.generate_data(stop_event)
+    # start from the end of existing file.
+    assert [] == read_until_idle(gen)
+
+    append_lines(path, b'line1\nline2\nli')
+    assert ['line1', 'line2'] == read_until_idle(gen)
+    append_lines(path, b'ne3\n')
+    assert ['line3'] == read_until_idle(gen)
+
+    # new file matching the pattern is read from the head.
+    path_b = str(tmpdir.join('b.log'))
+    append_lines(path_b, b'b1\n')
+    assert ['b1'] == read_until_idle(gen)
+
+    # rename rotation.
+    append_lines(path, b'line4\n')
+    os.rename(path, path + '.1')
+    append_lines(path, b'new1\n')
+    assert ['line4', 'new1'] == read_until_idle(gen)
+
+    # truncation.
+    open(path, 'wb').close()
+    assert [] == read_until_idle(gen)
+    append_lines(path, b'trunc1\n')
+    assert ['trunc1'] == read_until_idle(gen)
+
+    # resume from the position file, without the line dropped by stop.
+    append_lines(path, b'line5\n')
+    _, line = next(gen)
+    assert 'line5' == line
+    append_lines(path, b'line6\n')
+    stop_event.set()
+    with pytest.raises(StopIteration):
+        next(gen)
+    ftail.stop()
+    ftail = FileTail(str(tmpdir.join('*.log')), pos_path, poll_interval=0.01)
+    ftail.start()
+    gen = ftail.generate_data(threading.Event())
+    assert ['line6'] == read_until_idle(gen)
+    ftail.stop()
+
+
+def test_filetail_pos_path(tmpdir, monkeypatch):
+    """Test default position files of sources do not collide."""
+    monkeypatch.setenv('SWAK_HOME', str(tmpdir))
+    tails = [FileTail('/var/log/a/*.log'), FileTail('/var/log/b/*.log')]
+    for tail in tails:
+        tail.set_tag('test')
+    assert tails[0].pos_path != tails[1].pos_path
+    assert os.path.basename(tails[0].pos_path).startswith('test-')
+    # stable for the same pattern.
+    assert tails[0].pos_path == FileTail('/var/log/a/*.log').pos_path.\
+        replace('default-', 'test-')
+    assert FileTail('*.log', 'my.pos').pos_path == 'my.pos'
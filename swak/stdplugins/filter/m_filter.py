@@ -1,6 +1,8 @@
 from __future__ import absolute_import  # NOQA
 """This module implements modifier plugin of filter."""
 import re
+from array import array
+from itertools import compress
 
 import click
 
@@ -28,6 +30,7 @@ class Filter(Modifier):
             includes (list): Regular expressions to include
             excludes (list): Regular expressions to exclude
         """
+        super(Filter, self).__init__()
         self.includes = make_effective_patterns(includes)
         self.excludes = make_effective_patterns(excludes)
 
@@ -53,18 +56,51 @@ class Filter(Modifier):
         """
         if not self.includes and not self.excludes:
             return utime, record
+        if not self.accept(record):
+            return None
+        return utime, record
+
+    def accept(self, record):
+        """Check whether a record is included.
+
+        Args:
+            record (dict): data record
 
+        Returns:
+            bool: True if included, False otherwise.
+        """
         for key, regexp in self.excludes.items():
             if key in record:
                 if regexp.search(record[key]) is not None:
-                    return None
+                    return False
 
         for key, regexp in self.includes.items():
             if key not in record:
-                return None
+                return False
             if regexp.search(record[key]) is None:
-                return None
-        return utime, record
+                return False
+        return True
+
+    def modify_batch(self, tag, times, records):
+        """Modify columns of data by filtering.
+
+        Args:
+            tag (str): data tag
+            times (array or memoryview): Data time stamps.
+            records (list): Data records.
+
+        Returns:
+            array or memoryview: Time stamps of included records.
+            list: Included records.
+        """
+        if not self.includes and not self.excludes:
+            return times, records
+        accept = self.accept
+        selectors = [accept(record) for record in records]
+        if all(selectors):
+            return times, records
+        return array('d', compress(times, selectors)),\
+            list(compress(records, selectors))
 
 
 @click.command(help="Filter data by regular expression.")
@@ -1,4 +1,5 @@
 """Test filter plugin."""
+from array import array
 
 from .m_filter import Filter
 
@@ -77,3 +78,19 @@ def test_filter_basic():
     filter = Filter(includes, excludes)
     def_output = emit_for_modifiers([filter])
     assert len(def_output.bulks) == 1
+
+
+def test_filter_batch():
+    """Test filtering columns of data."""
+    records = [{"k1": "a"}, {"k1": "b"}, {"k1": "c"}]
+    times = array('d', [0, 1, 2])
+    filter = Filter([("k1", "a|c")])
+    mtimes, mrecords = filter.modify_batch("test", times, records)
+    assert list(mtimes) == [0, 2]
+    assert mrecords == [{"k1": "a"}, {"k1": "c"}]
+
+    # all included, columns are passed as is.
+    filter = Filter([], [("k1", "d")])
+    mtimes, mrecords = filter.modify_batch("test", times, records)
+    assert mtimes is times
+    assert mrecords is records
@@ -0,0 +1,177 @@
+"""Null output module."""
+from __future__ import absolute_import
+
+import time
+import logging
+
+import click
+
+from swak.plugin import Output
+from swak.formatter import Formatter, StdoutFormatter
+from swak.buffer import Buffer
+from swak.clicmds import f_stdout, f_json, b_memory
+from swak.metrics import Histogram
+from swak.util import time_value
+from swak.exception import ConfigError
+
+
+class Null(Output):
+    """Null output class.
+
+    Formats data and discards them. End-to-end latency from the time of each
+     data to its arrival at this output is measured.
+
+    Without formatting, records are only counted, which is the cheapest sink
+     to measure throughput of inputs, modifiers and the router. Latency is
+     then sampled from the first and the last data of each stream.
+    """
+
+    def __init__(self, formatter=None, abuffer=None, no_format=False,
+                 report_interval=None):
+        """Init.
+
+        Args:
+            formatter (Formatter): Swak formatter for this output.
+            abuffer (Buffer): Swak buffer for this output.
+            no_format (bool): Count records without formatting them. Bytes
+              are not counted.
+            report_interval (str): Interval to log rates of received records
+              and written bytes, with time suffix. Not logged if None.
+        """
+        logging.info("Null.__init__")
+        if no_format and abuffer is not None:
+            raise ConfigError("no_format can not be used with a buffer.")
+        try:
+            report_interval = time_value(report_interval)
+        except ValueError as e:
+            raise ConfigError(str(e))
+        formatter = formatter if formatter is not None else StdoutFormatter()
+        super(Null, self).__init__(formatter, abuffer)
+        self.e2e_latency = Histogram()
+        self.no_format = no_format
+        self.report_interval = report_interval
+        self.reported = None
+
+    def _start(self):
+        """Start and begin rate reporting."""
+        super(Null, self)._start()
+        self.reported = (time.time(), 0, 0)
+
+    def _stop(self):
+        """Stop and report the last rates."""
+        super(Null, self)._stop()
+        if self.report_interval is not None:
+            self.report_rate(time.time())
+
+    def may_flushing(self, last_flush_interval=None):
+        """Flushing if needed, and report rates if the interval passed.
+
+        Args:
+            last_flush_interval (float): Force flushing interval for input
+              is terminated.
+        """
+        super(Null, self).may_flushing(last_flush_interval)
+        if self.report_interval is not None and self.reported is not None:
+            now = time.time()
+            if now - self.reported[0] >= self.report_interval:
+                self.report_rate(now)
+
+    def report_rate(self, now):
+        """Log rates since the last report.
+
+        Args:
+            now (float): Current time stamp.
+        """
+        if self.reported is None:
+            return
+        rtime, records, nbytes = self.reported
+        metrics = self.metrics
+        elapsed = max(now - rtime, 1e-6)
+        logging.info("Null - {} records {:.1f}/s, {} bytes {:.1f}/s".
+                     format(metrics.records_in,
+                            (metrics.records_in - records) / elapsed,
+                            metrics.bytes_out,
+                            (metrics.bytes_out - nbytes) / elapsed))
+        self.reported = (now, metrics.records_in, metrics.bytes_out)
+
+    def snapshot_metrics(self):
+        """Return current values of metrics with end-to-end latency.
+
+        Returns:
+            dict: Metric values.
+        """
+        snap = super(Null, self).snapshot_metrics()
+        snap['e2e_latency'] = self.e2e_latency.snapshot()
+        return snap
+
+    def emit_stream(self, tag, ds, stop_event):
+        """Measure end-to-end latency, then emit data stream.
+
+        Args:
+            tag (str): Data tag.
+            ds (datatream): Data stream.
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            int: Adding size of the stream.
+        """
+        now = time.time()
+        observe = self.e2e_latency.observe
+        if self.no_format:
+            # only the first and the last data are sampled to count cheaply.
+            times = ds.times
+            if len(times) > 0:
+                observe(now - times[0])
+            if len(times) > 1:
+                observe(now - times[-1])
+            self.metrics.count(len(ds), 0)
+            return 0
+        for utime in ds.times:
+            observe(now - utime)
+        return super(Null, self).emit_stream(tag, ds, stop_event)
+
+    def _write(self, bulk):
+        """Discard a bulk.
+
+        Args:
+            bulk (bytearray or list): Formatted data.
+        """
+        pass
+
+
+@click.group(chain=True, invoke_without_command=True,
+             help="Output to nowhere.")
+@click.option('-n', '--no-format', is_flag=True, help="Count records "
+              "without formatting them. Bytes are not counted.")
+@click.option('-r', '--report-interval', default=None, type=str,
+              help="Interval to log rates of records and bytes.")
+@click.pass_context
+def main(ctx, no_format, report_interval):
+    """Plugin entry."""
+    pass
+
+
+@main.resultcallback()
+def process_components(components, no_format, report_interval):
+    """Process components and build a Null.
+
+    Args:
+        components (list)
+        no_format (bool): Count records without formatting them.
+        report_interval (str): Interval to log rates.
+
+    Returns:
+        Null
+    """
+    _formatter = _buffer = None
+    for com in components:
+        if isinstance(com, Formatter):
+            _formatter = com
+        if isinstance(com, Buffer):
+            _buffer = com
+    return Null(_formatter, _buffer, no_format, report_interval)
+
+
+main.add_command(f_stdout)
+main.add_command(f_json)
+main.add_command(b_memory)
@@ -0,0 +1,69 @@
+"""Test null plugin."""
+import time
+import logging
+
+import pytest
+
+from swak.core import TRunAgent
+from swak.data import MultiDataStream
+from swak.formatter import JsonFormatter
+from swak.memorybuffer import MemoryBuffer
+from swak.exception import ConfigError
+
+from .o_null import Null
+
+
+def test_null_basic(capsys):
+    """Test basic features of null plugin."""
+    null = Null(JsonFormatter())
+    now = time.time()
+    ds = MultiDataStream([now - 0.5, now - 0.5], [dict(k=1), dict(k=2)])
+    null.emit_stream('test', ds, None)
+    metrics = null.snapshot_metrics()
+    assert metrics['records_in'] == 2
+    assert metrics['bytes_out'] > 0
+    latency = metrics['e2e_latency']
+    assert latency['count'] == 2
+    assert 0.5 <= latency['sum'] / 2 < 1.0
+
+    TRunAgent().run_commands('i.counter -n 3 | o.null')
+    out, err = capsys.readouterr()
+    assert out == ''
+
+
+def test_null_count(caplog):
+    """Test counting and rate report of null plugin."""
+    caplog.set_level(logging.INFO)
+    null = Null(no_format=True, report_interval='1s')
+    null.start()
+    ds = MultiDataStream([time.time()] * 3, [dict(k=1)] * 3)
+    assert null.emit_stream('test', ds, None) == 0
+    metrics = null.snapshot_metrics()
+    assert metrics['records_in'] == 3
+    assert metrics['bytes_out'] == 0
+    # latency is sampled from the first and the last data.
+    assert metrics['e2e_latency']['count'] == 2
+    null.stop()
+    assert 'Null - 3 records' in caplog.text
+
+    with pytest.raises(ConfigError):
+        Null(abuffer=MemoryBuffer(None, False), no_format=True)
+    with pytest.raises(ConfigError):
+        Null(report_interval='x')
+
+    # with memory buffer
+    null = Null(JsonFormatter(), MemoryBuffer(None, False, flush_workers=0))
+    assert null.buffer.binary
+    null.start()
+    null.emit_stream('test', ds, None)
+    null.flush(True)
+    null.stop()
+    metrics = null.snapshot_metrics()
+    assert metrics['records_in'] == 3
+    assert metrics['bytes_out'] > 0
+
+    agent = TRunAgent()
+    agent.run_commands('i.counter -n 10 | o.null -r 1s b.memory -f 1s')
+    output = agent.pluginpod.plugins[-1]
+    assert output.buffer is not None
+    assert output.metrics.records_in == 10
@@ -2,19 +2,29 @@ from __future__ import absolute_import  # NOQA
 """This module implements modifier plugin of reform."""
 
 import re
+import time
 import socket
 import logging
+from string import Formatter
 
 import click
 from six import string_types
 
 from swak.plugin import Modifier
+from swak.util import time_value
+from swak.exception import ConfigError
 
 # Syntax patterns
 ptrn_tag_parts = re.compile(r'{tag_parts\[(-?\d)\]}')
 ptrn_hostaddr_parts = re.compile(r'{hostaddr_parts\[(-?\d)\]}')
 ptrn_variable = re.compile(r'\$\{([^}]+?)\}')
 ptrn_curly_bracket = re.compile(r'([^\$]|^)\{([^}]+?)\}')
+ptrn_field_key = re.compile(r'\.([^.\[]+)|\[([^\]]+)\]')
+
+# Placeholders which vary by record.
+RECORD_FIELDS = ('record', 'time')
+# Maximum number of tags to cache expanded templates.
+MAX_TAG_CACHE = 1024
 
 
 def _tag_prefix(tag_parts):
@@ -91,6 +101,119 @@ def _expand(val, placeholders):
     return val.format(**placeholders)
 
 
+def _split_field(field_name):
+    """Split a format field name into the root name and keys.
+
+    Unlike ``str.format``, a negative index is supported.
+
+    Args:
+        field_name (str): Field name like ``record[f1]`` or ``tag_parts[-1]``.
+
+    Returns:
+        str: Root name.
+        list: List of (is_item, key) tuple.
+    """
+    pos = 0
+    while pos < len(field_name) and field_name[pos] not in '.[':
+        pos += 1
+    root = field_name[:pos]
+    keys = []
+    while pos < len(field_name):
+        m = ptrn_field_key.match(field_name, pos)
+        if m is None:
+            raise ValueError("Invalid field name '{}'".format(field_name))
+        attr, item = m.groups()
+        if attr is not None:
+            keys.append((False, attr))
+        else:
+            try:
+                item = int(item)
+            except ValueError:
+                pass
+            keys.append((True, item))
+        pos = m.end()
+    return root, keys
+
+
+def _compile(expr):
+    """Compile a value expression into template parts.
+
+    Args:
+        expr (str): Value expression.
+
+    Returns:
+        list: Literal strings and (field_name, root, keys, conversion, spec)
+          tuples for fields, or None if the expression needs the slow path.
+    """
+    parts = []
+    try:
+        for lit, field_name, spec, conv in Formatter().parse(_normalize(expr)):
+            if lit:
+                if len(parts) > 0 and not isinstance(parts[-1], tuple):
+                    parts[-1] += lit
+                else:
+                    parts.append(lit)
+            if field_name is None:
+                continue
+            if '{' in spec or conv not in (None, 'r', 's') or\
+                    field_name == '' or field_name.isdigit():
+                return None
+            root, keys = _split_field(field_name)
+            parts.append((field_name, root, keys, conv, spec))
+    except ValueError:
+        return None
+    return parts
+
+
+def _render_field(field, placeholders):
+    """Render a field of template with placeholders."""
+    _, root, keys, conv, spec = field
+    obj = placeholders[root]
+    for is_item, key in keys:
+        obj = obj[key] if is_item else getattr(obj, key)
+    if conv == 'r':
+        obj = repr(obj)
+    elif conv == 's':
+        obj = str(obj)
+    return format(obj, spec)
+
+
+def _bind(parts, placeholders):
+    """Bind template parts with placeholders of a tag.
+
+    Fields except for record specific ones are rendered now.
+
+    Args:
+        parts (list): Compiled template parts.
+        placeholders (dict): Placeholders for a tag.
+
+    Returns:
+        str: Rendered value if there is no record field. Otherwise None.
+        str: Format string for record fields.
+    """
+    texts = []
+    fmts = []
+    dynamic = False
+    for part in parts:
+        if isinstance(part, tuple) and part[1] in RECORD_FIELDS:
+            field_name, _, _, conv, spec = part
+            dynamic = True
+            fmt = '{' + field_name
+            if conv:
+                fmt += '!' + conv
+            if spec:
+                fmt += ':' + spec
+            fmts.append(fmt + '}')
+            continue
+        text = part if not isinstance(part, tuple) else\
+            _render_field(part, placeholders)
+        texts.append(text)
+        fmts.append(text.replace('{', '{{').replace('}', '}}'))
+    if not dynamic:
+        return ''.join(texts), None
+    return None, ''.join(fmts)
+
+
 def _make_default_placeholders():
     """Make a default placeholder."""
     pholder = {}
@@ -99,6 +222,7 @@ def _make_default_placeholders():
     hostaddr = socket.gethostbyname(hostname)
     pholder['hostaddr'] = hostaddr
     hostaddr_parts = hostaddr.split('.')
+    pholder['hostaddr_parts'] = hostaddr_parts
     for i in range(4):
         key = '{{hostaddr_parts[{}]}}'.format(i)
         pholder[key] = hostaddr_parts[i]
@@ -108,21 +232,54 @@ def _make_default_placeholders():
 
 
 class Reform(Modifier):
-    """Reform class."""
+    """Reform class.
+
+    Value expressions are compiled once. For each tag, every placeholder
+     except for ``record`` and ``time`` is expanded and cached, so a record
+     is modified by a constant or a single ``str.format``.
+    """
 
-    def __init__(self, writes, deletes=[]):
+    def __init__(self, writes, deletes=[], host_refresh=None):
         """Init.
 
         Args:
             writes (list): List of (key, value) tuple to add.
             deletes (list): List of key to delete.
+            host_refresh (str): Interval to refresh host placeholders with
+              time suffix. Never refresh if None.
         """
         super(Reform, self).__init__()
         for k, v in writes:
             assert isinstance(k, string_types), "Key must be a string"
-            assert isinstance(k, string_types), "Value must be a string"
+            assert isinstance(v, string_types), "Value must be a string"
+        try:
+            host_refresh = time_value(host_refresh)
+        except ValueError as e:
+            raise ConfigError(str(e))
+        if host_refresh is not None and host_refresh <= 0:
+            raise ConfigError("host_refresh must be greater than 0.")
         self.writes = writes
         self.deletes = deletes
+        self.host_refresh = host_refresh
+        self.templates = [(k, _compile(v)) for k, v in writes]
+        self.host_placeholders = None
+        self.host_time = None
+        self.tag_cache = {}
+        self.placeholders = None
+        self.bound = None
+
+    def update_host_placeholders(self):
+        """Update host placeholders if not resolved or need refresh."""
+        now = time.time()
+        if self.host_placeholders is not None and\
+                (self.host_refresh is None or
+                 now - self.host_time < self.host_refresh):
+            return
+        logging.debug("Reform.update_host_placeholders")
+        self.host_placeholders = _make_default_placeholders()
+        self.host_time = now
+        # templates were bound with old host placeholders.
+        self.tag_cache = {}
 
     def prepare_for_stream(self, tag, ds):
         """Prepare to modify data stream.
@@ -131,7 +288,46 @@ class Reform(Modifier):
             tag (str): data tag
             ds (datatream): data stream
         """
-        placeholders = _make_default_placeholders()
+        self.update_host_placeholders()
+        cached = self.tag_cache.get(tag)
+        if cached is None:
+            if len(self.tag_cache) >= MAX_TAG_CACHE:
+                self.tag_cache = {}
+            placeholders = self.make_placeholders(tag)
+            cached = placeholders, self.bind(placeholders)
+            self.tag_cache[tag] = cached
+        self.placeholders, self.bound = cached
+
+    def bind(self, placeholders):
+        """Bind write templates with placeholders of a tag.
+
+        Args:
+            placeholders (dict): Placeholders for a tag.
+
+        Returns:
+            list: List of (key, value, format) tuple. ``value`` is a constant
+              value, ``format`` is a function to render the value for a
+              record, or None.
+        """
+        bound = []
+        for key, parts in self.templates:
+            if parts is None:
+                bound.append((key, None, None))
+                continue
+            value, fmt = _bind(parts, placeholders)
+            bound.append((key, value, None if fmt is None else fmt.format))
+        return bound
+
+    def make_placeholders(self, tag):
+        """Make placeholders for a tag.
+
+        Args:
+            tag (str): data tag
+
+        Returns:
+            dict: Placeholders.
+        """
+        placeholders = dict(self.host_placeholders)
         placeholders['tag'] = tag
         tag_parts = tag.split('.')
         tp_cnt = len(tag_parts)
@@ -146,7 +342,7 @@ class Reform(Modifier):
 
         placeholders['tag_prefix'] = _tag_prefix(tag_parts)
         placeholders['tag_suffix'] = _tag_suffix(tag_parts)
-        self.placeholders = placeholders
+        return placeholders
 
     def modify(self, tag, utime, record):
         """Modify an event by modifying.
@@ -163,15 +359,51 @@ class Reform(Modifier):
             record: Modified record
         """
         assert type(record) is dict
-        self.placeholders['time'] = utime
-        self.placeholders['record'] = record
-        for key, val in self.writes:
-            record[key] = _expand(_normalize(val), self.placeholders)
+        self.modify_record(utime, record)
+        return utime, record
+
+    def modify_record(self, utime, record):
+        """Write and delete fields of a record."""
+        for i, (key, value, fmt) in enumerate(self.bound):
+            if fmt is not None:
+                value = fmt(record=record, time=utime)
+            elif value is None:
+                # Expression not compiled, expand in slow path.
+                placeholders = dict(self.placeholders, record=record,
+                                    time=utime)
+                value = _expand(_normalize(self.writes[i][1]), placeholders)
+            record[key] = value
 
         for key in self.deletes:
             del record[key]
 
-        return utime, record
+    def modify_batch(self, tag, times, records):
+        """Modify columns of data.
+
+        Records are modified in place. If all the values are constant for the
+         tag, they are written by ``dict.update``.
+
+        Args:
+            tag (str): data tag
+            times (array or memoryview): Data time stamps.
+            records (list): Data records.
+
+        Returns:
+            array or memoryview: Time stamps.
+            list: Modified records.
+        """
+        if all(value is not None for _, value, _ in self.bound):
+            consts = dict((key, value) for key, value, _ in self.bound)
+            deletes = self.deletes
+            for record in records:
+                record.update(consts)
+                for key in deletes:
+                    del record[key]
+        else:
+            modify_record = self.modify_record
+            for utime, record in zip(times, records):
+                modify_record(utime, record)
+        return times, records
 
 
 @click.command(help="Write or delete record fields.")
@@ -179,9 +411,11 @@ class Reform(Modifier):
               help="Write key / value pair.")
 @click.option('-d', '--delete', "deletes", type=str, multiple=True,
               help="Delete existing key / value pair by key.")
-def main(writes, deletes):
+@click.option('--host-refresh', type=str, default=None, help="Interval to "
+              "refresh host name & address. Resolved only once if not given.")
+def main(writes, deletes, host_refresh):
     """Plugin entry."""
-    return Reform(writes, deletes)
+    return Reform(writes, deletes, host_refresh)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,13 @@
 """Test reform plugin."""
 
 import socket
+from array import array
 
-from .m_reform import Reform, _tag_suffix, _normalize
+import pytest
+
+from swak.exception import ConfigError
+
+from .m_reform import Reform, _tag_suffix, _normalize, _compile, _bind
 
 
 def test_event_router_util():
@@ -85,3 +90,71 @@ def test_reform_expand(agent):
     assert pholder['tag_parts'] == ['a', 'b', 'c']
     assert pholder['tag_prefix'] == ['a', 'a.b', 'a.b.c']
     assert pholder['tag_suffix'] == ['c', 'b.c', 'a.b.c']
+
+
+def test_reform_compile():
+    """Test compiled templates."""
+    assert _compile('{lit}') == ['{lit}']
+    parts = _compile('${tag_parts[-1]}-${record[f1]:>3}-${time}')
+    assert parts[0] == ('tag_parts[-1]', 'tag_parts', [(True, -1)], None, '')
+    value, fmt = _bind(parts, dict(tag_parts=['a', 'b']))
+    assert value is None
+    assert fmt == 'b-{record[f1]:>3}-{time}'
+    assert fmt.format(record=dict(f1=1), time=1.5) == 'b-  1-1.5'
+    value, fmt = _bind(_compile('{${tag}}'), dict(tag='a'))
+    assert value == '{a}'
+    assert fmt is None
+    # unsupported conversion goes to slow path.
+    assert _compile('${record[f1]!a}') is None
+
+
+def test_reform_cache(agent):
+    """Test caching of placeholders."""
+    with pytest.raises(ConfigError):
+        Reform([], [], host_refresh='0')
+
+    writes = [("t", "${tag}"), ("f1", "${record[f1]:>3}"),
+              ("w", "${record[w]!a}")]
+    reform = Reform(writes, [], host_refresh='1h')
+    agent.register_plugin("a.*", reform)
+    agent.emit("a.b", 0, dict(f1=1, w=u'\xe9'))
+    agent.emit("a.c", 0, dict(f1=2, w=u'\xe9'))
+    agent.emit("a.b", 0, dict(f1=3, w=u'\xe9'))
+    agent.flush()
+    records = [eval(bulk.split('\t')[2]) for bulk in agent.def_output.bulks]
+    assert [r['t'] for r in records] == ['a.b', 'a.c', 'a.b']
+    assert [r['f1'] for r in records] == ['  1', '  2', '  3']
+    assert [r['w'] for r in records] == [r"'\xe9'"] * 3
+    assert set(reform.tag_cache.keys()) == set(['a.b', 'a.c'])
+
+    # host placeholders are refreshed after interval.
+    host_time = reform.host_time
+    reform.update_host_placeholders()
+    assert reform.host_time == host_time
+    reform.host_time -= 3600
+    reform.update_host_placeholders()
+    assert reform.host_time > host_time
+    assert len(reform.tag_cache) == 0
+
+
+def test_reform_batch():
+    """Test modifying columns of data."""
+    times = array('d', [0, 1])
+    records = [dict(f1=1, f2=0), dict(f1=2, f2=0)]
+    reform = Reform([("t", "${tag}"), ("c", "const")], ["f2"])
+    reform.prepare_for_stream("a.b", None)
+    mtimes, mrecords = reform.modify_batch("a.b", times, records)
+    assert mtimes is times
+    assert mrecords == [dict(f1=1, t='a.b', c='const'),
+                        dict(f1=2, t='a.b', c='const')]
+
+    # same result with modify.
+    reform = Reform([("f1", "${record[f1]}_mod"), ("f2", "${record[f1]}_2"),
+                     ("t", "${time}")])
+    reform.prepare_for_stream("a.b", None)
+    records = [dict(f1=1), dict(f1=2)]
+    _, mrecords = reform.modify_batch("a.b", times, records)
+    expect = [reform.modify("a.b", t, dict(f1=i + 1))[1] for i, t in
+              enumerate(times)]
+    assert mrecords == expect
+    assert mrecords[0] == dict(f1='1_mod', f2='1_mod_2', t='0.0')
@@ -1,6 +1,7 @@
 """Stdout module."""
 from __future__ import print_function, absolute_import
 
+import sys
 import logging
 
 import click
@@ -8,54 +9,117 @@ import click
 from swak.plugin import Output
 from swak.formatter import Formatter, StdoutFormatter
 from swak.buffer import Buffer
-from swak.memorybuffer import MemoryBuffer, DEFAULT_CHUNK_MAX_RECORD,\
-    DEFAULT_CHUNK_MAX_SIZE, DEFAULT_BUFFER_MAX_CHUNK
+from swak.clicmds import f_stdout, f_json, f_msgpack, b_memory, b_file
+from swak.util import size_value
+from swak.exception import ConfigError
+from swak import trace
+
+FLUSH_POLICIES = ['bulk', 'size', 'never']
+DEFAULT_FLUSH_POLICY = 'bulk'
+DEFAULT_FLUSH_SIZE = '64k'
 
 
 class Stdout(Output):
     """Stdout class."""
 
-    def __init__(self, formatter=None, abuffer=None):
+    def __init__(self, formatter=None, abuffer=None,
+                 flush_policy=DEFAULT_FLUSH_POLICY,
+                 flush_size=DEFAULT_FLUSH_SIZE):
         """Init.
 
         Args:
             formatter (Formatter): Swak formatter for this output.
             abuffer (Buffer): Swak buffer for this output.
+            flush_policy (str): When to flush standard output. ``bulk``
+              (after each bulk), ``size`` (when written data exceeds
+              ``flush_size``) or ``never`` (leave it to the stream).
+            flush_size (str): Written size to flush with size suffix.
         """
         logging.info("Stdout.__init__")
+        if flush_policy not in FLUSH_POLICIES:
+            raise ConfigError("flush_policy must be one of {}.".
+                              format(', '.join(FLUSH_POLICIES)))
+        try:
+            flush_size = size_value(flush_size)
+        except ValueError as e:
+            raise ConfigError(str(e))
         formatter = formatter if formatter is not None else StdoutFormatter()
         super(Stdout, self).__init__(formatter, abuffer)
+        self.flush_policy = flush_policy
+        self.flush_size = flush_size
+        self.unflushed = 0
+        self.text_flushed = False
 
     def _write(self, bulk):
-        """Write a bulk.
+        """Write a bulk with one write call.
 
         Args:
             bulk (bytearray or list): If the chunk that passes the argument is
               a binary type, bulk is an array of bytes, otherwise it is a list
               of strings.
         """
-        logging.debug("Stdout._write")
+        if trace.TRACE:
+            logging.debug("Stdout._write")
         if type(bulk) is list:
-            for line in bulk:
-                print(line)
+            text = '\n'.join(bulk) + '\n'
+            binary = False
+        elif isinstance(bulk, bytearray) or self.formatter.binary:
+            text = bulk
+            binary = True
+        else:
+            text = bulk + '\n'
+            binary = False
+
+        out = getattr(sys.stdout, 'buffer', None)
+        if out is None:
+            # no binary layer (python 2 or replaced stdout).
+            out = sys.stdout
         else:
-            print(bulk)
+            if not self.text_flushed:
+                # keep order with text written to the stream before.
+                sys.stdout.flush()
+                self.text_flushed = True
+            if not binary:
+                text = text.encode('utf8')
+        out.write(text)
+        self.unflushed += len(text)
+        if self.flush_policy == 'bulk' or (self.flush_policy == 'size' and
+                                           self.unflushed >= self.flush_size):
+            self.flush_stdout()
+
+    def flush_stdout(self):
+        """Flush standard output."""
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+        out.flush()
+        self.unflushed = 0
+
+    def _stop(self):
+        """Stop and flush standard output."""
+        super(Stdout, self)._stop()
+        self.flush_stdout()
 
 
 @click.group(chain=True, invoke_without_command=True,
              help="Output to standard output.")
+@click.option('--flush-policy', default=DEFAULT_FLUSH_POLICY,
+              type=click.Choice(FLUSH_POLICIES), show_default=True,
+              help="When to flush standard output.")
+@click.option('--flush-size', default=DEFAULT_FLUSH_SIZE, show_default=True,
+              help="Written size to flush for 'size' flush policy.")
 @click.pass_context
-def main(ctx):
+def main(ctx, flush_policy, flush_size):
     """Plugin entry."""
     pass
 
 
 @main.resultcallback()
-def process_components(components):
+def process_components(components, flush_policy, flush_size):
     """Process components and build a Stdout.
 
     Args:
         components (list)
+        flush_policy (str): When to flush standard output.
+        flush_size (str): Written size to flush.
 
     Returns:
         Stdout
@@ -66,32 +130,14 @@ def process_components(components):
             _formatter = com
         if isinstance(com, Buffer):
             _buffer = com
-    return Stdout(_formatter, _buffer)
-
-
-@main.command('f.stdout', help="Stdout formatter for this output.")
-@click.option('-z', '--timezone', default=None, show_default=True,
-              help="Timezone for format.")
-def f_stdout(timezone):
-    """Formatter entry."""
-    return StdoutFormatter(timezone=timezone)
-
-
-@main.command('b.memory', help="Memory buffer for this output.")
-@click.option('-f', '--flush-interval', default=None, type=str,
-              show_default=True, help="Flush interval.")
-@click.option('-r', '--chunk-max-record', default=DEFAULT_CHUNK_MAX_RECORD,
-              type=int, show_default=True, help="Maximum records per chunk.")
-@click.option('-s', '--chunk-max-size', default=DEFAULT_CHUNK_MAX_SIZE,
-              show_default=True, help="Maximum chunks per buffer.")
-@click.option('-c', '--buffer-max-chunk', default=DEFAULT_BUFFER_MAX_CHUNK,
-              show_default=True, help="Maximum chunks per buffer.")
-def b_memory(flush_interval, chunk_max_record, chunk_max_size,
-             buffer_max_chunk):
-    """Formatter entry."""
-    return MemoryBuffer(None, False, flush_interval=flush_interval,
-                        buffer_max_chunk=buffer_max_chunk,
-                        chunk_max_record=chunk_max_record)
+    return Stdout(_formatter, _buffer, flush_policy, flush_size)
+
+
+main.add_command(f_stdout)
+main.add_command(f_json)
+main.add_command(f_msgpack)
+main.add_command(b_memory)
+main.add_command(b_file)
 
 
 if __name__ == '__main__':
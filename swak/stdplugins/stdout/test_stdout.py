@@ -1,6 +1,15 @@
 """Test stdout plugin."""
+import io
+import sys
+import json
+
+import pytest
 
 from swak.core import TRunAgent
+from swak.exception import ConfigError
+from swak.formatter import JsonFormatter
+from swak.memorybuffer import MemoryBuffer
+from swak.data import MultiDataStream
 from swak.stdplugins.counter.i_counter import Counter
 
 from .o_stdout import Stdout
@@ -29,3 +38,75 @@ def test_stdout_cmds(capsys):
     out, err = capsys.readouterr()
     assert err == ''
     assert "'f1': 3" in out
+
+
+def test_stdout_json(capfd):
+    """Test stdout with JSON formatter."""
+    stdout = Stdout(JsonFormatter(time_key=None), MemoryBuffer(None, False))
+    assert stdout.buffer.binary
+    ds = MultiDataStream([0, 1], [dict(k=1), dict(k=2)])
+    stdout.emit_stream('test', ds, None)
+    assert 2 == stdout.buffer.active_chunk.num_record
+    stdout.flush(True)
+    out, err = capfd.readouterr()
+    assert '{"k":1,"tag":"test"}\n{"k":2,"tag":"test"}\n' == out
+
+    TRunAgent().run_commands('i.counter -n 3 | o.stdout f.json b.memory')
+    out, err = capfd.readouterr()
+    lines = out.strip().split('\n')
+    assert 3 == len(lines)
+    assert 'f1' in json.loads(lines[0])
+
+
+def test_stdout_bulk_write(capfd):
+    """Test writing a bulk at once with flush policies."""
+    with pytest.raises(ConfigError):
+        Stdout(flush_policy='unknown')
+
+    stdout = Stdout()
+    ds = MultiDataStream([0, 1, 2], [dict(k=1), dict(k=2), dict(k=3)])
+    stdout.emit_stream('test', ds, None)
+    assert 0 == stdout.unflushed
+    out, err = capfd.readouterr()
+    assert 3 == len(out.strip().split('\n'))
+
+    stdout = Stdout(flush_policy='size', flush_size='1k')
+    stdout.write(['a', 'b'])
+    assert 4 == stdout.unflushed
+    stdout.write(['c' * 1024])
+    assert 0 == stdout.unflushed
+    stdout.write(['d'])
+    stdout.start()
+    stdout.stop()
+    assert 0 == stdout.unflushed
+    out, err = capfd.readouterr()
+    assert 'a\nb\n' + 'c' * 1024 + '\nd\n' == out
+
+
+class CountingIO(io.RawIOBase):
+    """Raw stream which counts write calls."""
+
+    def __init__(self):
+        self.writes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.writes += 1
+        return len(b)
+
+
+@pytest.mark.parametrize('policy,writes', [('bulk', 5), ('size', 2),
+                                           ('never', 1)])
+def test_stdout_raw_writes(monkeypatch, policy, writes):
+    """Test raw writes to standard output by flush policy."""
+    raw = CountingIO()
+    monkeypatch.setattr(sys, 'stdout',
+                        io.TextIOWrapper(io.BufferedWriter(raw, 1 << 20)))
+    stdout = Stdout(flush_policy=policy, flush_size='25')
+    stdout.start()
+    for _ in range(5):
+        stdout.write(['a' * 9])
+    stdout.stop()
+    assert raw.writes == writes
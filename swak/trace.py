@@ -0,0 +1,43 @@
+"""This module implements trace switch.
+
+Per-record and per-batch debug logs in hot paths are written only when
+ tracing is on. Check the switch as ``trace.TRACE`` before logging, so that
+ nothing is formatted or called when it is off::
+
+    from swak import trace
+
+    if trace.TRACE:
+        logging.debug("emit_stream tag '%s' ds %s", tag, ds)
+"""
+
+import logging
+
+TRACE = False
+# Root logger level before tracing was turned on.
+_saved_level = None
+
+
+def set_trace(enable):
+    """Turn tracing on or off for the process.
+
+    Root logger level is lowered to DEBUG while tracing, so that traces are
+     passed to handlers, and restored when tracing is turned off.
+
+    Args:
+        enable (bool): Whether to trace or not.
+    """
+    global TRACE, _saved_level
+    enable = bool(enable)
+    changed = enable != TRACE
+    root = logging.getLogger()
+    if enable:
+        if not TRACE:
+            _saved_level = root.level
+        # Set again, as logger config may have been applied since.
+        root.setLevel(logging.DEBUG)
+    elif TRACE:
+        root.setLevel(_saved_level)
+    TRACE = enable
+    if changed:
+        logging.info("tracing is turned {}".
+                     format('on' if enable else 'off'))
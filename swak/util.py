@@ -6,6 +6,7 @@ import re
 from platform import platform
 import collections
 import errno
+import inspect
 import logging
 
 from swak.exception import UnsupportedPython, ConfigError
@@ -107,6 +108,72 @@ def update_dict(d, u):
     return d
 
 
+class LRUCache(object):
+    """Bounded dictionary which evicts the least recently used item.
+
+    Attributes:
+        max_size (int): Maximum number of items.
+        hits (int): Number of successful lookups.
+        misses (int): Number of failed lookups.
+        evictions (int): Number of evicted items.
+    """
+
+    def __init__(self, max_size):
+        """Init.
+
+        Args:
+            max_size (int): Maximum number of items.
+        """
+        assert max_size > 0
+        self.max_size = max_size
+        self.items = collections.OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as recently used.
+
+        Args:
+            key: Key of the item.
+            default: Value to return if key does not exist.
+        """
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.items[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        """Set an item, evicting the least recently used one if full."""
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def __getitem__(self, key):
+        """Return the value for key without touching counters or order."""
+        return self.items[key]
+
+    def __contains__(self, key):
+        """Whether key is in the cache."""
+        return key in self.items
+
+    def __len__(self):
+        """Number of items."""
+        return len(self.items)
+
+    def keys(self):
+        """Return keys from the least recently used."""
+        return self.items.keys()
+
+    def invalidate(self):
+        """Remove all items."""
+        self.items.clear()
+
+
 def init_home(home, cfg):
     """Initialized required directories for home.
 
@@ -319,8 +386,22 @@ def parse_and_validate_cmds(cmds, check_input, check_output=None):
     return pcmds
 
 
-def stop_iter_when_signalled(event):
-    """Stop iteration when event is signalled."""
-    if event is not None:
-        if event.wait(0.0):
-            raise StopIteration()
+def is_coroutine_function(func):
+    """Return whether a function is a coroutine function or not.
+
+    Always False for Python versions without coroutines.
+
+    Args:
+        func (function): A function to test.
+    """
+    iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', None)
+    return iscoroutinefunction is not None and iscoroutinefunction(func)
+
+
+def is_signalled(event):
+    """Return whether event is signalled or not.
+
+    Args:
+        event (threading.Event): An event to test. Can be None.
+    """
+    return event is not None and event.is_set()
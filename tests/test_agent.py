@@ -1,11 +1,20 @@
 """This module implements service agent test."""
 from __future__ import absolute_import
 
+import sys
 import yaml
+import os
+import logging
 import time
 
+import pytest
+
 from swak.agent import ServiceAgent
+from swak.ringqueue import RingQueue
+from swak.monitor import request_stats, request_trace
+from swak import trace
 from swak.plugin import ProxyOutput, ProxyInput, Modifier, Input, Output
+from swak.config import ASYNCIO_MIN_PYTHON
 
 
 def init_agent_from_cfg(cfgs, dryrun=False):
@@ -98,6 +107,25 @@ matches:
     assert isinstance(plugins[1], Output)
     assert set(plugins[0].recv_queues.values()) == set(proxy_queues)
 
+    # memory budget shared by all buffers
+    cfgs = '''
+memory_budget: 0
+sources:
+    - i.counter | m.reform -w tag t1 | tag test1
+
+matches:
+    test*: o.stdout b.memory
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    out, err = capsys.readouterr()
+    assert "'memory_budget' must be greater than 0" in err
+
+    cfgs = cfgs.replace('memory_budget: 0', 'memory_budget: 64m')
+    agent = init_agent_from_cfg(cfgs, False)
+    assert agent.memory_budget.max_size == 64 * 1024 ** 2
+    output = agent.output_threads[0].pluginpod.plugins[-1]
+    assert output.buffer.global_budget is agent.memory_budget
+
 
 def test_agent_run(capsys):
     """Test service agent run."""
@@ -117,7 +145,7 @@ sources:
     agent.start()
     for itrd in agent.input_threads:
         assert itrd.is_alive()
-    time.sleep(0.2)
+    time.sleep(0.5)
     out, err = capsys.readouterr()
     # assert len(err) == 0 - logging error?
     assert "'f1': 1" in out
@@ -162,7 +190,7 @@ matches:
     output = agent.output_threads[0].pluginpod.plugins[-1]
     assert output.buffer.cnt_flushing == 0
 
-    time.sleep(1)
+    time.sleep(1.5)
     out, err = capsys.readouterr()
     assert len(err) == 0
     assert "'f1': 1" in out
@@ -194,3 +222,331 @@ matches:
     out, err = capsys.readouterr()
     assert len(err) == 0
     assert "'f1': 3" in out
+
+
+def test_agent_process(capsys, tmpdir):
+    """Test service agent with process engine."""
+    cfgs = '''
+engine: fiber
+sources:
+    - i.counter | o.stdout
+    '''
+    init_agent_from_cfg(cfgs, False)
+    out, err = capsys.readouterr()
+    assert "'engine' must be one of" in err
+
+    cfgs = '''
+match_shards: 2
+sources:
+    - i.counter | tag test1
+
+matches:
+    test*: o.stdout
+    '''
+    init_agent_from_cfg(cfgs, False)
+    out, err = capsys.readouterr()
+    assert "'match_shards' needs 'process' engine" in err
+
+    # Seperated model in a worker.
+    path1 = str(tmpdir.join('out1.txt'))
+    cfgs = '''
+logger:
+    root:
+        level: CRITICAL
+
+engine: process
+sources:
+    - i.counter -n 300 | o.file -f {}
+    '''.format(path1)
+    agent = init_agent_from_cfg(cfgs, False)
+    assert len(agent.source_workers) == 1
+    assert len(agent.match_workers) == 0
+    agent.start()
+    time.sleep(1)
+    agent.stop()
+    agent.shutdown()
+    assert agent.source_workers[0].exitcode == 0
+    with open(path1) as f:
+        assert len(f.readlines()) == 300
+
+    # Aggregated model with match shards.
+    path2 = str(tmpdir.join('out2.txt'))
+    cfgs = '''
+logger:
+    root:
+        level: CRITICAL
+
+engine: process
+match_shards: 2
+sources:
+    - i.counter -n 500 | m.reform -w tag t1 | tag test1
+    - i.counter -n 500 | m.reform -w tag t2 | tag test2
+
+matches:
+    test*: o.file -f {}
+    '''.format(path2)
+    agent = init_agent_from_cfg(cfgs, False)
+    assert len(agent.input_threads) == 0
+    assert len(agent.output_threads) == 0
+    assert len(agent.source_workers) == 2
+    assert len(agent.match_workers) == 2
+    # match shards share the queues of sources.
+    assert len(agent.proxy_queues) == 2
+    for worker in agent.match_workers:
+        assert [q for _, q in worker.queues] == agent.proxy_queues
+
+    agent.start()
+    for worker in agent.workers:
+        assert worker.is_alive()
+    time.sleep(1)
+    agent.stop()
+    agent.shutdown()
+    for worker in agent.workers:
+        assert worker.exitcode == 0
+
+    with open(path2) as f:
+        lines = f.readlines()
+    assert len(lines) == 1000
+    assert len([line for line in lines if "'tag': 't1'" in line]) == 500
+
+
+def test_agent_ring(tmpdir):
+    """Test service agent with ring transport."""
+    # Thread engine
+    path = str(tmpdir.join('out1.txt'))
+    cfgs = '''
+logger:
+    root:
+        level: CRITICAL
+
+transport: ring
+ring_size: 64k
+sources:
+    - i.counter -n 500 | tag test1
+
+matches:
+    test*: o.file -f {}
+    '''.format(path)
+    agent = init_agent_from_cfg(cfgs, False)
+    assert len(agent.proxy_queues) == 1
+    ring = agent.proxy_queues[0]
+    assert isinstance(ring, RingQueue)
+    assert ring.capacity == 64 * 1024
+    proxy_output = agent.input_threads[0].pluginpod.plugins[-1]
+    assert proxy_output.send_queue is ring
+    # waits on the ring notifier, instead of polling.
+    proxy_input = agent.output_threads[0].proxy_input
+    assert proxy_input.notifier is ring.notifier
+    assert not proxy_input.polling
+    agent.start()
+    time.sleep(1)
+    agent.stop()
+    agent.shutdown()
+    with open(path) as f:
+        assert len(f.readlines()) == 500
+
+    # Process engine
+    path = str(tmpdir.join('out2.txt'))
+    cfgs = cfgs.replace('out1.txt', 'out2.txt')
+    cfgs = cfgs.replace('transport: ring', 'transport: ring\nengine: process')
+    cfgs = cfgs.replace('tag test1', 'tag test1\n    - i.counter -n 500 | '
+                        'tag test2')
+    agent = init_agent_from_cfg(cfgs, False)
+    assert len(agent.proxy_queues) == 2
+    for ring in agent.proxy_queues:
+        assert isinstance(ring, RingQueue)
+        assert ring.notifier is agent.ring_notifier
+    agent.start()
+    time.sleep(1)
+    agent.stop()
+    agent.shutdown()
+    with open(path) as f:
+        assert len(f.readlines()) == 1000
+
+
+@pytest.mark.skipif(sys.version_info < ASYNCIO_MIN_PYTHON,
+                    reason="asyncio engine needs newer Python.")
+def test_agent_asyncio(tmpdir):
+    """Test service agent with asyncio engine."""
+    path = str(tmpdir.join('out.txt'))
+    cfgs = '''
+logger:
+    root:
+        level: CRITICAL
+
+engine: asyncio
+sources:
+    - i.counter -n 2 -d 1 | m.reform -w tag t1 | tag test1
+    - i.counter -n 2 -d 1 | m.reform -w tag t2 | tag test2
+    - i.filetail -f {0}/*.log -p {0}/tail.pos | tag test3
+
+matches:
+    test*: o.file -f {1}
+    '''.format(str(tmpdir), path)
+    agent = init_agent_from_cfg(cfgs, False)
+    # asynchronous inputs share an event loop.
+    assert len(agent.loop_thread.input_threads) == 2
+    assert len(agent.input_threads) == 1
+    assert len(agent.output_threads) == 1
+
+    agent.start()
+    time.sleep(1.5)
+    assert agent.loop_thread.is_alive()
+    agent.stop()
+    agent.shutdown()
+    assert not agent.loop_thread.is_alive()
+    with open(path) as f:
+        lines = f.readlines()
+    assert len(lines) == 4
+    assert len([line for line in lines if "'tag': 't1'" in line]) == 2
+
+    # Seperated model in the event loop.
+    cfgs = '''
+logger:
+    root:
+        level: CRITICAL
+
+engine: asyncio
+sources:
+    - i.counter -n 3 | o.file -f {}
+    '''.format(path)
+    agent = init_agent_from_cfg(cfgs, False)
+    assert len(agent.input_threads) == 0
+    agent.start()
+    time.sleep(0.5)
+    agent.stop()
+    agent.shutdown()
+    with open(path) as f:
+        assert len(f.readlines()) == 7
+
+
+def test_agent_metrics(tmpdir):
+    """Test metrics of service agent."""
+    path = str(tmpdir.join('out.txt'))
+    cfgs = '''
+logger:
+    root:
+        level: CRITICAL
+
+sources:
+    - i.counter -n 500 | m.reform -w s ${{record[f1]}} | m.filter -i s ^1
+      | tag test
+
+matches:
+    test: o.file -f {}
+    '''.format(path)
+    agent = init_agent_from_cfg(cfgs, False)
+    names = list(agent.metrics.sources.keys())
+    assert names == ['OutTrd-test', 'InTrd-test']
+    agent.start()
+    time.sleep(1)
+    agent.stop()
+    agent.shutdown()
+
+    metrics = agent.metrics.snapshot()['metrics']
+    inpod = metrics['InTrd-test']['plugins']
+    assert list(inpod.keys()) == ['0.Counter', '1.Reform', '2.Filter',
+                                  '3.ProxyOutput']
+    assert inpod['0.Counter']['records_out'] == 500
+    assert inpod['2.Filter']['records_in'] == 500
+    assert inpod['2.Filter']['dropped'] == 500 - 111
+    assert inpod['3.ProxyOutput']['records_in'] == 111
+    assert inpod['3.ProxyOutput']['latency']['count'] > 0
+    outpod = metrics['OutTrd-test']['plugins']
+    assert outpod['0.ProxyInput']['records_out'] == 111
+    output = outpod['1.File']
+    assert output['records_in'] == 111
+    # o.file appends a line separator to each line.
+    assert output['bytes_out'] + 111 == os.path.getsize(path)
+    assert output['latency']['count'] > 0
+    assert output['buffer']['flush_latency']['count'] > 0
+
+
+def test_agent_monitor(tmpdir, capsys):
+    """Test monitor server of service agent."""
+    cfgs = '''
+monitor:
+    port: 0
+    unix_socket: true
+sources:
+    - i.counter | o.stdout
+    '''
+    init_agent_from_cfg(cfgs, False)
+    out, err = capsys.readouterr()
+    assert "either of 'port' or 'unix_socket'" in err
+
+    path = str(tmpdir.join('out.txt'))
+    cfgs = '''
+logger:
+    root:
+        level: CRITICAL
+
+monitor:
+    port: 0
+
+sources:
+    - i.counter -n 100 | tag test
+
+matches:
+    test: o.file -f {}
+    '''.format(path)
+    agent = init_agent_from_cfg(cfgs, False)
+    agent.start()
+    time.sleep(1)
+    stats = request_stats(agent.monitor.address)
+    assert stats['engine'] == 'thread'
+    threads = stats['threads']
+    assert list(threads.keys()) == ['OutTrd-test', 'InTrd-test']
+    assert threads['OutTrd-test']['alive']
+    intrd = threads['InTrd-test']
+    # counter has finished.
+    assert not intrd['alive']
+    assert intrd['type'] == 'input'
+    assert intrd['router']['cache_size'] == 1
+    assert intrd['plugins']['1.ProxyOutput']['queue_depth'] == 0
+    buf = threads['OutTrd-test']['plugins']['1.File']['buffer']
+    assert 'flushing' in buf and 'chunking' in buf and 'chunks' in buf
+
+    # Turn tracing on at runtime.
+    root = logging.getLogger()
+    level = root.level
+    assert not stats['trace']
+    assert request_trace(agent.monitor.address, True) == dict(trace=True)
+    assert trace.TRACE and root.level == logging.DEBUG
+    assert request_stats(agent.monitor.address)['trace']
+    request_trace(agent.monitor.address, False)
+    assert not trace.TRACE and root.level == level
+
+    agent.stop()
+    agent.shutdown()
+    assert agent.monitor.address is None
+
+    # Unix domain socket
+    sock_path = str(tmpdir.join('swak.sock'))
+    cfgs = cfgs.replace('port: 0', 'unix_socket: {}'.format(sock_path))
+    agent = init_agent_from_cfg(cfgs, False)
+    agent.start()
+    stats = request_stats(sock_path)
+    assert list(stats['threads'].keys()) == ['OutTrd-test', 'InTrd-test']
+    agent.stop()
+    agent.shutdown()
+    assert not os.path.exists(sock_path)
+
+    # Process engine forwards snapshots and tracing to workers.
+    cfgs = cfgs.replace('monitor:', 'engine: process\nmonitor:')
+    agent = init_agent_from_cfg(cfgs, False)
+    agent.start()
+    time.sleep(1)
+    stats = request_stats(sock_path)
+    assert stats['engine'] == 'process'
+    worker = stats['workers']['OutProc-test-0']
+    assert worker['alive'] and worker['type'] == 'output'
+    assert 'buffer' in worker['plugins']['1.File']
+    assert not worker['trace']
+    request_trace(sock_path, True)
+    worker = request_stats(sock_path)['workers']['OutProc-test-0']
+    assert worker['trace']
+    request_trace(sock_path, False)
+    agent.stop()
+    agent.shutdown()
+    assert agent.worker_conns == {}
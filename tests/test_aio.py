@@ -0,0 +1,158 @@
+"""This module implements asyncio engine test.
+
+Collected only by Python versions which can run the asyncio engine.
+"""
+from __future__ import absolute_import
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from swak.plugin import Output, RecordInput, DummyOutput
+from swak.pluginpod import PluginPod
+from swak.memorybuffer import MemoryBuffer
+from swak.formatter import StdoutFormatter
+
+
+class FooInput(RecordInput):
+    """Asynchronous input for test."""
+
+    def __init__(self, count, delay):
+        super(FooInput, self).__init__()
+        self.set_tag('test')
+        self.count = count
+        self.delay = delay
+
+    async def agenerate_record(self):
+        for i in range(self.count):
+            yield dict(i=i)
+            await asyncio.sleep(self.delay)
+
+
+class FooOutput(Output):
+    """Asynchronous output for test, which fails as many times as given."""
+
+    def __init__(self, abuffer=None, fail=0):
+        super(FooOutput, self).__init__(StdoutFormatter(), abuffer)
+        self.bulks = []
+        self.loops = []
+        self.calls = 0
+        self.fail = fail
+
+    async def _write(self, bulk):
+        self.calls += 1
+        self.loops.append(asyncio.get_running_loop())
+        await asyncio.sleep(0.01)
+        if self.fail > 0:
+            self.fail -= 1
+            raise IOError("write failed")
+        self.bulks.append(bulk)
+
+
+def test_aio_input():
+    """Test asynchronous input in an event loop."""
+    assert not RecordInput().is_async
+    dtinput = FooInput(3, 0.1)
+    assert dtinput.is_async
+    dtinput.set_batch(max_latency=0.05)
+    dtinput.set_wait_timeout_func(lambda: 0.03)
+
+    async def read(stop_event):
+        return [(tag, ds) async for tag, ds in dtinput.aread(stop_event)]
+
+    # batches are yielded by latency, idle (None, None) while sleeping.
+    results = asyncio.run(read(threading.Event()))
+    streams = [ds for tag, ds in results if tag is not None]
+    assert [len(ds) for ds in streams] == [1, 1, 1]
+    assert len(results) > len(streams)
+
+    # batches are yielded by max record without waiting for latency.
+    dtinput = FooInput(2500, 0)
+    dtinput.set_batch(max_record=1000, max_latency=10)
+    st = time.time()
+    results = asyncio.run(read(threading.Event()))
+    assert time.time() - st < 5
+    assert [len(ds) for tag, ds in results if tag is not None] ==\
+        [1000, 1000, 500]
+
+    # stops while awaiting data.
+    dtinput = FooInput(3, 10)
+    stop_event = threading.Event()
+
+    async def stop():
+        await asyncio.sleep(0.1)
+        stop_event.set()
+
+    async def main():
+        st = time.time()
+        results = (await asyncio.gather(read(stop_event), stop()))[0]
+        return time.time() - st, results
+
+    elapsed, results = asyncio.run(main())
+    assert elapsed < 2
+    assert [len(ds) for tag, ds in results if tag is not None] == [1]
+
+
+def test_aio_output():
+    """Test output with asynchronous write."""
+    out = FooOutput()
+    assert out.is_async
+    assert not Output(None, None).is_async
+    # runs in a new event loop without engine loop.
+    out.write(['a'])
+    assert out.bulks == [['a']]
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        out.set_loop(loop)
+        # can not block its own loop.
+        with pytest.raises(RuntimeError):
+            out.write(['b'])
+        # blocks until written in the loop, from other threads.
+        await loop.run_in_executor(None, out.write, ['c'])
+        assert out.bulks[-1] == ['c']
+
+    asyncio.run(main())
+
+
+def test_aio_output_retry():
+    """Test failed asynchronous write is retried by the buffer."""
+    out = FooOutput(MemoryBuffer(None, False, flush_interval='0.05',
+                                 flush_workers=0, retry_wait='0.01'), fail=1)
+    pod = PluginPod(DummyOutput())
+    pod.register_plugin('test', FooInput(5, 0.05))
+    pod.register_plugin('test', out)
+
+    from swak.aio import run_pods
+    asyncio.run(run_pods([pod], threading.Event()))
+    # one failed write, retried.
+    assert out.calls == len(out.bulks) + 1
+    assert out.buffer.cnt_retry == 1
+    assert sum(len(bulk) for bulk in out.bulks) == 5
+    assert out.shutdowned
+
+
+def test_aio_shared_loop():
+    """Test outputs of other threads write in the engine loop."""
+    from swak.aio import run_event_loop
+
+    out = FooOutput()
+    finished = threading.Event()
+    release = threading.Event()
+    trd = threading.Thread(target=run_event_loop,
+                           args=([], threading.Event(), [out], finished,
+                                 release))
+    trd.start()
+    assert finished.wait(5)
+    # the loop is kept for the output, and reused by every write.
+    out.write(['a'])
+    out.write(['b'])
+    assert out.bulks == [['a'], ['b']]
+    assert out.loops[0] is out.loops[1]
+    assert out.loops[0] is out.loop
+    release.set()
+    trd.join(5)
+    assert not trd.is_alive()
+    assert out.loop is None
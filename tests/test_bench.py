@@ -5,7 +5,12 @@ from threading import Thread, Lock
 from queue import Queue
 
 
+import pytest
+
 from swak.data import MultiDataStream
+from swak.bench import run_bench, default_bench_cfg
+from swak.microbench import run_benchmarks, compare_results, BENCHMARKS
+from swak.exception import ConfigError
 
 
 def test_bench_queue_events():
@@ -60,3 +65,47 @@ def test_bench_queue_events():
     q.put(None)
     ot.join()
     assert total[0] == int(num_events * num_thread / events_per_stream)
+
+
+def test_bench_agent():
+    """Bench service agent end to end."""
+    result = run_bench(default_bench_cfg(1000, 2), 10)
+    assert result['finished']
+    assert result['engine'] == 'thread'
+    assert result['records'] == 1000
+    assert result['bytes'] > 0
+    assert result['records_per_sec'] > 0
+    assert 0 <= result['latency_p50'] <= result['latency_p99']
+    assert result['cpu_time'] > 0
+
+    cfg = default_bench_cfg(100, 1)
+    cfg['engine'] = 'process'
+    with pytest.raises(ConfigError):
+        run_bench(cfg)
+
+
+def test_bench_micro():
+    """Run micro-benchmarks and compare with a baseline."""
+    result = run_benchmarks(['router.*', 'proxy.emit_stream'], 0.001, 1)
+    benchs = result['benchmarks']
+    assert list(benchs.keys()) == ['router.match_hot', 'router.match_cold',
+                                   'proxy.emit_stream']
+    for bench in benchs.values():
+        assert bench['per_op'] > 0
+        assert bench['loops'] >= 1
+
+    # all benchmarks can run.
+    result = run_benchmarks(None, 0.0, 1)
+    assert list(result['benchmarks'].keys()) == list(BENCHMARKS.keys())
+
+    def _result(**per_ops):
+        return dict(benchmarks={name: dict(per_op=per_op) for name, per_op
+                                in per_ops.items()})
+
+    base = _result(a=1.0, b=1.0, c=1.0)
+    cur = _result(a=1.1, b=1.5, d=9.0)
+    rows = sorted(compare_results(base, cur, 0.2))
+    assert [(row[0], row[4]) for row in rows] == [('a', True), ('b', False)]
+    assert rows[1][3] == 1.5
+    rows = sorted(compare_results(base, cur, 0.2, dict(b=0.5)))
+    assert all(row[4] for row in rows)
@@ -1,11 +1,15 @@
 """This module implements buffer test."""
 from __future__ import absolute_import
 
+import os
 import time
+import threading
 
 import pytest
 
 from swak.memorybuffer import MemoryBuffer
+from swak.filebuffer import FileBuffer
+from swak.buffer import DiskChunk, SecondaryFile, MemoryBudget, FRAME_HEADER
 from swak.exception import ConfigError
 
 
@@ -126,3 +130,294 @@ def test_buffer_multi(def_output):
     assert buf.cnt_chunking == 1
     buf.flushing(True)
     assert len(def_output.bulks) == 2
+
+
+def test_buffer_file(def_output, tmpdir):
+    """Test file buffer."""
+    path = str(tmpdir.join('buf'))
+    with pytest.raises(ConfigError):
+        FileBuffer(None, False, path, fsync='sometimes')
+    with pytest.raises(ConfigError):
+        FileBuffer(None, False, path, write_size='0')
+
+    buf = FileBuffer(def_output, False, path, chunk_max_record=2,
+                     buffer_max_chunk=1)
+    buf.start()
+    # no file until data arrives.
+    assert not os.path.isdir(path)
+    buf.append("data1")
+    buf.append("data2")
+    buf.append("data3")
+    assert buf.cnt_chunking == 1
+    # closed chunk has been written to a file.
+    assert len(os.listdir(path)) == 1
+    buf.may_flushing()
+    assert def_output.bulks == ["data1", "data2"]
+    assert buf.cnt_flushing == 1
+
+    # remaining data are left for the next run.
+    buf.append("data4")
+    buf.stop()
+    assert len(os.listdir(path)) == 1
+    buf = FileBuffer(def_output, False, path)
+    buf.start()
+    assert buf.num_chunk == 2
+    assert not buf.empty
+    buf.flushing(True)
+    assert def_output.bulks[2:] == ["data3", "data4"]
+    assert len(os.listdir(path)) == 0
+
+
+def test_buffer_file_recover(tmpdir):
+    """Test recovering broken chunk file."""
+    path = str(tmpdir.join('test.chunk'))
+    chunk = DiskChunk(True, path)
+    chunk.concat(b'data1', 5)
+    chunk.concat(b'data2', 5)
+    chunk.close()
+    size = os.path.getsize(path)
+    # simulate abnormal termination while writing.
+    with open(path, 'ab') as f:
+        f.write(FRAME_HEADER.pack(100) + b'dat')
+
+    chunk = DiskChunk.recover(True, path)
+    assert os.path.getsize(path) == size
+    assert chunk.num_record == 2
+    assert chunk.bytesize == 10
+    assert chunk.read_bulk() == bytearray(b'data1data2')
+    chunk.discard()
+    assert not os.path.isfile(path)
+
+
+def test_buffer_flush_worker(def_output):
+    """Test flushing by flush workers."""
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, flush_workers=-1)
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, flush_queue_size=0)
+
+    written = threading.Event()
+    orig_write = def_output._write
+
+    def slow_write(bulk):
+        written.wait()
+        orig_write(bulk)
+
+    def_output._write = slow_write
+    buf = MemoryBuffer(def_output, False, chunk_max_record=1,
+                       buffer_max_chunk=1, flush_workers=1,
+                       flush_queue_size=2)
+    buf.start()
+    assert len(buf.workers) == 1
+    # flushing does not wait for the slow output.
+    for i in range(3):
+        buf.append("data{}".format(i))
+        buf.may_flushing()
+    assert buf.cnt_flushing == 2
+    assert def_output.bulks == []
+    written.set()
+    # stop drains the queued chunks in order.
+    buf.stop()
+    assert len(buf.workers) == 0
+    assert def_output.bulks == ["data0", "data1"]
+    buf.flushing(True)
+    assert def_output.bulks == ["data0", "data1", "data2"]
+
+
+def test_buffer_flush_workers(def_output):
+    """Test unkeyed chunks are flushed by workers concurrently."""
+    lock = threading.Lock()
+    names = set()
+    active = [0, 0]  # current and maximum concurrent writes
+    orig_write = def_output._write
+
+    def slow_write(bulk):
+        with lock:
+            names.add(threading.current_thread().name)
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+            orig_write(bulk)
+
+    def_output._write = slow_write
+    buf = MemoryBuffer(def_output, False, chunk_max_record=1,
+                       buffer_max_chunk=1, flush_workers=2)
+    buf.set_tag('t')
+    buf.start()
+    for i in range(4):
+        buf.append("data{}".format(i))
+        buf.may_flushing()
+    buf.flushing(True)
+    buf.stop()
+    assert names == set(['Flush-t-0', 'Flush-t-1'])
+    assert active[1] == 2
+    assert sorted(def_output.bulks) == ["data{}".format(i) for i in range(4)]
+    # metrics updated by the workers are all counted.
+    assert buf.flush_latency.count == 4
+    assert def_output.metrics.latency.count == 4
+    assert def_output.metrics.bytes_out == 20
+
+
+def test_buffer_retry(def_output, tmpdir):
+    """Test retrying failed chunks."""
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, retry_wait='0')
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, retry_wait='2s', retry_max_wait='1s')
+
+    fails = [2]
+    orig_write = def_output._write
+
+    def flaky_write(bulk):
+        if fails[0] > 0:
+            fails[0] -= 1
+            raise IOError("sink down")
+        orig_write(bulk)
+
+    def_output._write = flaky_write
+    buf = MemoryBuffer(def_output, False, chunk_max_record=1,
+                       buffer_max_chunk=1, retry_wait='0.05')
+    buf.append("data1")
+    buf.append("data2")
+    buf.may_flushing()
+    # failed chunk is kept at head.
+    assert buf.cnt_retry == 1
+    assert buf.num_chunk == 2
+    head = buf.chunks[0]
+    assert head.retry == 1
+    assert buf.retry_due is False
+    assert buf.time_to_flush() <= 0.05
+    # no hot retry while waiting.
+    buf.may_flushing()
+    assert buf.cnt_retry == 1
+    time.sleep(0.05)
+    buf.may_flushing()
+    assert buf.cnt_retry == 2
+    time.sleep(0.1)
+    buf.may_flushing()
+    assert def_output.bulks == ["data1"]
+    assert buf.num_chunk == 1
+
+    # backoff grows exponentially up to retry_max_wait.
+    buf = MemoryBuffer(None, False, retry_wait='1s', retry_max_wait='4s')
+    for retry, wait in [(1, 1), (2, 2), (3, 4), (4, 4)]:
+        assert wait * 0.5 <= buf.retry_wait_time(retry) <= wait
+
+    # give up to the secondary.
+    def_output.reset()
+    fails[0] = 100
+    sec_dir = str(tmpdir.join('secondary'))
+    buf = MemoryBuffer(def_output, False, retry_max=0,
+                       secondary=SecondaryFile(sec_dir))
+    buf.append("data1")
+    buf.flushing()
+    assert buf.cnt_giveup == 1
+    assert buf.num_chunk == 1
+    fnames = os.listdir(sec_dir)
+    assert len(fnames) == 1
+    with open(os.path.join(sec_dir, fnames[0])) as f:
+        assert f.read() == "data1\n"
+
+
+def test_buffer_overflow(def_output, tmpdir):
+    """Test overflow actions of buffer."""
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, overflow_action='ignore')
+    with pytest.raises(ConfigError):
+        FileBuffer(None, False, overflow_action='spill')
+
+    # drop oldest
+    buf = MemoryBuffer(None, False, chunk_max_record=1, buffer_max_chunk=10,
+                       buffer_max_size='10', overflow_action='drop_oldest')
+    buf.append("data1")
+    buf.append("data2")
+    assert buf.size == 10
+    buf.append("data3")
+    assert buf.cnt_overflow == 1
+    assert buf.cnt_dropped == 1
+    assert buf.size == 10
+    assert [chunk.bulk for chunk in buf.chunks] == [["data2"], ["data3"]]
+
+    # spill to disk, keeping the order.
+    spill_dir = str(tmpdir.join('spill'))
+    buf = MemoryBuffer(def_output, False, chunk_max_record=1,
+                       buffer_max_chunk=10, buffer_max_size='10',
+                       overflow_action='spill', spill_path=spill_dir)
+    for i in range(4):
+        buf.append("data{}".format(i))
+    assert buf.cnt_spilled == 2
+    assert buf.size == 10
+    assert len(os.listdir(spill_dir)) == 2
+    buf.flushing(True)
+    assert def_output.bulks == ["data0", "data1", "data2", "data3"]
+    assert len(os.listdir(spill_dir)) == 0
+    assert buf.size == 0
+
+    # block until flushed, with memory budget shared.
+    def_output.reset()
+    budget = MemoryBudget(10)
+    buf = MemoryBuffer(def_output, False, chunk_max_record=1,
+                       buffer_max_chunk=10)
+    buf.set_memory_budget(budget)
+    buf.append("data1")
+    buf.append("data2")
+    assert budget.used == 10
+    buf.append("data3")
+    assert buf.cnt_overflow == 1
+    assert def_output.bulks == ["data1"]
+    assert budget.used == 10
+
+    # data larger than the limit exceeds it without blocking.
+    buf = MemoryBuffer(None, False, buffer_max_size='64')
+    buf.append("x" * 200)
+    assert buf.size == 200
+
+    # budget held by other buffer exceeds it after blocking.
+    other = MemoryBuffer(None, False)
+    other.set_memory_budget(budget)
+    other.append("data4")
+    assert budget.used == 15
+    buf = MemoryBuffer(None, False)
+    buf.set_memory_budget(budget)
+    buf.block_timeout = 0.1
+    buf.start()
+    st = time.time()
+    buf.append("data5")
+    assert time.time() - st < 2
+    assert budget.used == 20
+    buf.stop()
+    # and without blocking when not started.
+    buf = MemoryBuffer(None, False)
+    buf.set_memory_budget(budget)
+    st = time.time()
+    buf.append("data6")
+    assert time.time() - st < 2
+    assert budget.used == 25
+
+
+def test_buffer_spill_recover(def_output, tmpdir):
+    """Test spilled chunks are requeued at start."""
+    spill_dir = str(tmpdir.join('spill'))
+    buf = MemoryBuffer(def_output, False, chunk_max_record=1,
+                       buffer_max_chunk=10, buffer_max_size='10',
+                       overflow_action='spill', spill_path=spill_dir)
+    for i in range(4):
+        buf.append("data{}".format(i))
+    assert len(os.listdir(spill_dir)) == 2
+    # dies with spilled chunks.
+    for chunk in buf.chunks:
+        if not chunk.memory:
+            chunk.close()
+
+    buf = MemoryBuffer(def_output, False, chunk_max_record=1,
+                       overflow_action='spill', spill_path=spill_dir)
+    buf.start()
+    assert len(buf.chunks) == 3
+    assert buf.size == 0
+    buf.append("data4")
+    buf.stop()
+    buf.flushing(True)
+    assert def_output.bulks == ["data0", "data1", "data4"]
+    assert len(os.listdir(spill_dir)) == 0
@@ -14,6 +14,7 @@ from swak.plugin import iter_plugins, get_plugins_dir,\
 from swak.util import which_exe
 from swak.const import PLUGINDIR_PREFIX
 from swak.cli import ptrn_classnm, set_log_verbosity, _verbosity_from_log_level
+from swak import trace
 
 
 SWAK_CLI = 'swak.bat' if os.name == 'nt' else 'swak'
@@ -228,4 +229,9 @@ def test_cli_etc():
     set_log_verbosity(0)
     new_level = logger.getEffectiveLevel()
     assert new_level == 40
+    set_log_verbosity(3)
+    assert trace.TRACE
+    set_log_verbosity(0)
+    assert not trace.TRACE
+    assert logger.getEffectiveLevel() == 40
     set_log_verbosity(org_verbosity)
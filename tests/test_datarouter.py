@@ -5,7 +5,9 @@ import pytest
 
 from swak.stdplugins.filter.m_filter import Filter
 from swak.stdplugins.reform.m_reform import Reform
-from swak.plugin import DummyOutput
+from swak.plugin import DummyOutput, Modifier
+from swak.data import MultiDataStream
+from swak.datarouter import DataRouter
 
 
 @pytest.fixture()
@@ -111,3 +113,65 @@ def test_datarouter_complex(agent):
     assert len(router.match_cache['a'].modifiers) == 2
     assert len(router.match_cache['b'].modifiers) == 2
     assert len(router.match_cache['c'].modifiers) == 1
+
+
+def test_datarouter_modify_batch(agent, output):
+    """Test modifying stream by columns."""
+    class Drop(Modifier):
+        def modify(self, tag, utime, record):
+            if record['k'] != 'drop':
+                return utime + 1, record
+
+    class Upper(Modifier):
+        def modify_batch(self, tag, times, records):
+            return times, [dict(k=r['k'].upper()) for r in records]
+
+    agent.register_plugin("test", Drop())
+    agent.register_plugin("test", Upper())
+    agent.register_plugin("test", output)
+    ds = MultiDataStream([0, 1, 2], [dict(k='a'), dict(k='drop'),
+                                     dict(k='b')])
+    pline = agent.router.match("test")
+    mds = pline.modify_stream("test", ds[1:])
+    assert list(mds) == [(3, dict(k='B'))]
+    mds = pline.modify_stream("test", ds)
+    assert list(mds) == [(1, dict(k='A')), (3, dict(k='B'))]
+
+
+def test_datarouter_match_rules(agent, output):
+    """Test matching rules by trie."""
+    router = agent.router
+    mod1, mod2, mod3 = Modifier(), Modifier(), Modifier()
+    other = DummyOutput()
+    agent.register_plugin("a.**", mod1)
+    agent.register_plugin("x a.*", mod2)
+    agent.register_plugin("a.b", output)
+    agent.register_plugin("**", mod3)
+    agent.register_plugin("**", other)
+
+    pline = router.build_pipeline("a.b")
+    assert [mod1, mod2] == pline.modifiers
+    assert output is pline.output
+    pline = router.build_pipeline("a")
+    assert [mod1, mod3] == pline.modifiers
+    assert other is pline.output
+    pline = router.build_pipeline("x")
+    assert [mod2, mod3] == pline.modifiers
+
+
+def test_datarouter_match_cache():
+    """Test bounded match cache."""
+    router = DataRouter(DummyOutput(), match_cache_size=2)
+    cache = router.match_cache
+    router.match('a')
+    router.match('b')
+    router.match('a')
+    router.match('c')
+    assert ['a', 'c'] == list(cache.keys())
+    assert (1, 3, 1) == (cache.hits, cache.misses, cache.evictions)
+
+    # adding rule drops cached pipelines.
+    mod = Modifier()
+    router.add_rule('a', mod, False)
+    assert len(cache) == 0
+    assert [mod] == router.match('a').modifiers
@@ -1,4 +1,6 @@
 """This module implements data test."""
+import pickle
+
 from swak.data import MultiDataStream
 
 
@@ -11,3 +13,46 @@ def test_data_basic():
     list(ds)
     assert len([r for r in ds]) == 2
     assert len(ds) == 2
+
+
+def test_data_columnar():
+    """Test columnar data stream and its views."""
+    ds = MultiDataStream()
+    for i in range(10):
+        ds.append(float(i), dict(k=i))
+    assert len(ds) == 10
+    assert ds.times.typecode == 'd'
+
+    # iterating twice at the same time.
+    it1, it2 = iter(ds), iter(ds)
+    assert next(it1) == (0.0, dict(k=0))
+    assert next(it1) == (1.0, dict(k=1))
+    assert next(it2) == (0.0, dict(k=0))
+
+    # slicing makes a view sharing columns.
+    view = ds[2:5]
+    assert view.is_view
+    assert len(view) == 3
+    assert list(view.times) == [2.0, 3.0, 4.0]
+    assert view[0] == (2.0, dict(k=2))
+    assert view[-1] == (4.0, dict(k=4))
+    assert view[1:][0] == (3.0, dict(k=3))
+    assert view.records[0] is ds.records[2]
+    # times of a view does not lock the shared column.
+    other = MultiDataStream([0.0, 1.0], [dict(k=0), dict(k=1)])
+    times = other[1:].times
+    other.append(2.0, dict(k=2))
+    assert list(times) == [1.0]
+
+    # batches
+    batches = list(ds.batches(4))
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert batches[2][0] == (8.0, dict(k=8))
+    assert sum(len(list(b)) for b in batches) == 10
+    assert list(ds.batches(10))[0] is ds
+
+    # pickling a view copies only its part of columns.
+    view = pickle.loads(pickle.dumps(batches[2]))
+    assert not view.is_view
+    assert list(view) == [(8.0, dict(k=8)), (9.0, dict(k=9))]
+    assert list(pickle.loads(pickle.dumps(ds))) == list(ds)
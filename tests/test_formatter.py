@@ -2,9 +2,15 @@
 from __future__ import absolute_import
 
 import time
+import json
 from datetime import datetime
 
-from swak.formatter import Formatter, StdoutFormatter
+import pytest
+
+from swak import formatter
+from swak.formatter import Formatter, StdoutFormatter, JsonFormatter,\
+    MessagePackFormatter
+from swak.exception import ConfigError
 
 UTIME = 1506650186.31426
 DTIME = '2017-09-29T10:56:26.314260'
@@ -36,3 +42,79 @@ def test_formatter_basic():
     assert '20170929/01' == fmt.timestamp_to_datetime(UTIME)
     fmt = StdoutFormatter(None, 'Asia/Seoul', '%Y%m%d/%H %z')
     assert '20170929/01 +0900' == fmt.timestamp_to_datetime(UTIME)
+
+
+def test_formatter_time_cache():
+    """Test cached time stamp formatting."""
+    samples = [UTIME, UTIME + 0.5, UTIME + 1, 1506650186.0, 1506650186.9999999,
+               0.0, -1.5]
+    for tz, tfmt in [(None, None), ('UTC', None), ('Asia/Seoul', None),
+                     ('US/Eastern', '%Y%m%d %H:%M:%S %z'),
+                     (None, '%H:%M:%S.%f')]:
+        for localtime in (True, False):
+            fmt = Formatter(False, localtime, tz, tfmt)
+            ref = Formatter(False, localtime, tz, tfmt)
+            for utime in samples:
+                ref.time_cache.clear()
+                ref.tzinfo_cache.clear()
+                expect = _timestamp_to_datetime(ref, utime)
+                assert expect == fmt.timestamp_to_datetime(utime)
+            assert [fmt.timestamp_to_datetime(t) for t in samples] ==\
+                fmt.timestamps_to_datetimes(samples)
+
+    # DST transition
+    fmt = Formatter(False, False, 'US/Eastern', '%H %z')
+    assert '01 -0500' == fmt.timestamp_to_datetime(1509930000)  # 11-06 01:00
+    assert '01 -0400' == fmt.timestamp_to_datetime(1509760740)  # 11-04 01:59
+
+
+def _timestamp_to_datetime(fmt, utime):
+    """Convert time stamp without cache."""
+    converter = datetime.fromtimestamp if fmt.localtime else\
+        datetime.utcfromtimestamp
+    dtime = converter(utime)
+    if fmt.timezone is not None:
+        dtime = fmt.timezone.localize(dtime)
+    if fmt.time_format is None:
+        return dtime.isoformat()
+    return dtime.strftime(fmt.time_format).strip()
+
+
+def test_formatter_json():
+    """Test JSON formatter."""
+    fmt = JsonFormatter(False, 'UTC')
+    dtime = fmt.timestamp_to_datetime(UTIME)
+    data = fmt.format('test', dtime, {'k': 'v'})
+    assert isinstance(data, bytes) and data.endswith(b'\n')
+    assert dict(k='v', time='2017-09-29T01:56:26.314260+00:00', tag='test')\
+        == json.loads(data.decode('utf8'))
+
+    fmt = JsonFormatter(time_key=None, tag_key=None)
+    datas = fmt.format_stream('test', ['a', 'b'], [{'k': 1}, {'k': 2}])
+    assert [b'{"k":1}\n', b'{"k":2}\n'] == datas
+
+
+def test_formatter_msgpack(monkeypatch):
+    """Test MessagePack formatter."""
+    msgpack = pytest.importorskip('msgpack')
+    fmt = MessagePackFormatter(False, 'UTC')
+    assert fmt.binary
+    dtime = fmt.timestamp_to_datetime(UTIME)
+    data = fmt.format('test', dtime, {'k': 'v', 'b': b'\x00'})
+    assert isinstance(data, bytes)
+    assert dict(k='v', b=b'\x00', time='2017-09-29T01:56:26.314260+00:00',
+                tag='test') == msgpack.unpackb(data, raw=False)
+
+    # records are concatenated without separator.
+    fmt = MessagePackFormatter(time_key=None, tag_key=None)
+    datas = fmt.format_stream('test', ['a', 'b'], [{'k': 1}, {'k': 2}])
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(b''.join(datas))
+    assert [{'k': 1}, {'k': 2}] == list(unpacker)
+
+
+def test_formatter_msgpack_missing(monkeypatch):
+    """Test MessagePack formatter without msgpack package."""
+    monkeypatch.setattr(formatter, 'msgpack', None)
+    with pytest.raises(ConfigError):
+        MessagePackFormatter()
@@ -1,6 +1,6 @@
 """Test match."""
 
-from swak.match import GlobMatchPattern
+from swak.match import GlobMatchPattern, TagTrie, expand_braces
 from swak.datarouter import Rule
 
 
@@ -124,3 +124,31 @@ def test_match_multi_pattern_or():
     assert_or_match('a.b.** a.c', 'a.b.c')
     assert_or_match('a.b.** a.c', 'a.c')
     assert_or_not_match('a.b.** a.c', 'a.c.d')
+
+
+def test_match_trie():
+    """Test tag trie against glob patterns."""
+    ptrns = ['a', 'a.b', 'a*', '*a', '*a*', 'a.*', 'a.*.c', 'a.**', 'a**',
+             '**.a', '**a', 'a.{b,c}', 'a.{b,c}.**', 'a.{b.**,c}', 'a.**.c',
+             '**', 'x{', 'a.b}', 'a.\\*']
+    tags = ['a', 'b', 'ab', 'ba', 'abc', 'bac', 'a.b', 'a.c', 'a.d', 'ab.c',
+            'a.b.c', 'a.c.c', 'a.c.d', 'b.a', 'cb.a', 'c.ba', 'd.e.a',
+            'a.cd', 'x{', 'a.b}', 'a.*']
+    trie = TagTrie()
+    for idx, ptrn in enumerate(ptrns):
+        trie.add(ptrn, idx)
+    for tag in tags:
+        expect = set(idx for idx, ptrn in enumerate(ptrns)
+                     if GlobMatchPattern(ptrn).match(tag))
+        assert expect == trie.match(tag), tag
+
+    assert ['a.b', 'a.c'] == expand_braces('a.{b,c}')
+    assert ['a.b.**', 'a.c'] == expand_braces('a.{b.**,c}')
+    assert expand_braces('a.{b') is None
+    assert TagTrie().match('a') == set()
+
+
+def test_match_all():
+    """Test match all pattern."""
+    assert Rule('**', None).match('a')
+    assert Rule('**', None).match('a.b')
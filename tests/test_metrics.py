@@ -0,0 +1,52 @@
+"""This module implements metrics test."""
+from __future__ import absolute_import
+
+from swak.metrics import Histogram, PluginMetrics, MetricsRegistry
+
+
+def test_metrics_histogram():
+    """Test histogram."""
+    hist = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0, 3.0):
+        hist.observe(value)
+    snap = hist.snapshot()
+    assert snap['count'] == 5
+    assert snap['sum'] == 5.65
+    assert list(snap['buckets'].items()) == [('0.1', 2), ('1.0', 1),
+                                             ('inf', 2)]
+
+    assert Histogram().quantile(0.5) is None
+    assert hist.quantile(0.2) == 0.05
+    assert hist.quantile(0.5) == 0.55
+    assert hist.quantile(0.99) == 1.0
+    other = Histogram((0.1, 1.0))
+    other.observe(0.5)
+    hist.merge(other)
+    assert hist.count == 6
+    assert hist.counts == [2, 2, 2]
+
+
+def test_metrics_registry():
+    """Test plugin metrics and registry."""
+    metrics = PluginMetrics()
+    assert 'dropped' not in metrics.snapshot()
+    metrics.count(10, 7, 100, 70)
+    metrics.count(5, 5)
+    snap = metrics.snapshot()
+    assert snap['batches'] == 2
+    assert snap['records_in'] == 15
+    assert snap['records_out'] == 12
+    assert snap['bytes_in'] == 100
+    assert snap['bytes_out'] == 70
+    assert snap['dropped'] == 3
+    assert 'latency' not in snap
+
+    registry = MetricsRegistry()
+    assert registry.register('a', metrics.snapshot) == 'a'
+    assert registry.register('a', lambda: dict(v=1)) == 'a#2'
+    snap = registry.snapshot()
+    assert 'time' in snap
+    assert list(snap['metrics'].keys()) == ['a', 'a#2']
+    assert snap['metrics']['a#2'] == dict(v=1)
+    registry.unregister('a')
+    assert list(registry.snapshot()['metrics'].keys()) == ['a#2']
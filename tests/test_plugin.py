@@ -2,11 +2,15 @@
 from __future__ import absolute_import
 
 import os
+import time
 import types
+import threading
 
 from swak.config import get_exe_dir
 from swak.plugin import iter_plugins, import_plugins_package, TextInput,\
-    Parser, get_plugins_dir, Output
+    Parser, get_plugins_dir, Output, RecordInput, ProxyInput, ProxyQueue,\
+    DEFAULT_BATCH_MAX_LATENCY, MAX_WAIT_TIME
+from swak.data import MultiDataStream
 # from swak.util import test_logconfig
 from swak.const import PLUGINDIR_PREFIX
 from swak.memorybuffer import MemoryBuffer
@@ -88,3 +92,91 @@ def test_plugin_output():
     assert out.buffer.started
     out.stop()
     assert not out.buffer.started
+
+
+def test_plugin_input_batch():
+    """Test batching data stream of input."""
+    class FooInput(RecordInput):
+        def __init__(self, count, delay=None):
+            super(FooInput, self).__init__()
+            self.count = count
+            self.delay = delay
+
+        def generate_record(self):
+            for i in range(self.count):
+                yield dict(i=i)
+                if self.delay is not None:
+                    st = time.time()
+                    # asynchronous waiting
+                    while time.time() - st < self.delay:
+                        yield {}
+
+    # batch by max record.
+    dtinput = FooInput(25)
+    dtinput.set_batch(max_record=10)
+    # omitted limits are kept.
+    assert dtinput.batch_max_latency == DEFAULT_BATCH_MAX_LATENCY
+    assert dtinput.batch_max_size is not None
+    streams = [ds for tag, ds in dtinput.read(None)]
+    assert [len(ds) for ds in streams] == [10, 10, 5]
+    assert isinstance(streams[0], MultiDataStream)
+    assert streams[2][0][1] == dict(i=20)
+
+    # batch by max latency.
+    dtinput = FooInput(3, 0.1)
+    dtinput.set_batch(max_latency=0.05)
+    streams = [ds for tag, ds in dtinput.read(None)]
+    assert [len(ds) for ds in streams] == [1, 1, 1]
+
+    # batch by max size.
+    class BarInput(TextInput):
+        def generate_line(self):
+            for i in range(10):
+                yield 'line{}'.format(i)
+
+    dtinput = BarInput()
+    dtinput.set_batch(max_size='10')
+    streams = [ds for tag, ds in dtinput.read(None)]
+    assert [len(ds) for ds in streams] == [2, 2, 2, 2, 2]
+
+
+def test_plugin_proxy_input():
+    """Test waiting of proxy input."""
+    queue = ProxyQueue(10)
+    pinput = ProxyInput()
+    pinput.append_recv_queue("test", queue)
+    timeout = [0.2]
+    pinput.set_wait_timeout_func(lambda: timeout[0])
+    stop_event = threading.Event()
+    results = []
+    received = threading.Event()
+
+    def receive():
+        for tag, ds in pinput.read(stop_event):
+            results.append((tag, ds))
+            if tag is not None:
+                received.data = (tag, ds)
+                received.set()
+
+    trd = threading.Thread(target=receive)
+    trd.daemon = True
+    trd.start()
+    # sleeps while idle, waking up only for flushing.
+    time.sleep(0.5)
+    assert 1 <= len(results) <= 4
+    assert results[0][0] is None
+
+    # wakes up as soon as data arrives, not by the wait timeout.
+    timeout[0] = MAX_WAIT_TIME
+    time.sleep(0.3)
+    st = time.time()
+    ds = MultiDataStream([st], [dict(k=1)])
+    queue.put(ds)
+    assert received.wait(MAX_WAIT_TIME * 0.9)
+    assert received.data == ("test", ds)
+
+    # wakes up by stop
+    stop_event.set()
+    pinput.wakeup.set()
+    trd.join(5)
+    assert not trd.is_alive()
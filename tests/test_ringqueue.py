@@ -0,0 +1,132 @@
+"""This module implements ring queue test."""
+from __future__ import absolute_import
+
+import time
+import threading
+import multiprocessing
+
+import pytest
+from six.moves.queue import Empty, Full
+
+from swak import ringqueue
+from swak.data import MultiDataStream, OneDataStream
+from swak.ringqueue import RingQueue, RingNotifier, can_share_ring
+from swak.config import validate_cfg
+from swak.exception import ConfigError
+
+
+def make_stream(start, cnt):
+    """Make a data stream of counting records."""
+    return MultiDataStream([float(i) for i in range(start, start + cnt)],
+                           [dict(k=i) for i in range(start, start + cnt)])
+
+
+def test_ringqueue_basic():
+    """Test putting and getting streams through a ring."""
+    ring = RingQueue(1024)
+    assert ring.empty()
+    with pytest.raises(Empty):
+        ring.get_nowait()
+
+    ring.put(make_stream(0, 3))
+    ring.put(OneDataStream(3.0, dict(k=3)))
+    assert not ring.empty()
+    ds = ring.get_nowait()
+    assert list(ds) == [(0.0, dict(k=0)), (1.0, dict(k=1)), (2.0, dict(k=2))]
+    assert list(ring.get_nowait()) == [(3.0, dict(k=3))]
+    assert ring.empty()
+
+    # frames wrap around the ring.
+    for i in range(100):
+        ring.put(make_stream(i * 5, 5)[1:4])
+        assert list(ring.get_nowait().records) == \
+            [dict(k=k) for k in range(i * 5 + 1, i * 5 + 4)]
+
+    # full
+    with pytest.raises(Full):
+        for i in range(100):
+            ring.put(make_stream(0, 5), True, 0.01)
+    ring.close()
+
+
+def test_ringqueue_notifier():
+    """Test waiting for puts into rings sharing a notifier."""
+    notifier = RingNotifier()
+    rings = [RingQueue(1024, notifier), RingQueue(1024, notifier)]
+    count = notifier.count()
+    st = time.time()
+    notifier.wait(count, 0.1)
+    assert time.time() - st >= 0.1
+
+    # a put before the wait is not missed.
+    rings[0].put(make_stream(0, 1))
+    st = time.time()
+    notifier.wait(count, 5)
+    assert time.time() - st < 1
+
+    # woken up by a put into any of the rings.
+    count = notifier.count()
+    timer = threading.Timer(0.1, rings[1].put, (make_stream(0, 1),))
+    timer.start()
+    st = time.time()
+    notifier.wait(count, 5)
+    assert time.time() - st < 1
+    timer.join()
+    for ring in rings:
+        ring.close()
+
+
+def test_ringqueue_large():
+    """Test a stream larger than the ring."""
+    ring = RingQueue(2048)
+    ring.put(make_stream(0, 100))
+    records = []
+    while not ring.empty():
+        records += ring.get_nowait().records
+    assert records == [dict(k=i) for i in range(100)]
+
+    with pytest.raises(ValueError):
+        ring.put(OneDataStream(0.0, dict(k='x' * 4096)))
+    ring.close()
+
+
+def _put_streams(ring, cnt):
+    for i in range(cnt):
+        ring.put(make_stream(i * 10, 10))
+
+
+def test_ringqueue_process():
+    """Test a ring shared with a child process."""
+    ring = RingQueue(4096)
+    proc = multiprocessing.Process(target=_put_streams, args=(ring, 100))
+    proc.start()
+    records = []
+    deadline = time.time() + 10
+    while len(records) < 1000 and time.time() < deadline:
+        try:
+            records += ring.get_nowait().records
+        except Empty:
+            pass
+    proc.join()
+    assert records == [dict(k=i) for i in range(1000)]
+    ring.close()
+
+
+def test_ringqueue_spawn(monkeypatch):
+    """Test ring transport is rejected where workers can not share it."""
+    cfg = dict(sources=['i.counter | tag test'], matches=dict(test='o.null'),
+               transport='ring', engine='process')
+    monkeypatch.setattr(ringqueue, 'shared_memory', None)
+    monkeypatch.setattr(multiprocessing, 'get_start_method', lambda: 'fork',
+                        raising=False)
+    assert can_share_ring()
+    validate_cfg(cfg)
+
+    monkeypatch.setattr(multiprocessing, 'get_start_method', lambda: 'spawn',
+                        raising=False)
+    assert not can_share_ring()
+    with pytest.raises(ConfigError):
+        validate_cfg(cfg)
+    # threads share the ring in a process.
+    cfg['engine'] = 'thread'
+    validate_cfg(cfg)